@@ -1,3 +1,3 @@
-from app.api import auth, chat, llm_config
+from app.api import auth, chat, llm_config, metrics
 
-__all__ = ["auth", "chat", "llm_config"] 
\ No newline at end of file
+__all__ = ["auth", "chat", "llm_config", "metrics"] 
\ No newline at end of file
@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, status, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Dict, Any
 import json
 import asyncio
@@ -22,17 +22,34 @@ from app.schemas.chat import (
     ChatMessageResponse,
     SessionCreate,
     SessionUpdate,
+    SessionBatchDelete,
+    SessionBatchDeleteResult,
     ChatRequest,
     ChatResponse
 )
 from app.services.chat_service import chat_service, websocket_manager, handle_websocket_message
-from app.services.agent_service import get_agent_service, AgentType
+from app.services.agent_service import get_agent_service, AgentType, CUSTOMER_SERVICE_SYSTEM_PROMPT
+from app.services.context_builder import context_builder
+from app.services.generation_registry import generation_registry
+from app.services.stream_coalescer import sse_coalescer
+from app.services.stream_replay import stream_replay, ReplayLog, ReplayGone
 from app.core.config import settings
+from app.core.logging import logger
 from app.services.llm_config_service import llm_config_service
+from app.db.pagination import Page
 
 router = APIRouter(prefix="/chat", tags=["聊天"])
 
 
+def _page_response(response: Response, page: Page) -> List[Any]:
+    """列表保持原有格式，前后页游标放在响应头中"""
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    if page.prev_cursor:
+        response.headers["X-Prev-Cursor"] = page.prev_cursor
+    return page.items
+
+
 @router.get("/health")
 def health_check():
     """
@@ -44,7 +61,7 @@ def health_check():
 @router.post("/chat", response_model=ChatResponse)
 async def chat(
     chat_request: ChatRequest,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user)
 ):
     """
@@ -54,22 +71,28 @@ async def chat(
 
 
 @router.get("/sessions", response_model=List[SessionSchema])
-def get_sessions(
+async def get_sessions(
+    response: Response,
     skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(deps.get_db),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="分页游标，取自 X-Next-Cursor / X-Prev-Cursor 响应头，给出时忽略 skip"),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user)
 ) -> List[SessionSchema]:
     """
     获取用户的所有会话
     """
-    return chat_service.get_sessions_by_user(db, current_user.id, skip, limit)
+    try:
+        page = await chat_service.get_sessions_by_user(db, current_user.id, skip, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return _page_response(response, page)
 
 
 @router.post("/sessions", response_model=SessionSchema, status_code=status.HTTP_201_CREATED)
 async def create_session(
     session_in: ChatSessionCreate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user)
 ) -> SessionSchema:
     """
@@ -86,15 +109,15 @@ async def create_session(
 
 
 @router.get("/sessions/{session_id}", response_model=SessionSchema)
-def get_session(
+async def get_session(
     session_id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user)
 ) -> SessionSchema:
     """
     获取特定会话
     """
-    session = chat_service.get_session_by_id(db, session_id)
+    session = await chat_service.get_session_by_id(db, session_id)
     if not session or session.user_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -104,100 +127,116 @@ def get_session(
 
 
 @router.put("/sessions/{session_id}", response_model=SessionSchema)
-def update_session(
+async def update_session(
     session_id: str,
     session_in: ChatSessionUpdate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user)
 ) -> SessionSchema:
     """
     更新会话
     """
-    session = chat_service.get_session_by_id(db, session_id)
+    session = await chat_service.get_session_by_id(db, session_id)
     if not session or session.user_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="会话不存在"
         )
-    return chat_service.update_session(db, session, session_in)
+    return await chat_service.update_session(db, session, session_in.title)
 
 
 @router.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_session(
+async def delete_session(
     session_id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user)
 ) -> None:
     """
     删除会话
     """
-    session = chat_service.get_session_by_id(db, session_id)
+    session = await chat_service.get_session_by_id(db, session_id)
     if not session or session.user_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="会话不存在"
         )
-    chat_service.delete_session(db, session)
+    await chat_service.delete_session(db, session)
+
+
+@router.post("/sessions/batch-delete", response_model=SessionBatchDeleteResult)
+async def batch_delete_sessions(
+    request: SessionBatchDelete,
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: User = Depends(deps.get_current_user)
+) -> SessionBatchDeleteResult:
+    """
+    批量删除会话，消息较多的会话在后台分块清理
+    """
+    session_ids = list(dict.fromkeys(request.session_ids))
+    if len(session_ids) > settings.SESSION_BATCH_DELETE_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"一次最多删除 {settings.SESSION_BATCH_DELETE_MAX} 个会话"
+        )
+    result = await chat_service.delete_sessions(db, current_user.id, session_ids)
+    return SessionBatchDeleteResult(**result)
 
 
 @router.get("/sessions/{session_id}/messages", response_model=List[MessageSchema])
-def get_session_messages(
+async def get_session_messages(
     session_id: str,
+    response: Response,
     skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(deps.get_db),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="分页游标，取自 X-Next-Cursor / X-Prev-Cursor 响应头，给出时忽略 skip"),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user)
 ) -> List[MessageSchema]:
     """
     获取指定会话的所有消息
     """
-    session = chat_service.get_session_by_id(db, session_id)
-    if not session or session.user_id != current_user.id:
+    session = await chat_service.get_session(db, session_id, current_user.id)
+    if not session:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="会话不存在"
         )
-    return chat_service.get_messages_by_session(db, session_id, skip, limit)
+    try:
+        page = await chat_service.get_messages_by_session(db, session_id, skip, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return _page_response(response, page)
 
 
 @router.post("/sessions/{session_id}/messages", response_model=ChatMessageSchema)
 async def create_message(
     session_id: str,
     message_in: ChatMessageCreate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user)
 ):
     """
     创建新消息
     """
-    session = chat_service.get_session_by_id(db, session_id)
-    if not session or session.user_id != current_user.id:
+    session = await chat_service.get_session(db, session_id, current_user.id)
+    if not session:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="会话不存在"
         )
     
-    # 创建用户消息
-    user_message = ChatMessage(
-        id=str(uuid.uuid4()),
-        session_id=session_id,
-        content=message_in.content,
-        role="user",
-        created_at=datetime.utcnow()
-    )
-    
-    # 保存用户消息
-    await chat_service.save_message(user_message)
-    
     # 获取默认 LLM 配置
-    llm_config = llm_config_service.get_default_config(db, current_user.id)
+    llm_config = await llm_config_service.get_default_config_async(db, current_user.id)
     if not llm_config:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="未找到可用的 LLM 配置"
         )
     
-    # 发送消息并获取回复
+    # 生成期间不再使用请求的会话，先释放连接
+    await db.close()
+    
+    # 发送消息并获取回复（用户消息由 send_message 保存）
     response = await chat_service.send_message(
         session_id=session_id,
         content=message_in.content,
@@ -208,16 +247,42 @@ async def create_message(
     return response.assistant_message
 
 
+def _sse_response(log: ReplayLog, after: int = -1) -> StreamingResponse:
+    """从续传日志输出 SSE 帧，每帧带事件 ID"""
+    async def events():
+        async for event_id, data in stream_replay.follow(log, after):
+            # data 行在前，兼容按 "data:" 开头识别事件的客户端
+            yield f"data: {data}\nid: {event_id}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
 @router.post("/stream", response_class=StreamingResponse)
 async def stream_chat(
     chat_request: ChatRequest,
-    db: Session = Depends(deps.get_db),
+    coalesce_ms: Optional[int] = Query(None, ge=0, description="分片合并时间窗口（毫秒），0 表示逐块发送"),
+    coalesce_bytes: Optional[int] = Query(None, ge=1, description="分片合并字节阈值"),
+    last_event_id: Optional[str] = Header(None, description="断线重连时最后收到的事件 ID，从该事件之后续传"),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user)
 ):
     """
-    以流式方式与AI聊天
+    以流式方式与AI聊天，小分片按时间窗口或字节阈值合并为一帧发送
+
+    每帧带事件 ID。连接中断后生成继续进行，客户端带 Last-Event-ID 头重新请求即可从断点续传，
+    不会重新调用 LLM；流已过期或断点已被淘汰时返回 410。
     """
+    if last_event_id:
+        try:
+            log, after = stream_replay.resume(last_event_id, current_user.id)
+        except ReplayGone as e:
+            raise HTTPException(status_code=status.HTTP_410_GONE, detail=str(e))
+        return _sse_response(log, after)
+
     try:
+        # 获取默认 LLM 配置，本轮对话的后续步骤都使用这份配置
+        llm_config = await llm_config_service.get_default_config_async(db, current_user.id)
+        
         # 获取或创建会话
         session_id = chat_request.session_id
         user_message = chat_request.message
@@ -225,28 +290,39 @@ async def stream_chat(
         if not session_id:
             # 使用消息的前20个字符作为会话标题
             title = user_message[:20] + "..." if len(user_message) > 20 else user_message
-            db_session = chat_service.create_session(db, title=title, user_id=current_user.id)
+            db_session = await chat_service.create_session(db, title=title, user_id=current_user.id, llm_config=llm_config)
             session_id = db_session.id
         else:
             # 获取现有会话
-            db_session = chat_service.get_session_by_id(db, session_id)
-            if not db_session or db_session.user_id != current_user.id:
+            db_session = await chat_service.get_session(db, session_id, current_user.id)
+            if not db_session:
                 raise ValueError("无效的会话ID")
             
             # 更新会话时间戳
-            chat_service.update_session(db, db_session, db_session.title)
+            await chat_service.update_session(db, db_session, db_session.title)
         
         # 保存用户消息
-        chat_service.create_message(db, session_id=session_id, content=user_message, role="user")
+        await chat_service.save_message(ChatMessage(
+            id=str(uuid.uuid4()),
+            session_id=session_id,
+            content=user_message,
+            role="user",
+            created_at=datetime.utcnow()
+        ))
         
-        # 获取会话历史消息
-        messages = chat_service.get_messages_by_session(db, session_id)
+        # 只读取预算内的最新历史（包含刚写入、尚未落库的消息）
+        model, budget = context_builder.resolve_budget(llm_config, CUSTOMER_SERVICE_SYSTEM_PROMPT)
+        messages = await chat_service.get_recent_history(session_id, token_budget=budget, model=model)
         
-        # 准备消息历史
-        message_history = [
-            {"role": msg.role, "content": msg.content}
-            for msg in messages[-10:] # 最多获取最近10条消息
-        ]
+        # 按模型的 token 预算组装消息历史
+        message_history = context_builder.build(
+            messages,
+            llm_config=llm_config,
+            system_message=CUSTOMER_SERVICE_SYSTEM_PROMPT
+        )
+        
+        # 流式生成期间不再使用请求的会话，先释放连接
+        await db.close()
         
         # 确保已设置默认的LLM提供商和模型
         llm_provider = settings.DEFAULT_LLM_PROVIDER
@@ -257,13 +333,31 @@ async def stream_chat(
             llm_provider = "mock"
             print("未配置OpenAI API密钥，使用模拟模式")
         
+        # 生成与客户端连接解耦：帧写入续传日志，响应从日志读取
+        log = stream_replay.create(current_user.id, session_id)
+
+        def emit(payload: Dict[str, Any]) -> None:
+            stream_replay.append(log, json.dumps(payload))
+
         # 流式聊天处理函数
         async def generate_stream():
             # 发送会话ID
-            yield f"data: {json.dumps({'session_id': session_id})}\n\n"
+            emit({'session_id': session_id})
             
-            # 存储完整回复以便后续保存
-            full_response = ""
+            generation = None
+
+            async def save_reply(content: str, status: str) -> None:
+                # 生成结束、被停止或长时间无人重连时保存（部分）回复；
+                # 生成失败时由下面回退的标准聊天服务保存回复，这里不再保存
+                if status == "failed":
+                    return
+                await chat_service.save_message(ChatMessage(
+                    id=str(uuid.uuid4()),
+                    session_id=session_id,
+                    content=content,
+                    role="assistant",
+                    created_at=datetime.utcnow()
+                ))
             
             # 尝试使用智能体服务
             try:
@@ -274,44 +368,50 @@ async def stream_chat(
                     model_key=llm_model
                 )
                 
-                # 流式生成回复
-                async for chunk in agent_service.chat_stream(
-                    message_history,
-                    user_id=current_user.id  # 添加user_id参数
-                ):
-                    full_response += chunk
-                    yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-                    await asyncio.sleep(0.01)  # 添加小延迟确保前端接收流畅
+                # 流式生成回复，生成任务登记后可被 /chat/stop 取消；客户端断开超过宽限期无人重连时取消
+                generation = generation_registry.start(
+                    current_user.id,
+                    session_id,
+                    agent_service.chat_stream(message_history, user_id=current_user.id, llm_config=llm_config),
+                    on_finish=save_reply,
+                    llm_config=llm_config
+                )
+                log.on_abandon = lambda: generation_registry.cancel_generation(generation, "disconnect")
+                async for chunk in sse_coalescer.coalesce(generation.stream(), coalesce_ms, coalesce_bytes):
+                    emit({'chunk': chunk})
             except Exception as e:
                 # 智能体服务失败，回退到标准聊天服务
                 error_msg = f"智能体服务失败，正在使用标准服务: {str(e)}"
                 print(f"[智能体错误] {error_msg}")
                 
-                # 使用ChatRequest对象
+                # 生产任务与请求解耦，不再使用请求的数据库会话；会话和用户消息已在上面处理，
+                # 回复由 send_message 保存
                 try:
-                    response = await chat_service.chat_with_ai(db, current_user.id, chat_request)
-                    full_response = response.message
-                    # 模拟流式输出
-                    words = full_response.split()
-                    for i, word in enumerate(words):
-                        yield f"data: {json.dumps({'chunk': word + ' '})}\n\n"
-                        if i < len(words) - 1:  # 不是最后一个词
-                            await asyncio.sleep(0.05)  # 添加延迟模拟打字效果
+                    response = await chat_service.send_message(
+                        session_id=session_id,
+                        content=user_message,
+                        user_id=str(current_user.id),
+                        llm_config=llm_config,
+                        save_user_message=False
+                    )
+                    # 回复已完整生成，一次发送
+                    emit({'chunk': response.assistant_message.content})
                 except Exception as inner_e:
                     error_msg = f"标准聊天服务也失败了: {str(inner_e)}"
-                    full_response = error_msg
-                    yield f"data: {json.dumps({'error': error_msg})}\n\n"
-            
-            # 保存助手回复（如果尚未保存）
-            chat_service.create_message(db, session_id=session_id, content=full_response, role="assistant")
-            
-            # 发送结束标记
-            yield f"data: {json.dumps({'done': True})}\n\n"
-        
-        return StreamingResponse(
-            generate_stream(),
-            media_type="text/event-stream"
-        )
+                    emit({'error': error_msg})
+                    # 保存错误说明作为回复
+                    await save_reply(error_msg, "fallback")
+            finally:
+                if generation is not None and not generation.done:
+                    # 进程关闭等情况下取消上游生成
+                    generation_registry.cancel_generation(generation, "shutdown")
+                # 发送结束标记
+                cancelled = generation is not None and generation.status == "cancelled"
+                emit({'done': True, 'cancelled': cancelled})
+                stream_replay.finish(log)
+
+        log.producer = asyncio.create_task(generate_stream())
+        return _sse_response(log)
         
     except ValueError as e:
         raise HTTPException(
@@ -358,38 +458,87 @@ async def stop_generation(
     current_user: User = Depends(deps.get_current_user)
 ):
     """
-    停止消息生成 (目前仅为占位API，实际停止功能需要前端处理)
+    停止当前用户在该会话中进行中的消息生成，已生成的部分回复会被保存
     """
-    # 验证会话存在且属于当前用户
-    return {"success": True, "message": "已发送停止信号"}
+    # 只会取消当前用户自己登记的生成
+    cancelled = generation_registry.cancel(current_user.id, session_id, reason="stop")
+    if not cancelled:
+        return {"success": False, "message": "该会话没有进行中的生成", "cancelled": 0}
+    return {"success": True, "message": "已停止生成", "cancelled": cancelled}
+
+
+def _frame_type(data: str) -> Optional[str]:
+    """客户端控制帧（stop、pong）的类型，普通消息返回 None"""
+    try:
+        message = json.loads(data)
+    except ValueError:
+        return None
+    return message.get("type") if isinstance(message, dict) else None
 
 
 @router.websocket("/ws/{session_id}")
 async def websocket_endpoint(
     websocket: WebSocket,
     session_id: str,
-    db: Session = Depends(deps.get_db),
-    current_user: User = Depends(deps.get_current_user)
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: User = Depends(deps.get_current_user_ws)
 ):
     """
     WebSocket 端点，用于实时聊天
     """
     try:
         # 验证会话
-        session = chat_service.get_session_by_id(db, session_id)
-        if not session or session.user_id != current_user.id:
+        session = await chat_service.get_session(db, session_id, current_user.id)
+        if not session:
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             return
+        # 连接存续期间不占用数据库连接，处理消息时按需重新获取
+        await db.close()
 
-        # 连接 WebSocket
-        await websocket_manager.connect(websocket, session_id)
+        # 连接 WebSocket，超过连接数上限时已被关闭
+        if not await websocket_manager.connect(websocket, session_id, current_user.id):
+            return
         
+        # 消息按到达顺序逐条处理；处理期间继续接收，以便响应停止指令和连接关闭
+        pending: "asyncio.Queue[str]" = asyncio.Queue(maxsize=settings.WS_MAX_PENDING_MESSAGES)
+
+        async def process_messages():
+            while True:
+                data = await pending.get()
+                try:
+                    await handle_websocket_message(db, websocket, session_id, data, current_user.id)
+                except Exception as e:
+                    # 单条消息处理失败不影响后续消息
+                    logger.error(f"[WebSocket] 处理消息失败: session={session_id}, 错误={str(e)}")
+
+        worker = asyncio.create_task(process_messages())
         try:
             while True:
-                data = await websocket.receive_text()
-                await handle_websocket_message(db, websocket, session_id, data, current_user.id)
+                data = await websocket_manager.receive(websocket, session_id)
+                if data is None:
+                    # 服务端已关闭连接（空闲、超过最长存活时间等）
+                    break
+                frame_type = _frame_type(data)
+                if frame_type == "stop":
+                    generation_registry.cancel(current_user.id, session_id, reason="stop")
+                    continue
+                if frame_type == "pong":
+                    # 心跳回复只用于刷新活跃时间
+                    continue
+                try:
+                    pending.put_nowait(data)
+                except asyncio.QueueFull:
+                    # 积压的消息过多，拒绝而不是无限排队
+                    await websocket_manager.send(websocket, session_id, json.dumps({
+                        "type": "error",
+                        "data": "消息发送过于频繁，请等待当前回复完成"
+                    }, ensure_ascii=False))
         except WebSocketDisconnect:
-            websocket_manager.disconnect(websocket, session_id)
+            pass
+        finally:
+            # 取消处理任务会连带取消其进行中的生成
+            worker.cancel()
+            await websocket_manager.disconnect(websocket, session_id)
     except Exception as e:
         if websocket.client_state.CONNECTED:
             await websocket.close(code=status.WS_1011_INTERNAL_ERROR) 
\ No newline at end of file
@@ -1,38 +1,49 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, WebSocket, WebSocketException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
 from typing import Optional
 
-from app.db.deps import get_db
+from app.db.deps import get_db, get_async_db
+from app.db.session import AsyncSessionLocal
 from app.models.user import User
+from app.schemas.user import Principal
 from app.services import auth_service
+from app.services.principal_cache import principal_cache
 from app.core.config import settings
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
 
-def get_current_user(
-    db: Session = Depends(get_db),
+async def get_current_user(
     token: str = Depends(oauth2_scheme)
-) -> User:
+) -> Principal:
     """
     获取当前登录用户
+
+    已验证过的令牌直接从认证缓存返回用户快照，不解码令牌也不查询数据库
     """
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="无效的认证凭据",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
-    # 验证令牌
-    token_data = auth_service.verify_token(token)
-    if not token_data:
-        raise credentials_exception
-    
-    # 获取用户信息
-    user = auth_service.get_user_by_email(db, email=token_data.email)
-    if not user:
-        raise credentials_exception
+    user = principal_cache.get(token)
+    if user is None:
+        credentials_exception = HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="无效的认证凭据",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+        
+        # 验证令牌
+        payload = auth_service.decode_token(token)
+        if not payload:
+            raise credentials_exception
+        
+        # 获取用户信息
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(User).where(User.email == payload["sub"]))
+            db_user = result.scalars().first()
+        if not db_user:
+            raise credentials_exception
+        
+        user = Principal.model_validate(db_user)
+        principal_cache.set(token, user, payload.get("exp"))
     
     # 检查用户是否活跃
     if not user.is_active:
@@ -44,9 +55,33 @@ def get_current_user(
     return user
 
 
-def get_current_active_superuser(
-    current_user: User = Depends(get_current_user)
-) -> User:
+async def get_current_user_ws(
+    websocket: WebSocket
+) -> Principal:
+    """
+    获取 WebSocket 连接的当前用户
+
+    浏览器无法为 WebSocket 设置请求头，因此令牌可通过 token 查询参数传递，
+    也支持 Authorization: Bearer 请求头
+    """
+    token = websocket.query_params.get("token")
+    if not token:
+        authorization = websocket.headers.get("authorization", "")
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() != "bearer":
+            token = None
+    if not token:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+    
+    try:
+        return await get_current_user(token=token)
+    except HTTPException:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+
+
+async def get_current_active_superuser(
+    current_user: Principal = Depends(get_current_user)
+) -> Principal:
     """
     获取当前超级管理员用户
     """
@@ -0,0 +1,197 @@
+from fastapi import APIRouter, Depends, Query
+from typing import Dict, Any, Optional
+
+from app.api import deps
+from app.models.user import User
+from app.services.llm_client_pool import llm_client_registry
+from app.services.llm_cache import llm_response_cache
+from app.services.llm_singleflight import llm_singleflight
+from app.services.llm_rate_limiter import llm_rate_limiter
+from app.services.llm_router import llm_router
+from app.services.generation_registry import generation_registry
+from app.services.stream_coalescer import sse_coalescer
+from app.services.loop_monitor import loop_monitor
+from app.services.message_writer import message_writer
+from app.services.history_cache import history_cache
+from app.services.llm_config_service import llm_config_service
+from app.services.principal_cache import principal_cache
+from app.db.engine import engine_monitors
+from app.services.session_purger import session_purger
+from app.services.session_archiver import session_archiver
+from app.services.websocket_manager import websocket_manager
+from app.services.stream_replay import stream_replay
+
+router = APIRouter(prefix="/metrics", tags=["运行指标"])
+
+
+@router.get("/llm-clients", response_model=Dict[str, Any])
+def get_llm_client_stats(
+    current_user: User = Depends(deps.get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    获取LLM上游连接池统计信息
+    """
+    return llm_client_registry.stats()
+
+
+@router.get("/llm-cache", response_model=Dict[str, Any])
+def get_llm_cache_stats(
+    current_user: User = Depends(deps.get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    获取LLM响应缓存命中率等统计信息
+    """
+    return llm_response_cache.stats()
+
+
+@router.get("/llm-singleflight", response_model=Dict[str, Any])
+def get_llm_singleflight_stats(
+    current_user: User = Depends(deps.get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    获取相同请求合并的统计信息
+    """
+    return llm_singleflight.stats()
+
+
+@router.get("/llm-limits", response_model=Dict[str, Any])
+def get_llm_limit_stats(
+    current_user: User = Depends(deps.get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    获取各上游的并发、排队深度和等待时间统计
+    """
+    return llm_rate_limiter.stats()
+
+
+@router.get("/llm-router", response_model=Dict[str, Any])
+def get_llm_router_stats(
+    current_user: User = Depends(deps.get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    获取各后端的TTFT、错误率和对冲统计
+    """
+    return llm_router.stats()
+
+
+@router.get("/generations", response_model=Dict[str, Any])
+def get_generation_stats(
+    current_user: User = Depends(deps.get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    获取进行中的生成数量、取消延迟和节省的token统计
+    """
+    return generation_registry.stats()
+
+
+@router.get("/sse", response_model=Dict[str, Any])
+def get_sse_stats(
+    current_user: User = Depends(deps.get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    获取SSE分片合并统计（输入分片数、输出帧数、平均每帧分片数）
+    """
+    return sse_coalescer.stats()
+
+
+@router.get("/event-loop", response_model=Dict[str, Any])
+def get_event_loop_stats(
+    seconds: Optional[float] = Query(None, gt=0, description="只统计最近若干秒的样本"),
+    current_user: User = Depends(deps.get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    获取事件循环延迟分布
+    """
+    return loop_monitor.stats(seconds)
+
+
+@router.get("/message-writer", response_model=Dict[str, Any])
+def get_message_writer_stats(
+    current_user: User = Depends(deps.get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    获取消息写入队列的积压、批大小和刷新耗时统计
+    """
+    return message_writer.stats()
+
+
+@router.get("/history-cache", response_model=Dict[str, Any])
+def get_history_cache_stats(
+    current_user: User = Depends(deps.get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    获取会话历史缓存的命中率、内存占用和淘汰统计
+    """
+    return history_cache.stats()
+
+
+@router.get("/llm-config-cache", response_model=Dict[str, Any])
+def get_llm_config_cache_stats(
+    current_user: User = Depends(deps.get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    获取默认LLM配置缓存的命中率和失效统计
+    """
+    return llm_config_service.cache_stats()
+
+
+@router.get("/auth-cache", response_model=Dict[str, Any])
+def get_auth_cache_stats(
+    current_user: User = Depends(deps.get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    获取认证缓存的命中率和失效统计
+    """
+    return principal_cache.stats()
+
+
+@router.get("/db", response_model=Dict[str, Any])
+def get_db_stats(
+    current_user: User = Depends(deps.get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    获取各数据库引擎的连接池占用、取连接等待时间和查询耗时统计
+    """
+    return {name: monitor.stats() for name, monitor in engine_monitors.items()}
+
+
+@router.get("/session-purger", response_model=Dict[str, Any])
+def get_session_purger_stats(
+    current_user: User = Depends(deps.get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    获取后台会话清理的队列和进度统计
+    """
+    return session_purger.stats()
+
+
+@router.get("/session-archiver", response_model=Dict[str, Any])
+def get_session_archiver_stats(
+    current_user: User = Depends(deps.get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    获取会话归档和恢复的数量、字节数和压缩率统计
+    """
+    return session_archiver.stats()
+
+
+@router.get("/websocket", response_model=Dict[str, Any])
+def get_websocket_stats(
+    limit: int = Query(100, ge=0, le=1000, description="最多列出的连接数，按队列深度排序"),
+    current_user: User = Depends(deps.get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    获取 WebSocket 连接数、上限和内存估算，心跳、拒绝与服务端关闭统计，
+    各连接的发送队列深度和发送延迟，以及跨进程广播的发布、接收、过滤统计
+    """
+    return websocket_manager.stats(limit)
+
+
+@router.get("/sse-replay", response_model=Dict[str, Any])
+def get_sse_replay_stats(
+    current_user: User = Depends(deps.get_current_active_superuser)
+) -> Dict[str, Any]:
+    """
+    获取 SSE 续传缓冲的占用、续传命中和淘汰统计
+    """
+    return stream_replay.stats()
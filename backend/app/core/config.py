@@ -49,6 +49,16 @@ class Settings(BaseSettings):
             path=values.get('MYSQL_DB') or '',
         ))
     
+    # 异步 MySQL 驱动：aiomysql 或 asyncmy
+    ASYNC_MYSQL_DRIVER: str = os.getenv("ASYNC_MYSQL_DRIVER", "aiomysql")
+    
+    # 数据库连接池（同步、异步引擎各一个连接池，分别使用以下参数）和慢查询阈值（秒）
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+    DB_SLOW_QUERY_SECONDS: float = float(os.getenv("DB_SLOW_QUERY_SECONDS", "0.5"))
+    
     # Milvus 配置
     MILVUS_HOST: str = os.getenv("MILVUS_HOST", "localhost")
     MILVUS_PORT: int = int(os.getenv("MILVUS_PORT", "19530"))
@@ -58,6 +68,7 @@ class Settings(BaseSettings):
     MINIO_ACCESS_KEY: str = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
     MINIO_SECRET_KEY: str = os.getenv("MINIO_SECRET_KEY", "minioadmin")
     MINIO_BUCKET_NAME: str = os.getenv("MINIO_BUCKET_NAME", "agent-platform")
+    MINIO_SECURE: bool = os.getenv("MINIO_SECURE", "false").lower() == "true"
     
     # JWT 配置
     SECRET_KEY: str = secrets.token_urlsafe(32)
@@ -74,6 +85,137 @@ class Settings(BaseSettings):
     # Ollama 配置
     OLLAMA_HOST: str = os.getenv("OLLAMA_HOST", "http://localhost:11434")
     
+    # LLM 上游连接池配置
+    LLM_HTTP_MAX_CONNECTIONS: int = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+    LLM_HTTP_MAX_KEEPALIVE: int = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+    LLM_HTTP_CONNECT_TIMEOUT: float = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "10"))
+    LLM_HTTP_READ_TIMEOUT: float = float(os.getenv("LLM_HTTP_READ_TIMEOUT", "120"))
+    LLM_HTTP2_ENABLED: bool = os.getenv("LLM_HTTP2_ENABLED", "true").lower() == "true"
+    
+    # LLM 响应缓存配置
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+    LLM_CACHE_TTL: float = float(os.getenv("LLM_CACHE_TTL", "3600"))
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+    LLM_CACHE_MAX_BYTES: int = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    LLM_CACHE_HISTORY_WINDOW: int = int(os.getenv("LLM_CACHE_HISTORY_WINDOW", "3"))
+    
+    # 相同并发请求合并
+    LLM_SINGLEFLIGHT_ENABLED: bool = os.getenv("LLM_SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+    
+    # 上游并发与配额限制（LLM_RATE_LIMITS 为 JSON，按 provider 或 provider:model 覆盖默认值）
+    LLM_DEFAULT_CONCURRENCY: int = int(os.getenv("LLM_DEFAULT_CONCURRENCY", "32"))
+    LLM_DEFAULT_RPM: int = int(os.getenv("LLM_DEFAULT_RPM", "0"))  # 0 表示不限制
+    LLM_DEFAULT_TPM: int = int(os.getenv("LLM_DEFAULT_TPM", "0"))  # 0 表示不限制
+    LLM_QUEUE_MAX_DEPTH: int = int(os.getenv("LLM_QUEUE_MAX_DEPTH", "200"))
+    LLM_QUEUE_TIMEOUT: float = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+    LLM_RATE_LIMITS: str = os.getenv("LLM_RATE_LIMITS", '{"ollama": {"concurrency": 2}}')
+    
+    # 延迟感知路由与对冲请求（LLM_ROUTER_GROUPS 为 JSON，如 {"chat": ["openai:default", "deepseek:default"]}）
+    # 用户的LLM配置按 "提供商:模型名" 匹配组成员，组内其他成员使用服务端默认模型配置
+    LLM_ROUTER_GROUPS: str = os.getenv("LLM_ROUTER_GROUPS", "{}")
+    LLM_ROUTER_WINDOW: int = int(os.getenv("LLM_ROUTER_WINDOW", "200"))
+    LLM_ROUTER_FAILURE_THRESHOLD: int = int(os.getenv("LLM_ROUTER_FAILURE_THRESHOLD", "5"))
+    LLM_ROUTER_COOLDOWN: float = float(os.getenv("LLM_ROUTER_COOLDOWN", "30"))
+    LLM_HEDGE_ENABLED: bool = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_P95_FACTOR: float = float(os.getenv("LLM_HEDGE_P95_FACTOR", "1.0"))
+    LLM_HEDGE_DEFAULT_DELAY: float = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "2.0"))
+    LLM_HEDGE_MIN_DELAY: float = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.2"))
+    LLM_HEDGE_MAX_DELAY: float = float(os.getenv("LLM_HEDGE_MAX_DELAY", "10"))
+    
+    # 模拟提供商与录制重放（LLM_MOCK_PROFILE 为 query 形式，如 ttft_mean=0.3&tokens_per_second=40）
+    LLM_MOCK_PROFILE: str = os.getenv("LLM_MOCK_PROFILE", "")
+    LLM_RECORD_ENABLED: bool = os.getenv("LLM_RECORD_ENABLED", "false").lower() == "true"
+    LLM_RECORD_FILE: str = os.getenv("LLM_RECORD_FILE", "")
+    
+    # 消息写入：sync（默认）每条提交后才返回；batched 写入内存队列后按间隔/批大小批量提交，
+    # 消息在提交前即被确认，进程崩溃会丢失尚未刷新的消息，需按部署显式开启
+    MESSAGE_WRITE_MODE: str = os.getenv("MESSAGE_WRITE_MODE", "sync")
+    MESSAGE_WRITE_BATCH_SIZE: int = int(os.getenv("MESSAGE_WRITE_BATCH_SIZE", "100"))
+    MESSAGE_WRITE_FLUSH_INTERVAL: float = float(os.getenv("MESSAGE_WRITE_FLUSH_INTERVAL", "0.05"))
+    MESSAGE_WRITE_MAX_PENDING: int = int(os.getenv("MESSAGE_WRITE_MAX_PENDING", "5000"))
+    
+    # SSE 分片合并配置（客户端可通过 coalesce_ms / coalesce_bytes 参数覆盖）
+    SSE_COALESCE_WINDOW_MS: int = int(os.getenv("SSE_COALESCE_WINDOW_MS", "30"))
+    SSE_COALESCE_MAX_WINDOW_MS: int = int(os.getenv("SSE_COALESCE_MAX_WINDOW_MS", "50"))
+    SSE_COALESCE_MAX_BYTES: int = int(os.getenv("SSE_COALESCE_MAX_BYTES", "1024"))
+    
+    # 事件循环延迟监控（间隔为 0 时关闭）
+    LOOP_MONITOR_INTERVAL: float = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.05"))
+    LOOP_MONITOR_HISTORY: int = int(os.getenv("LOOP_MONITOR_HISTORY", "6000"))
+    LOOP_LAG_WARN_SECONDS: float = float(os.getenv("LOOP_LAG_WARN_SECONDS", "0.2"))
+    
+    # 聊天历史读取：最多读取的最新消息条数和每次查询的条数
+    CHAT_HISTORY_MAX_MESSAGES: int = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "200"))
+    CHAT_HISTORY_PAGE_SIZE: int = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "20"))
+    
+    # 会话历史缓存：每个会话缓存的消息条数、总内存上限（字节，0 为禁用）和空闲过期时间（秒）
+    HISTORY_CACHE_MAX_MESSAGES: int = int(os.getenv("HISTORY_CACHE_MAX_MESSAGES", "100"))
+    HISTORY_CACHE_MAX_BYTES: int = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    HISTORY_CACHE_IDLE_TTL: float = float(os.getenv("HISTORY_CACHE_IDLE_TTL", "1800"))
+    
+    # 默认LLM配置缓存：过期时间（秒，0 为禁用）和最多缓存的用户数
+    LLM_CONFIG_CACHE_TTL: float = float(os.getenv("LLM_CONFIG_CACHE_TTL", "300"))
+    LLM_CONFIG_CACHE_MAX_USERS: int = int(os.getenv("LLM_CONFIG_CACHE_MAX_USERS", "10000"))
+    
+    # 认证缓存：已验证令牌的缓存时间（秒，0 为禁用）和最多缓存的令牌数
+    AUTH_CACHE_TTL: float = float(os.getenv("AUTH_CACHE_TTL", "60"))
+    AUTH_CACHE_MAX_ENTRIES: int = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+    
+    # 会话删除：消息数超过阈值的会话改为后台分块清理，每块删除的消息数、块之间的间隔和清理失败后重试的延迟（秒）
+    SESSION_PURGE_SYNC_MAX_MESSAGES: int = int(os.getenv("SESSION_PURGE_SYNC_MAX_MESSAGES", "1000"))
+    SESSION_PURGE_CHUNK_SIZE: int = int(os.getenv("SESSION_PURGE_CHUNK_SIZE", "1000"))
+    SESSION_PURGE_PAUSE: float = float(os.getenv("SESSION_PURGE_PAUSE", "0.01"))
+    SESSION_PURGE_RETRY_DELAY: float = float(os.getenv("SESSION_PURGE_RETRY_DELAY", "60"))
+    SESSION_BATCH_DELETE_MAX: int = int(os.getenv("SESSION_BATCH_DELETE_MAX", "100"))
+    
+    # 会话归档：最后一条消息早于 ARCHIVE_IDLE_DAYS 天的会话转入对象存储（minio 或 filesystem），
+    # 每次检查间隔（秒）、每批归档的会话数、每段对象包含的消息数和 zstd 压缩级别
+    ARCHIVE_ENABLED: bool = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+    ARCHIVE_STORE: str = os.getenv("ARCHIVE_STORE", "minio")
+    ARCHIVE_FS_ROOT: str = os.getenv("ARCHIVE_FS_ROOT", "./data/archive")
+    ARCHIVE_IDLE_DAYS: float = float(os.getenv("ARCHIVE_IDLE_DAYS", "30"))
+    ARCHIVE_INTERVAL: float = float(os.getenv("ARCHIVE_INTERVAL", "3600"))
+    ARCHIVE_BATCH_SESSIONS: int = int(os.getenv("ARCHIVE_BATCH_SESSIONS", "50"))
+    ARCHIVE_SEGMENT_MESSAGES: int = int(os.getenv("ARCHIVE_SEGMENT_MESSAGES", "1000"))
+    ARCHIVE_ZSTD_LEVEL: int = int(os.getenv("ARCHIVE_ZSTD_LEVEL", "3"))
+    
+    # WebSocket 跨进程广播：发布/订阅后端（memory 或 redis）、频道前缀，
+    # 每个会话主题的消息在批次窗口（毫秒）内合并发布，每批最多的消息数
+    PUBSUB_BACKEND: str = os.getenv("PUBSUB_BACKEND", "memory")
+    PUBSUB_REDIS_URL: str = os.getenv("PUBSUB_REDIS_URL", "redis://localhost:6379/0")
+    PUBSUB_CHANNEL_PREFIX: str = os.getenv("PUBSUB_CHANNEL_PREFIX", "agent-platform:ws:")
+    PUBSUB_BATCH_WINDOW_MS: int = int(os.getenv("PUBSUB_BATCH_WINDOW_MS", "5"))
+    PUBSUB_BATCH_MAX_MESSAGES: int = int(os.getenv("PUBSUB_BATCH_MAX_MESSAGES", "64"))
+    
+    # WebSocket 发送队列：每个连接最多排队的消息数、队列满时的溢出策略
+    # （drop_oldest、coalesce 或 disconnect）和单条消息的发送超时（秒）
+    WS_SEND_QUEUE_MAX: int = int(os.getenv("WS_SEND_QUEUE_MAX", "256"))
+    WS_OVERFLOW_POLICY: str = os.getenv("WS_OVERFLOW_POLICY", "coalesce")
+    WS_SEND_TIMEOUT: float = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+    
+    # WebSocket 连接生命周期：心跳间隔、空闲超时和最长存活时间（秒，0 表示不限制），
+    # 本进程的连接总数和每个用户的连接数上限（0 表示不限制），以及用于内存估算的每连接固定开销（字节）
+    WS_HEARTBEAT_INTERVAL: float = float(os.getenv("WS_HEARTBEAT_INTERVAL", "30"))
+    WS_IDLE_TIMEOUT: float = float(os.getenv("WS_IDLE_TIMEOUT", "300"))
+    WS_MAX_LIFETIME: float = float(os.getenv("WS_MAX_LIFETIME", "14400"))
+    WS_MAX_CONNECTIONS: int = int(os.getenv("WS_MAX_CONNECTIONS", "10000"))
+    WS_MAX_CONNECTIONS_PER_USER: int = int(os.getenv("WS_MAX_CONNECTIONS_PER_USER", "20"))
+    WS_CONNECTION_OVERHEAD_BYTES: int = int(os.getenv("WS_CONNECTION_OVERHEAD_BYTES", str(96 * 1024)))
+    
+    # WebSocket 每个连接排队等待处理的客户端消息上限，超出时回复 error 帧并丢弃该消息
+    WS_MAX_PENDING_MESSAGES: int = int(os.getenv("WS_MAX_PENDING_MESSAGES", "4"))
+    
+    # SSE 续传：全部流和单个流缓冲的字节上限、流结束后保留的时间（秒），
+    # 以及客户端断开后等待重连的宽限期（秒），超过后取消生成
+    SSE_REPLAY_MAX_BYTES: int = int(os.getenv("SSE_REPLAY_MAX_BYTES", str(64 * 1024 * 1024)))
+    SSE_REPLAY_STREAM_MAX_BYTES: int = int(os.getenv("SSE_REPLAY_STREAM_MAX_BYTES", str(1024 * 1024)))
+    SSE_REPLAY_TTL: float = float(os.getenv("SSE_REPLAY_TTL", "300"))
+    SSE_RESUME_GRACE: float = float(os.getenv("SSE_RESUME_GRACE", "15"))
+    
+    # 上下文组装配置
+    CONTEXT_TOKEN_CACHE_SIZE: int = int(os.getenv("CONTEXT_TOKEN_CACHE_SIZE", "10000"))
+    
     # 智能体配置
     DEFAULT_LLM_PROVIDER: str = os.getenv("DEFAULT_LLM_PROVIDER", "openai")
     DEFAULT_LLM_MODEL: str = os.getenv("DEFAULT_LLM_MODEL", "default")
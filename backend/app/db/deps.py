@@ -1,5 +1,6 @@
-from typing import Generator
-from app.db.session import SessionLocal
+from typing import Generator, AsyncGenerator
+from app.db.session import SessionLocal, AsyncSessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 def get_db() -> Generator[Session, None, None]:
@@ -8,4 +9,9 @@ def get_db() -> Generator[Session, None, None]:
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """FastAPI dependency that provides an async database session."""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,209 @@
+from typing import List, Dict, Any, Optional, Type
+from collections import deque
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+from app.core.config import settings
+from app.core.logging import logger
+
+
+# 耗时直方图的桶上界（毫秒），最后一个桶收纳超出部分
+HISTOGRAM_BUCKETS_MS: List[float] = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+
+class LatencyHistogram:
+    """固定分桶的耗时直方图，另保留最近的样本用于计算分位数"""
+
+    def __init__(self, history: int = 1000):
+        self.counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.total = 0
+        self.max = 0.0
+        self.samples: "deque[float]" = deque(maxlen=history)
+
+    def record(self, seconds: float) -> None:
+        ms = seconds * 1000
+        index = len(HISTOGRAM_BUCKETS_MS)
+        for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+            if ms <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.total += 1
+        self.max = max(self.max, ms)
+        self.samples.append(ms)
+
+    def stats(self) -> Dict[str, Any]:
+        samples = sorted(self.samples)
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 2)
+
+        labels = [f"le_{bound:g}ms" for bound in HISTOGRAM_BUCKETS_MS] + ["gt_5000ms"]
+        return {
+            "count": self.total,
+            "ms_p50": percentile(0.5),
+            "ms_p95": percentile(0.95),
+            "ms_p99": percentile(0.99),
+            "ms_max": round(self.max, 2),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class EngineMonitor:
+    """
+    数据库引擎监控
+
+    通过连接池子类统计取连接的等待时间（含新建连接），通过 SQLAlchemy 事件统计连接的
+    取出/归还、新建和失效次数以及每条 SQL 的耗时，超过 slow_query_seconds 的查询记为慢查询。
+    连接池被耗尽时表现为等待时间升高和取连接超时。
+    """
+
+    def __init__(self, name: str, slow_query_seconds: float):
+        self.name = name
+        self.slow_query_seconds = slow_query_seconds
+        self.engine: Optional[Engine] = None
+        self.checkout_wait = LatencyHistogram()
+        self.query_time = LatencyHistogram()
+        self.checkout_timeouts = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.in_use_peak = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.slow_queries = 0
+        self.query_errors = 0
+
+    def pool_class(self, base: Type[QueuePool]) -> Type[QueuePool]:
+        """
+        返回记录取连接等待时间的连接池类
+
+        监控对象绑定在类上，引擎 dispose 重建连接池后仍然有效。
+        """
+        monitor = self
+
+        class InstrumentedPool(base):
+            def _do_get(self):
+                started = time.monotonic()
+                try:
+                    return super()._do_get()
+                except PoolTimeoutError:
+                    monitor.checkout_timeouts += 1
+                    logger.warning(f"[EngineMonitor] {monitor.name} 连接池耗尽，取连接超时")
+                    raise
+                finally:
+                    monitor.checkout_wait.record(time.monotonic() - started)
+
+        InstrumentedPool.__name__ = f"Instrumented{base.__name__}"
+        return InstrumentedPool
+
+    def attach(self, engine: Engine) -> None:
+        """在同步引擎（异步引擎传 sync_engine）上注册连接池和执行事件"""
+
+        @event.listens_for(engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            self.connects += 1
+
+        @event.listens_for(engine, "checkout")
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            self.checkouts += 1
+            self.in_use_peak = max(self.in_use_peak, self.checkouts - self.checkins)
+
+        @event.listens_for(engine, "checkin")
+        def on_checkin(dbapi_connection, connection_record):
+            self.checkins += 1
+
+        @event.listens_for(engine, "invalidate")
+        def on_invalidate(dbapi_connection, connection_record, exception):
+            self.invalidations += 1
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("query_started", []).append(time.monotonic())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_execute(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info["query_started"].pop()
+            elapsed = time.monotonic() - started
+            self.query_time.record(elapsed)
+            if elapsed >= self.slow_query_seconds:
+                self.slow_queries += 1
+                logger.warning(f"[EngineMonitor] {self.name} 慢查询 {elapsed * 1000:.1f}ms: {' '.join(statement.split())[:500]}")
+
+        @event.listens_for(engine, "handle_error")
+        def on_error(context):
+            self.query_errors += 1
+            started = context.connection.info.get("query_started") if context.connection is not None else None
+            if started:
+                started.pop()
+
+        self.engine = engine
+
+    def stats(self) -> Dict[str, Any]:
+        # dispose 会重建连接池，每次从引擎取当前的连接池
+        pool = self.engine.pool if self.engine is not None else None
+        gauges: Dict[str, Any] = {"pool_class": type(pool).__name__ if pool else None}
+        if isinstance(pool, QueuePool):
+            gauges.update({
+                "size": pool.size(),
+                "in_use": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": pool.overflow(),
+                "max_overflow": pool._max_overflow,
+                "timeout_seconds": pool.timeout(),
+            })
+        return {
+            **gauges,
+            "in_use_peak": self.in_use_peak,
+            "checkouts": self.checkouts,
+            "checkout_timeouts": self.checkout_timeouts,
+            "checkout_wait": self.checkout_wait.stats(),
+            "connects": self.connects,
+            "invalidations": self.invalidations,
+            "queries": self.query_time.stats(),
+            "query_errors": self.query_errors,
+            "slow_queries": self.slow_queries,
+            "slow_query_ms": round(self.slow_query_seconds * 1000, 1),
+        }
+
+
+# 各引擎的监控，按名称索引
+engine_monitors: Dict[str, EngineMonitor] = {}
+
+
+def create_db_engine(uri: str, name: str, is_async: bool = False) -> Any:
+    """
+    创建数据库引擎（同步或异步），连接池参数统一取自配置，并注册监控
+
+    SQLite 内存数据库只能使用单连接池，不设置连接池大小。
+    """
+    url = make_url(uri)
+    monitor = EngineMonitor(name, settings.DB_SLOW_QUERY_SECONDS)
+    options: Dict[str, Any] = {"pool_pre_ping": True}
+    if not (url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")):
+        options.update(
+            poolclass=monitor.pool_class(AsyncAdaptedQueuePool if is_async else QueuePool),
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+
+    if is_async:
+        engine: Any = create_async_engine(uri, **options)
+        monitor.attach(engine.sync_engine)
+    else:
+        engine = create_engine(uri, **options)
+        monitor.attach(engine)
+    engine_monitors[name] = monitor
+    logger.info(
+        f"[EngineMonitor] 创建数据库引擎 {name}: pool_size={settings.DB_POOL_SIZE}, "
+        f"max_overflow={settings.DB_MAX_OVERFLOW}, pool_timeout={settings.DB_POOL_TIMEOUT}"
+    )
+    return engine
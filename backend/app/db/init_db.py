@@ -50,7 +50,44 @@ def check_and_add_missing_columns(db: Session) -> None:
                 print("添加外键约束...")
                 db.execute(text("ALTER TABLE chat_sessions ADD CONSTRAINT fk_chat_sessions_llm_config FOREIGN KEY (llm_config_id) REFERENCES llm_config(id)"))
             
+            # 检查并添加 deleted_at 列
+            if "deleted_at" not in columns:
+                print("添加 deleted_at 列到 chat_sessions 表...")
+                db.execute(text("ALTER TABLE chat_sessions ADD COLUMN deleted_at DATETIME NULL"))
+            
+            # 检查并添加归档列
+            if "archived_at" not in columns:
+                print("添加 archived_at、archive_manifest 列到 chat_sessions 表...")
+                db.execute(text("ALTER TABLE chat_sessions ADD COLUMN archived_at DATETIME NULL"))
+                db.execute(text("ALTER TABLE chat_sessions ADD COLUMN archive_manifest TEXT NULL"))
+            
             db.commit()
+            
+            # 检查并添加 (user_id, updated_at) 复合索引
+            indexes = [index['name'] for index in inspector.get_indexes("chat_sessions")]
+            if "ix_chat_sessions_user_updated" not in indexes:
+                print("添加 (user_id, updated_at) 索引到 chat_sessions 表...")
+                db.execute(text("CREATE INDEX ix_chat_sessions_user_updated ON chat_sessions (user_id, updated_at)"))
+                db.commit()
+        
+        if "chat_messages" in tables:
+            indexes = [index['name'] for index in inspector.get_indexes("chat_messages")]
+            
+            # 检查并添加 (session_id, created_at) 复合索引
+            if "ix_chat_messages_session_created" not in indexes:
+                print("添加 (session_id, created_at) 索引到 chat_messages 表...")
+                db.execute(text("CREATE INDEX ix_chat_messages_session_created ON chat_messages (session_id, created_at)"))
+                db.commit()
+            
+            # 检查并把 session_id 外键改为 ON DELETE CASCADE（SQLite 不支持修改外键，跳过）
+            if engine.dialect.name == "mysql":
+                for fk in inspector.get_foreign_keys("chat_messages"):
+                    if fk['referred_table'] != "chat_sessions" or (fk.get('options') or {}).get('ondelete') == "CASCADE":
+                        continue
+                    print("修改 chat_messages.session_id 外键为 ON DELETE CASCADE...")
+                    db.execute(text(f"ALTER TABLE chat_messages DROP FOREIGN KEY {fk['name']}"))
+                    db.execute(text("ALTER TABLE chat_messages ADD CONSTRAINT fk_chat_messages_session FOREIGN KEY (session_id) REFERENCES chat_sessions(id) ON DELETE CASCADE"))
+                    db.commit()
     except Exception as e:
         print(f"添加缺失列时出错: {e}")
         db.rollback()
@@ -0,0 +1,91 @@
+from typing import List, Any, Optional, Tuple, NamedTuple
+from datetime import datetime
+import base64
+import json
+
+from sqlalchemy import Select, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class Page(NamedTuple):
+    """一页查询结果及前后页游标"""
+    items: List[Any]
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+
+def encode_cursor(sort_value: datetime, item_id: Any, direction: str) -> str:
+    """把 (排序时间, ID, 方向) 编码为不透明游标"""
+    payload = json.dumps({"t": sort_value.isoformat(), "id": item_id, "d": direction}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, Any, str]:
+    """解析游标，格式错误时抛出 ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        direction = payload["d"]
+        if direction not in ("next", "prev"):
+            raise ValueError(direction)
+        return datetime.fromisoformat(payload["t"]), payload["id"], direction
+    except Exception as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
+
+async def paginate(
+    db: AsyncSession,
+    query: Select,
+    sort_column: Any,
+    id_column: Any,
+    descending: bool,
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0
+) -> Page:
+    """
+    按 (sort_column, id_column) 做键集分页
+
+    给出 cursor 时从游标位置向后（next）或向前（prev）读取 limit 条，
+    直接利用对应的复合索引定位，不扫描和丢弃前面的行；否则退回 offset 分页。
+    返回的 items 始终按 descending 指定的顺序排列。
+    """
+    backward = False
+    if cursor is not None:
+        value, item_id, direction = decode_cursor(cursor)
+        backward = direction == "prev"
+        # 向前翻页时反转比较方向和排序，读完后再把结果倒回来
+        before = descending != backward
+        if before:
+            query = query.where(or_(sort_column < value, and_(sort_column == value, id_column < item_id)))
+        else:
+            query = query.where(or_(sort_column > value, and_(sort_column == value, id_column > item_id)))
+    else:
+        before = descending
+        query = query.offset(skip)
+
+    if before:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    # 多读一条判断是否还有更多
+    result = await db.execute(query.limit(limit + 1))
+    items = list(result.scalars().all())
+    has_more = len(items) > limit
+    items = items[:limit]
+    if backward:
+        items.reverse()
+    if not items:
+        return Page(items, None, None)
+
+    def cursor_for(item: Any, direction: str) -> str:
+        return encode_cursor(getattr(item, sort_column.key), getattr(item, id_column.key), direction)
+
+    if backward:
+        next_cursor = cursor_for(items[-1], "next")
+        prev_cursor = cursor_for(items[0], "prev") if has_more else None
+    else:
+        next_cursor = cursor_for(items[-1], "next") if has_more else None
+        prev_cursor = cursor_for(items[0], "prev") if cursor is not None or skip > 0 else None
+    return Page(items, next_cursor, prev_cursor)
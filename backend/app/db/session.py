@@ -1,15 +1,12 @@
-from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 from app.core.logging import logger
+from app.db.engine import create_db_engine
 
-# 创建数据库引擎
-# connect_args 用于处理特定数据库的连接参数，例如 SQLite 的 check_same_thread
-engine = create_engine(
-    str(settings.SQLALCHEMY_DATABASE_URI), 
-    pool_pre_ping=True, # 检查连接有效性
-    # connect_args={"check_same_thread": False} # 仅在 SQLite 时需要
-)
+# 创建数据库引擎，连接池参数取自配置
+engine = create_db_engine(str(settings.SQLALCHEMY_DATABASE_URI), name="sync")
 
 # 创建 SessionLocal 类，用于创建数据库会话
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -25,4 +22,31 @@ def get_db():
         logger.error(f"数据库会话错误: {str(e)}")
         raise
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+
+# 同步驱动对应的异步驱动
+ASYNC_DRIVERS = {
+    "mysql": f"mysql+{settings.ASYNC_MYSQL_DRIVER}",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def get_async_database_uri(uri: str) -> str:
+    """把同步连接地址（如 mysql+pymysql://）转换为对应异步驱动的地址"""
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"不支持的异步数据库类型: {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+# 创建异步数据库引擎，聊天的持久化和历史读取走这里，不阻塞事件循环
+async_engine = create_db_engine(
+    get_async_database_uri(str(settings.SQLALCHEMY_DATABASE_URI)),
+    name="async",
+    is_async=True
+)
+
+# 提交后不过期对象属性，避免在协程外触发隐式加载
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
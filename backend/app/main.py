@@ -12,8 +12,15 @@ print("Python path:", sys.path)
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
-from app.db.session import SessionLocal
+from app.db.session import SessionLocal, async_engine
 from app.db.init_db import init_db
+from app.services.llm_client_pool import llm_client_registry
+from app.services.generation_registry import generation_registry
+from app.services.loop_monitor import loop_monitor
+from app.services.message_writer import message_writer
+from app.services.session_purger import session_purger
+from app.services.session_archiver import session_archiver
+from app.services.websocket_manager import websocket_manager
 
 # API 版本配置
 API_VERSION = "v1"
@@ -51,6 +58,27 @@ async def startup_event():
         init_db(db)
     finally:
         db.close()
+    loop_monitor.start()
+    message_writer.start()
+    # 继续清理上次未完成的已删除会话
+    session_purger.start()
+    # 定期把空闲会话归档到对象存储
+    session_archiver.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await loop_monitor.stop()
+    await session_purger.aclose()
+    await session_archiver.aclose()
+    await websocket_manager.aclose()
+    # 取消进行中的生成并保存部分回复
+    await generation_registry.aclose()
+    # 写完队列中尚未落库的消息
+    await message_writer.aclose()
+    # 关闭共享的LLM上游连接池
+    await llm_client_registry.aclose()
+    # 关闭异步数据库引擎的连接池
+    await async_engine.dispose()
 
 @app.get("/")
 async def root():
@@ -60,10 +88,12 @@ async def root():
 from app.api.auth import router as auth_router
 from app.api.chat import router as chat_router
 from app.api.llm_config import router as llm_config_router
+from app.api.metrics import router as metrics_router
 
 app.include_router(auth_router, prefix=API_PREFIX, tags=["认证"])
 app.include_router(chat_router, prefix=API_PREFIX, tags=["聊天"])
 app.include_router(llm_config_router, prefix=f"{API_PREFIX}/llm-config", tags=["LLM配置"])
+app.include_router(metrics_router, prefix=API_PREFIX, tags=["运行指标"])
 
 # 注册路由
 # app.include_router(text2sql.router, prefix=f"{settings.API_V1_STR}/text2sql", tags=["Text2SQL"])
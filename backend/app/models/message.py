@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Text
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -7,9 +7,13 @@ from app.db.base_class import Base
 class ChatMessage(Base):
     """聊天消息模型"""
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # 按会话读取最新消息（ORDER BY created_at DESC LIMIT n）和消息键集分页走此索引
+        Index("ix_chat_messages_session_created", "session_id", "created_at"),
+    )
 
     id = Column(String(36), primary_key=True, index=True)
-    session_id = Column(String(36), ForeignKey("chat_sessions.id"), nullable=False)
+    session_id = Column(String(36), ForeignKey("chat_sessions.id", ondelete="CASCADE"), nullable=False)
     content = Column(Text, nullable=False)
     role = Column(String(50), nullable=False)  # user 或 assistant
     created_at = Column(DateTime, default=datetime.utcnow)
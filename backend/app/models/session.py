@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -7,6 +7,10 @@ from app.db.base_class import Base
 class ChatSession(Base):
     """聊天会话模型"""
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        # 会话列表按 (updated_at, id) 倒序键集分页走此索引
+        Index("ix_chat_sessions_user_updated", "user_id", "updated_at"),
+    )
 
     id = Column(String(36), primary_key=True, index=True)
     title = Column(String(255), nullable=False)
@@ -14,8 +18,14 @@ class ChatSession(Base):
     llm_config_id = Column(Integer, ForeignKey("llm_config.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # 标记删除时间，消息较多的会话先标记、再由后台分块清理
+    deleted_at = Column(DateTime, nullable=True)
+    # 归档时间和归档清单（JSON：压缩格式、对象键列表、消息数），非空时消息在对象存储中
+    archived_at = Column(DateTime, nullable=True)
+    archive_manifest = Column(Text, nullable=True)
 
     # 关系
-    messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan")
+    # 消息由数据库 ON DELETE CASCADE 或批量 DELETE 删除，删除会话时不加载消息
+    messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan", passive_deletes=True)
     user = relationship("User", back_populates="chat_sessions")
     llm_config = relationship("LLMConfig", back_populates="chat_sessions") 
\ No newline at end of file
@@ -39,12 +39,25 @@ class SessionUpdate(BaseModel):
     title: Optional[str] = Field(None, description="会话标题")
 
 
+class SessionBatchDelete(BaseModel):
+    """批量删除会话请求模型"""
+    session_ids: List[str] = Field(..., min_length=1, description="要删除的会话ID列表")
+
+
+class SessionBatchDeleteResult(BaseModel):
+    """批量删除会话响应模型"""
+    deleted: List[str] = Field(default_factory=list, description="已删除的会话ID")
+    purging: List[str] = Field(default_factory=list, description="已标记删除、消息在后台清理中的会话ID")
+    not_found: List[str] = Field(default_factory=list, description="不存在或无权删除的会话ID")
+
+
 class Session(SessionBase):
     """会话响应模型"""
     id: str = Field(..., description="会话ID")
     user_id: int = Field(..., description="用户ID")
     created_at: datetime = Field(default_factory=datetime.now, description="会话创建时间")
     updated_at: datetime = Field(default_factory=datetime.now, description="会话更新时间")
+    archived_at: Optional[datetime] = Field(None, description="归档时间，非空表示消息已转入冷存储，打开会话时恢复")
     messages: Optional[List[Message]] = Field(None, description="会话中的消息列表")
 
     class Config:
@@ -38,4 +38,20 @@ class LLMConfigInDBBase(LLMConfigBase):
 
 class LLMConfig(LLMConfigInDBBase):
     """API返回的LLM配置模型"""
-    pass 
\ No newline at end of file
+    pass 
+
+class ResolvedLLMConfig(BaseModel):
+    """解析后的用户默认LLM配置（不可变，可安全缓存和跨请求共享）"""
+    id: int
+    user_id: int
+    name: str
+    provider: str
+    model_name: str
+    api_key: Optional[str] = Field(None, repr=False)
+    api_base_url: Optional[str] = None
+    temperature: float = 0.7
+    max_tokens: int = 2000
+
+    class Config:
+        frozen = True
+        from_attributes = True
@@ -39,4 +39,15 @@ class User(UserBase):
 class TokenPayload(BaseModel):
     """Token载荷模型"""
     sub: str = None
-    exp: int = None 
\ No newline at end of file
+    exp: int = None 
+
+class Principal(BaseModel):
+    """已认证用户的轻量快照（不可变，可安全缓存）"""
+    id: int
+    email: str
+    is_active: bool = True
+    is_superuser: bool = False
+
+    class Config:
+        frozen = True
+        from_attributes = True
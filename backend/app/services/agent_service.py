@@ -4,10 +4,8 @@ import asyncio
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
-from app.services.llm_service import LLMService, LLMMessage, LLMProvider, get_llm_service
-from app.services.llm_config_service import llm_config_service
+from app.services.llm_service import LLMService, LLMMessage, LLMProvider, get_llm_service, route_llm_service
 from app.core.logging import logger
-from app.db.session import get_db
 
 
 # 智能体类型枚举
@@ -67,9 +65,10 @@ class AgentService:
         self,
         messages: List[Dict[str, str]],
         system_message: str = CUSTOMER_SERVICE_SYSTEM_PROMPT,
-        user_id: Optional[int] = None
+        user_id: Optional[int] = None,
+        llm_config: Optional[Any] = None
     ) -> AsyncGenerator[str, None]:
-        """以流式方式与AI对话"""
+        """以流式方式与AI对话，llm_config 为调用方已解析的用户默认配置"""
         try:
             # 转换消息格式
             llm_messages = [
@@ -77,27 +76,19 @@ class AgentService:
                 for m in messages
             ]
             
-            # 获取用户的默认LLM配置
-            if user_id:
-                try:
-                    db = next(get_db())
-                    logger.info(f"正在获取用户 {user_id} 的默认LLM配置")
-                    config = llm_config_service.get_default_config(db, user_id)
-                    if config:
-                        logger.info(f"找到默认配置: {config.provider} - {config.model_name}")
-                        self.llm_service = LLMService(config)
-                    else:
-                        logger.warning(f"用户 {user_id} 没有默认LLM配置")
-                except Exception as e:
-                    logger.error(f"获取默认配置时出错: {str(e)}")
-                    yield f"获取LLM配置失败: {str(e)}"
-                    return
+            # 使用用户的默认LLM配置，其所在后端组配置了路由时在组内路由
+            if llm_config:
+                self.llm_service = route_llm_service(LLMService.from_config(llm_config))
+            elif user_id:
+                logger.warning(f"用户 {user_id} 没有默认LLM配置")
             
             # 使用LLM服务生成回复
             async for chunk in self.llm_service.generate_stream(
                 messages=llm_messages,
                 system_message=system_message,
-                user_id=user_id
+                user_id=user_id,
+                # 客服场景的常见问题重复度高，启用响应缓存
+                use_cache=self.config.agent_type == AgentType.CUSTOMER_SERVICE
             ):
                 yield chunk
                 
@@ -30,18 +30,27 @@ class AuthService:
         return encoded_jwt
 
     @staticmethod
-    def verify_token(token: str) -> Optional[TokenData]:
+    def decode_token(token: str) -> Optional[dict]:
         """
-        验证令牌
+        验证并解码令牌，返回载荷（含 sub 和 exp）
         """
         try:
             payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-            email: str = payload.get("sub")
-            if email is None:
-                return None
-            return TokenData(email=email)
         except JWTError:
             return None
+        if payload.get("sub") is None:
+            return None
+        return payload
+
+    @staticmethod
+    def verify_token(token: str) -> Optional[TokenData]:
+        """
+        验证令牌
+        """
+        payload = AuthService.decode_token(token)
+        if payload is None:
+            return None
+        return TokenData(email=payload["sub"])
 
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str) -> bool:
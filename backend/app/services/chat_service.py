@@ -1,94 +1,172 @@
-from typing import List, Optional, Dict, Any
-from sqlalchemy.orm import Session
+from typing import List, Optional, Dict, Any, NamedTuple, Tuple, Callable
+from sqlalchemy import select, delete, update, func, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import noload
 from datetime import datetime
 import uuid
 import json
+import asyncio
 from fastapi import HTTPException, status, WebSocket, WebSocketDisconnect
 
 from app.models.session import ChatSession as SessionModel
 from app.models.message import ChatMessage as MessageModel
 from app.schemas.chat import ChatMessageCreate, ChatMessageResponse, ChatMessage, ChatRequest, ChatResponse
-from app.services.agent_service import get_agent_service
+from app.services.agent_service import get_agent_service, CUSTOMER_SERVICE_SYSTEM_PROMPT
+from app.services.context_builder import context_builder
+from app.services.generation_registry import generation_registry
+from app.services.stream_coalescer import sse_coalescer
+from app.services.websocket_manager import websocket_manager
+from app.services.message_writer import message_writer
+from app.services.history_cache import history_cache
+from app.services.session_purger import session_purger
+from app.services.session_archiver import session_archiver
 from app.services.llm_config_service import llm_config_service
-from app.services.llm_service import llm_service, LLMConfig
-from app.db.session import get_db
+from app.services.llm_service import llm_service
+from app.schemas.llm_config import ResolvedLLMConfig
+from app.db.session import AsyncSessionLocal
+from app.db.pagination import Page, paginate
+from app.core.config import settings
 
-class WebSocketManager:
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-
-    async def connect(self, websocket: WebSocket, session_id: str):
-        await websocket.accept()
-        if session_id not in self.active_connections:
-            self.active_connections[session_id] = []
-        self.active_connections[session_id].append(websocket)
 
-    def disconnect(self, websocket: WebSocket, session_id: str):
-        if session_id in self.active_connections:
-            self.active_connections[session_id].remove(websocket)
-            if not self.active_connections[session_id]:
-                del self.active_connections[session_id]
+class HistoryMessage(NamedTuple):
+    """组装上下文用的轻量历史消息，只包含需要的列"""
+    id: str
+    role: str
+    content: str
+    created_at: datetime
 
-    async def broadcast(self, session_id: str, message: str):
-        if session_id in self.active_connections:
-            for connection in self.active_connections[session_id]:
-                await connection.send_text(message)
 
 class ChatService:
     def __init__(self):
-        self.active_sessions: dict = {}
-        self.websocket_manager = WebSocketManager()
+        # 活跃会话的最近消息缓存
+        self.active_sessions = history_cache
+        self.websocket_manager = websocket_manager
 
     async def save_message(self, message: ChatMessage) -> None:
         """
-        保存消息到数据库
+        保存消息到数据库（经写入队列，batched 模式下批量提交），同时写入会话历史缓存
         """
-        db = next(get_db())
-        try:
-            db_message = MessageModel(
-                id=message.id,
-                session_id=message.session_id,
-                content=message.content,
-                role=message.role,
-                created_at=message.created_at
-            )
-            db.add(db_message)
-            db.commit()
-            db.refresh(db_message)
-        finally:
-            db.close()
+        await message_writer.write(message)
+        self._cache_message(message)
+
+    def _cache_message(self, message: Any) -> None:
+        self.active_sessions.append(
+            message.session_id,
+            HistoryMessage(message.id, message.role, message.content, message.created_at)
+        )
 
-    async def get_session_messages(self, session_id: str) -> List[ChatMessage]:
+    async def get_recent_history(
+        self,
+        session_id: str,
+        limit: int = settings.CHAT_HISTORY_MAX_MESSAGES,
+        token_budget: Optional[int] = None,
+        model: str = ""
+    ) -> List[HistoryMessage]:
         """
-        获取会话的所有消息
+        只读取会话最新的一段历史（按时间升序返回）
+
+        按 (created_at, id) 倒序分页读取，最多 limit 条；给出 token_budget 时读到预算用完即停止，
+        计数方式与 context_builder 一致。查询走 (session_id, created_at) 索引，
+        读取量与会话总长度无关。会话历史缓存命中且足够时不读数据库。
         """
-        db = next(get_db())
-        try:
-            messages = db.query(MessageModel).filter(
-                MessageModel.session_id == session_id
-            ).order_by(MessageModel.created_at).all()
-            
-            return [
-                ChatMessage(
-                    id=msg.id,
-                    session_id=msg.session_id,
-                    content=msg.content,
-                    role=msg.role,
-                    created_at=msg.created_at
-                )
-                for msg in messages
-            ]
-        finally:
-            db.close()
+        newest_first: List[HistoryMessage] = []
+        seen = set()
+        used = 0
 
-    async def create_session(self, db: Session, title: str, user_id: int) -> SessionModel:
-        """创建新的会话"""
+        def take(message: HistoryMessage) -> bool:
+            # 收下一条消息，返回是否还需要更早的消息；最新的一条总会收下
+            nonlocal used
+            if token_budget is not None:
+                tokens = context_builder.count_message(message, model)
+                if newest_first and used + tokens > token_budget:
+                    return False
+                used += tokens
+            newest_first.append(message)
+            return len(newest_first) < limit
+
+        cached = self.active_sessions.get(session_id)
+        if cached is not None:
+            # 缓存中已包含尚未落库的消息
+            more = True
+            for message in reversed(cached.messages):
+                seen.add(message.id)
+                more = take(message)
+                if not more:
+                    break
+            if not more or not cached.truncated or not cached.messages:
+                self.active_sessions.record(hit=True)
+            else:
+                # 缓存不够用，从缓存中最早的消息继续向前读数据库
+                self.active_sessions.record(hit=True, partial=True)
+                oldest = cached.messages[0]
+                await self._read_history(session_id, take, seen, (oldest.created_at, oldest.id))
+        else:
+            self.active_sessions.record(hit=False)
+            self.active_sessions.begin_load(session_id)
+            exhausted = False
+            try:
+                # 写入队列中尚未落库的消息最新，先收下
+                more = True
+                for row in reversed(message_writer.pending_rows(session_id)):
+                    seen.add(row["id"])
+                    more = take(HistoryMessage(row["id"], row["role"], row["content"], row["created_at"]))
+                    if not more:
+                        break
+                if more:
+                    exhausted = await self._read_history(session_id, take, seen, None)
+            finally:
+                self.active_sessions.finish_load(session_id, newest_first[::-1], truncated=not exhausted)
+
+        newest_first.reverse()
+        return newest_first
+
+    async def _read_history(
+        self,
+        session_id: str,
+        take: Callable[[HistoryMessage], bool],
+        seen: set,
+        cursor: Optional[Tuple[datetime, str]]
+    ) -> bool:
+        """从 cursor 之前按时间倒序逐页读取消息交给 take，返回是否已读完会话的全部消息"""
+        async with AsyncSessionLocal() as db:
+            while True:
+                query = select(
+                    MessageModel.id, MessageModel.role, MessageModel.content, MessageModel.created_at
+                ).where(
+                    MessageModel.session_id == session_id
+                ).order_by(
+                    MessageModel.created_at.desc(), MessageModel.id.desc()
+                ).limit(settings.CHAT_HISTORY_PAGE_SIZE)
+                if cursor is not None:
+                    query = query.where(or_(
+                        MessageModel.created_at < cursor[0],
+                        and_(MessageModel.created_at == cursor[0], MessageModel.id < cursor[1])
+                    ))
+                rows = (await db.execute(query)).all()
+
+                for row in rows:
+                    if row.id in seen:
+                        # 读取期间刚落库的待写消息
+                        continue
+                    if not take(HistoryMessage(row.id, row.role, row.content, row.created_at)):
+                        return False
+                if len(rows) < settings.CHAT_HISTORY_PAGE_SIZE:
+                    return True
+                cursor = (rows[-1].created_at, rows[-1].id)
+
+    async def create_session(
+        self,
+        db: AsyncSession,
+        title: str,
+        user_id: int,
+        llm_config: Optional[ResolvedLLMConfig] = None
+    ) -> SessionModel:
+        """创建新的会话，llm_config 为调用方已解析的默认配置"""
         try:
             print(f"开始创建会话: title={title}, user_id={user_id}")
             
             # 获取用户的默认LLM配置
-            default_config = llm_config_service.get_default_config(db, user_id)
-            print(f"获取默认LLM配置: {default_config}")
+            default_config = llm_config or await llm_config_service.get_default_config_async(db, user_id)
             
             if not default_config:
                 print("未找到默认LLM配置")
@@ -104,57 +182,45 @@ class ChatService:
                 user_id=user_id,
                 llm_config_id=default_config.id,
                 created_at=datetime.utcnow(),
-                updated_at=datetime.utcnow()
+                updated_at=datetime.utcnow(),
+                messages=[]
             )
             print(f"创建会话记录: {db_session.__dict__}")
             
             db.add(db_session)
-            db.commit()
-            db.refresh(db_session)
+            await db.commit()
             print(f"会话创建成功: {db_session.__dict__}")
             
-            self.active_sessions[db_session.id] = {
-                "user_id": user_id,
-                "created_at": datetime.utcnow(),
-                "messages": []
-            }
+            self.active_sessions.create(db_session.id)
             return db_session
         except Exception as e:
             print(f"创建会话失败: {str(e)}")
-            db.rollback()
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"创建会话失败: {str(e)}"
             )
 
-    async def get_session(self, db: Session, session_id: str) -> Optional[SessionModel]:
-        """获取会话信息"""
-        return db.query(SessionModel).filter(SessionModel.id == session_id).first()
-
-    async def delete_session(self, db: Session, session_id: str) -> None:
-        """删除会话"""
-        try:
-            session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
-            if session:
-                db.delete(session)
-                db.commit()
-            if session_id in self.active_sessions:
-                del self.active_sessions[session_id]
-        except Exception as e:
-            db.rollback()
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"删除会话失败: {str(e)}"
-            )
+    async def get_session(self, db: AsyncSession, session_id: str, user_id: int) -> Optional[SessionModel]:
+        """获取用户的会话，不属于该用户时返回 None；会话已归档时先从对象存储恢复消息"""
+        session = await self.get_session_by_id(db, session_id)
+        if session is None or session.user_id != user_id:
+            # 先校验归属，其他用户不能触发恢复
+            return None
+        if session.archived_at is not None:
+            await session_archiver.rehydrate(session.id)
+            await db.refresh(session, ["archived_at", "archive_manifest"])
+        return session
 
     async def send_message(
         self,
         session_id: str,
         content: str,
         user_id: str,
-        llm_config: LLMConfig
+        llm_config: ResolvedLLMConfig,
+        save_user_message: bool = True
     ) -> ChatMessageResponse:
-        """发送消息并获取AI回复"""
+        """发送消息并获取AI回复，调用方已保存用户消息时 save_user_message 为 False"""
         try:
             # 创建用户消息
             user_message = ChatMessage(
@@ -166,16 +232,19 @@ class ChatService:
             )
             
             # 保存用户消息
-            await self.save_message(user_message)
+            if save_user_message:
+                await self.save_message(user_message)
             
-            # 获取会话历史消息
-            messages = await self.get_session_messages(session_id)
+            # 只读取预算内的最新历史
+            model, budget = context_builder.resolve_budget(llm_config, CUSTOMER_SERVICE_SYSTEM_PROMPT)
+            messages = await self.get_recent_history(session_id, token_budget=budget, model=model)
             
-            # 准备消息历史
-            message_history = [
-                {"role": msg.role, "content": msg.content}
-                for msg in messages[-10:] # 最多获取最近10条消息
-            ]
+            # 按模型的 token 预算组装消息历史
+            message_history = context_builder.build(
+                messages,
+                llm_config=llm_config,
+                system_message=CUSTOMER_SERVICE_SYSTEM_PROMPT
+            )
             
             # 获取智能体服务
             agent_service = get_agent_service(
@@ -184,25 +253,35 @@ class ChatService:
                 model_key=llm_config.model_name
             )
             
-            # 调用智能体服务获取回复
-            assistant_content = ""
-            async for chunk in agent_service.chat_stream(
-                messages=message_history,
-                user_id=user_id
-            ):
-                assistant_content += chunk
-            
             # 创建AI回复消息
             assistant_message = ChatMessage(
                 id=str(uuid.uuid4()),
                 session_id=session_id,
-                content=assistant_content,
+                content="",
                 role="assistant",
                 created_at=datetime.utcnow()
             )
-            
-            # 保存AI回复
-            await self.save_message(assistant_message)
+
+            async def save_reply(content: str, status: str) -> None:
+                # 生成结束或被取消时保存（部分）回复
+                assistant_message.content = content
+                assistant_message.created_at = datetime.utcnow()
+                await self.save_message(assistant_message)
+
+            # 调用智能体服务获取回复，登记后可被 /chat/stop 或连接断开取消
+            generation = generation_registry.start(
+                user_id,
+                session_id,
+                agent_service.chat_stream(messages=message_history, user_id=user_id, llm_config=llm_config),
+                on_finish=save_reply,
+                llm_config=llm_config
+            )
+            try:
+                await generation.result()
+            except asyncio.CancelledError:
+                # 调用方被取消（如 WebSocket 关闭），中断上游生成
+                generation_registry.cancel_generation(generation, "disconnect")
+                raise
             
             # 返回响应
             return ChatMessageResponse(
@@ -216,11 +295,16 @@ class ChatService:
                 detail=f"发送消息失败: {str(e)}"
             )
 
-    async def chat_with_ai(self, db: Session, user_id: int, chat_request: ChatRequest) -> ChatResponse:
+    async def chat_with_ai(self, db: AsyncSession, user_id: int, chat_request: ChatRequest) -> ChatResponse:
         """
         与AI进行聊天
         """
         try:
+            # 获取默认 LLM 配置，本轮对话的后续步骤都使用这份配置
+            llm_config = await llm_config_service.get_default_config_async(db, user_id)
+            if not llm_config:
+                raise ValueError("未找到可用的 LLM 配置")
+            
             # 获取或创建会话
             session_id = chat_request.session_id
             user_message = chat_request.message
@@ -228,18 +312,16 @@ class ChatService:
             if not session_id:
                 # 使用消息的前20个字符作为会话标题
                 title = user_message[:20] + "..." if len(user_message) > 20 else user_message
-                db_session = await self.create_session(db, title, user_id)
+                db_session = await self.create_session(db, title, user_id, llm_config=llm_config)
                 session_id = db_session.id
             else:
                 # 获取现有会话
-                db_session = await self.get_session(db, session_id)
-                if not db_session or db_session.user_id != user_id:
+                db_session = await self.get_session(db, session_id, user_id)
+                if not db_session:
                     raise ValueError("无效的会话ID")
             
-            # 获取默认 LLM 配置
-            llm_config = llm_config_service.get_default_config(db, user_id)
-            if not llm_config:
-                raise ValueError("未找到可用的 LLM 配置")
+            # 生成期间不再使用请求的会话，先释放连接，避免长时间占用连接池
+            await db.close()
             
             # 发送消息并获取回复
             response = await self.send_message(
@@ -257,110 +339,254 @@ class ChatService:
         except Exception as e:
             raise ValueError(f"聊天过程中发生错误: {str(e)}")
 
-    async def handle_websocket_message(self, db: Session, websocket: WebSocket, session_id: str, data: str, user_id: int) -> None:
+    async def handle_websocket_message(self, db: AsyncSession, websocket: WebSocket, session_id: str, data: str, user_id: int) -> None:
         """
-        处理 WebSocket 消息
+        处理 WebSocket 消息，逐块推送回复
+
+        向会话的所有连接依次广播 start、delta（每个分片一帧）和 end 帧，生成失败时广播 error 帧。
+        帧格式为 {"type", "seq", "message_id", "data"}，seq 在一次回复内从 0 递增，message_id 为助手消息 ID。
+        用户消息与历史读取、首个分片并行落库；助手回复在最后一个分片发出后保存，end 帧在保存后发出。
         """
         try:
             message_data = json.loads(data)
-            message_in = ChatMessageCreate(content=message_data["content"])
-            
-            # 发送消息并获取回复
-            response = await self.send_message(
-                session_id=session_id,
-                content=message_in.content,
-                user_id=str(user_id),
-                llm_config=llm_config_service.get_default_config(db, user_id)
-            )
-            
-            # 广播回复
-            await self.websocket_manager.broadcast(
-                session_id,
-                json.dumps({
-                    "type": "message",
-                    "data": {
-                        "user_message": response.user_message.dict(),
-                        "assistant_message": response.assistant_message.dict()
-                    }
-                })
-            )
+            message_in = ChatMessageCreate(content=message_data["content"], role="user", session_id=session_id)
+            llm_config = await llm_config_service.get_default_config_async(db, user_id)
+            await db.close()
+            if not llm_config:
+                raise ValueError("未找到可用的 LLM 配置")
         except Exception as e:
             # 发送错误消息
-            await websocket.send_text(json.dumps({
+            await self.websocket_manager.send(websocket, session_id, json.dumps({
                 "type": "error",
                 "data": str(e)
             }))
+            return
+
+        user_message = ChatMessage(
+            id=str(uuid.uuid4()),
+            session_id=session_id,
+            content=message_in.content,
+            role="user",
+            created_at=datetime.utcnow()
+        )
+        assistant_id = str(uuid.uuid4())
+        seq = 0
+
+        async def emit(frame_type: str, payload: Any) -> None:
+            nonlocal seq
+            frame = {"type": frame_type, "seq": seq, "message_id": assistant_id, "data": payload}
+            seq += 1
+            await self.websocket_manager.broadcast(session_id, json.dumps(frame, ensure_ascii=False, default=str))
+
+        save_user: Optional[asyncio.Task] = None
+
+        async def save_reply(content: str, status: str) -> None:
+            # 生成失败时客户端收到 error 帧，不保存不完整的回复
+            if status == "failed":
+                return
+            # 用户消息先于回复落库
+            await save_user
+            await self.save_message(ChatMessage(
+                id=assistant_id,
+                session_id=session_id,
+                content=content,
+                role="assistant",
+                created_at=datetime.utcnow()
+            ))
+
+        generation = None
+        try:
+            # 先读取历史再并行保存用户消息，新消息直接追加到本轮上下文
+            model, budget = context_builder.resolve_budget(llm_config, CUSTOMER_SERVICE_SYSTEM_PROMPT)
+            messages = await self.get_recent_history(session_id, token_budget=budget, model=model)
+            messages.append(HistoryMessage(user_message.id, user_message.role, user_message.content, user_message.created_at))
+            save_user = asyncio.create_task(self.save_message(user_message))
+            message_history = context_builder.build(
+                messages,
+                llm_config=llm_config,
+                system_message=CUSTOMER_SERVICE_SYSTEM_PROMPT
+            )
+            agent_service = get_agent_service(
+                agent_type="customer_service",
+                llm_provider=llm_config.provider,
+                model_key=llm_config.model_name
+            )
+            await emit("start", {"user_message": user_message.dict()})
+            # 生成登记后可被 stop 指令或连接关闭取消
+            generation = generation_registry.start(
+                user_id,
+                session_id,
+                agent_service.chat_stream(messages=message_history, user_id=str(user_id), llm_config=llm_config),
+                on_finish=save_reply,
+                llm_config=llm_config
+            )
+            async for chunk in sse_coalescer.coalesce(generation.stream()):
+                await emit("delta", {"content": chunk})
+            await emit("end", {"status": generation.status, "content": generation.content})
+        except Exception as e:
+            await emit("error", str(e))
+        finally:
+            if generation is not None and not generation.done:
+                # 连接关闭，立即取消上游生成
+                generation_registry.cancel_generation(generation, "disconnect")
 
-    def get_sessions_by_user(self, db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[SessionModel]:
+    async def get_sessions_by_user(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Page:
         """
-        获取用户的所有会话
+        获取用户的会话（按更新时间倒序），给出 cursor 时按 (updated_at, id) 键集分页
         """
-        return db.query(SessionModel).filter(
-            SessionModel.user_id == user_id
-        ).order_by(
-            SessionModel.updated_at.desc()
-        ).offset(skip).limit(limit).all()
+        # 会话列表不需要消息，避免逐个会话加载全部消息
+        query = select(SessionModel).options(noload(SessionModel.messages)).where(
+            SessionModel.user_id == user_id,
+            SessionModel.deleted_at.is_(None)
+        )
+        return await paginate(
+            db, query, SessionModel.updated_at, SessionModel.id,
+            descending=True, limit=limit, cursor=cursor, skip=skip
+        )
 
-    def get_session_by_id(self, db: Session, session_id: str) -> Optional[SessionModel]:
+    async def get_session_by_id(self, db: AsyncSession, session_id: str) -> Optional[SessionModel]:
         """
         获取特定会话
         """
-        return db.query(SessionModel).filter(SessionModel.id == session_id).first()
+        result = await db.execute(
+            select(SessionModel).options(noload(SessionModel.messages)).where(
+                SessionModel.id == session_id,
+                SessionModel.deleted_at.is_(None)
+            )
+        )
+        return result.scalars().first()
 
-    def update_session(self, db: Session, session: SessionModel, title: str) -> SessionModel:
+    async def update_session(self, db: AsyncSession, session: SessionModel, title: str) -> SessionModel:
         """
         更新会话
         """
         session.title = title
         session.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(session)
+        await db.commit()
+        # 标题和时间戳不影响消息历史，不需要失效历史缓存
         return session
 
-    def delete_session(self, db: Session, session: SessionModel) -> None:
+    async def delete_session(self, db: AsyncSession, session: SessionModel) -> None:
         """
         删除会话
         """
-        db.delete(session)
-        db.commit()
+        await self.delete_sessions(db, session.user_id, [session.id])
 
-    def get_messages_by_session(self, db: Session, session_id: str, skip: int = 0, limit: int = 100) -> List[MessageModel]:
+    async def delete_sessions(self, db: AsyncSession, user_id: int, session_ids: List[str]) -> Dict[str, List[str]]:
         """
-        获取指定会话的所有消息
+        批量删除用户的会话
+
+        不加载会话和消息对象，直接按会话 ID 执行集合 DELETE。消息数超过
+        SESSION_PURGE_SYNC_MAX_MESSAGES 的会话只标记为已删除并立即从列表中消失，
+        消息由后台分块清理。返回 deleted（已删除）、purging（后台清理中）和 not_found。
         """
-        return db.query(MessageModel).filter(
-            MessageModel.session_id == session_id
-        ).order_by(
-            MessageModel.created_at.asc()
-        ).offset(skip).limit(limit).all()
+        try:
+            result = await db.execute(
+                select(SessionModel.id, SessionModel.archive_manifest).where(
+                    SessionModel.id.in_(session_ids),
+                    SessionModel.user_id == user_id,
+                    SessionModel.deleted_at.is_(None)
+                )
+            )
+            manifests = dict(result.all())
+            owned = list(manifests)
+            if not owned:
+                return {"deleted": [], "purging": [], "not_found": list(session_ids)}
+            
+            # 先写完队列中这些会话的消息，再统计和删除
+            for session_id in owned:
+                await message_writer.flush_session(session_id)
+            result = await db.execute(
+                select(MessageModel.session_id, func.count()).where(
+                    MessageModel.session_id.in_(owned)
+                ).group_by(MessageModel.session_id)
+            )
+            counts = dict(result.all())
+            large = [sid for sid in owned if counts.get(sid, 0) > settings.SESSION_PURGE_SYNC_MAX_MESSAGES]
+            small = [sid for sid in owned if sid not in large]
+            
+            if small:
+                await db.execute(delete(MessageModel).where(MessageModel.session_id.in_(small)))
+                await db.execute(delete(SessionModel).where(SessionModel.id.in_(small)))
+            if large:
+                await db.execute(
+                    update(SessionModel).where(SessionModel.id.in_(large)).values(deleted_at=datetime.utcnow())
+                )
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"删除会话失败: {str(e)}"
+            )
+        
+        for session_id in owned:
+            self.active_sessions.invalidate(session_id)
+            await session_archiver.delete_archive(manifests[session_id])
+        if large:
+            session_purger.schedule(large)
+        return {
+            "deleted": small,
+            "purging": large,
+            "not_found": [sid for sid in session_ids if sid not in owned],
+        }
+
+    async def create_message(self, db: AsyncSession, session_id: str, content: str, role: str) -> MessageModel:
+        """
+        创建新消息
+        """
+        db_message = MessageModel(
+            id=str(uuid.uuid4()),
+            session_id=session_id,
+            content=content,
+            role=role,
+            created_at=datetime.utcnow()
+        )
+        db.add(db_message)
+        await db.commit()
+        self._cache_message(db_message)
+        return db_message
+
+    async def get_messages_by_session(
+        self,
+        db: AsyncSession,
+        session_id: str,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Page:
+        """
+        获取指定会话的消息（按时间升序），给出 cursor 时按 (created_at, id) 键集分页
+        """
+        # 分页读取无法合并内存中的消息，先写完该会话的待写消息
+        await message_writer.flush_session(session_id)
+        query = select(MessageModel).where(MessageModel.session_id == session_id)
+        return await paginate(
+            db, query, MessageModel.created_at, MessageModel.id,
+            descending=False, limit=limit, cursor=cursor, skip=skip
+        )
 
 # 创建 ChatService 实例
 chat_service = ChatService()
 
-# 导出 WebSocket 管理器实例
-websocket_manager = chat_service.websocket_manager
-
 # 导出处理函数
 handle_websocket_message = chat_service.handle_websocket_message
 
-async def create_session(db: Session, title: str, user_id: int) -> SessionModel:
+async def create_session(db: AsyncSession, title: str, user_id: int) -> SessionModel:
     """
     创建新的聊天会话
     """
     return await chat_service.create_session(db, title, user_id)
 
-async def create_message(db: Session, session_id: str, content: str, role: str) -> MessageModel:
+async def create_message(db: AsyncSession, session_id: str, content: str, role: str) -> MessageModel:
     """
     创建新消息
     """
-    db_message = MessageModel(
-        id=str(uuid.uuid4()),
-        session_id=session_id,
-        content=content,
-        role=role,
-        created_at=datetime.utcnow()
-    )
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
-    return db_message 
\ No newline at end of file
+    return await chat_service.create_message(db, session_id, content, role)
\ No newline at end of file
@@ -0,0 +1,148 @@
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+from collections import OrderedDict
+import tiktoken
+
+from app.core.config import settings
+from app.core.logging import logger
+
+
+# 常见模型的上下文窗口大小（token）
+MODEL_CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo-preview": 128000,
+    "deepseek-chat": 32768,
+    "deepseek-coder": 16384,
+    "llama2": 4096,
+    "llama3": 8192,
+    "mistral": 8192,
+    "codellama": 16384,
+    "vicuna": 4096,
+    "wizardcoder": 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+# 每条消息在对话格式中的固定开销，以及回复起始的开销
+TOKENS_PER_MESSAGE = 4
+TOKENS_REPLY_PRIMING = 3
+
+
+class ContextWindowBuilder:
+    """
+    基于 token 预算的上下文组装器
+
+    在模型上下文窗口减去回复预留（LLMConfig.max_tokens）后的预算内，
+    放入系统提示词和尽可能多的最新消息。消息的 token 数按消息ID缓存，
+    同一会话的后续轮次只需为新消息计数。
+    """
+
+    def __init__(self, cache_size: int = 10000):
+        self.cache_size = cache_size
+        self._token_cache: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._encodings: Dict[str, Any] = {}
+
+    def _get_encoding(self, model: str):
+        if model not in self._encodings:
+            try:
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    # 非 OpenAI 模型使用 cl100k_base 近似计数
+                    encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logger.warning(f"[ContextBuilder] 加载 tokenizer 失败，按字符估算: {str(e)}")
+                encoding = None
+            self._encodings[model] = encoding
+        return self._encodings[model]
+
+    def get_context_window(self, model: str) -> int:
+        """获取模型的上下文窗口大小"""
+        return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+    def count_tokens(self, text: str, model: str) -> int:
+        """统计文本的 token 数"""
+        encoding = self._get_encoding(model)
+        if encoding is None:
+            # 保守估计：中文约一个字符一个 token
+            return len(text)
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def count_message(self, message: Any, model: str) -> int:
+        """统计单条消息的 token 数，带ID的消息会被缓存"""
+        message_id = _get_field(message, "id")
+        if message_id is not None:
+            key = (str(message_id), model)
+            cached = self._token_cache.get(key)
+            if cached is not None:
+                self._token_cache.move_to_end(key)
+                return cached
+        tokens = self.count_tokens(_get_field(message, "content") or "", model) + TOKENS_PER_MESSAGE
+        if message_id is not None:
+            self._token_cache[key] = tokens
+            if len(self._token_cache) > self.cache_size:
+                self._token_cache.popitem(last=False)
+        return tokens
+
+    def get_budget(self, model: str, max_tokens: Optional[int] = None, system_message: Optional[str] = None) -> int:
+        """计算可用于历史消息的 token 预算"""
+        budget = self.get_context_window(model) - (max_tokens or 0) - TOKENS_REPLY_PRIMING
+        if system_message:
+            budget -= self.count_tokens(system_message, model) + TOKENS_PER_MESSAGE
+        return budget
+
+    def resolve_budget(self, llm_config: Optional[Any] = None, system_message: Optional[str] = None) -> Tuple[str, int]:
+        """根据 LLM 配置返回 (模型名, 历史消息 token 预算)"""
+        model = _get_field(llm_config, "model_name") or settings.DEFAULT_LLM_MODEL
+        return model, self.get_budget(model, _get_field(llm_config, "max_tokens"), system_message)
+
+    def build(
+        self,
+        messages: Sequence[Any],
+        llm_config: Optional[Any] = None,
+        system_message: Optional[str] = None,
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None
+    ) -> List[Dict[str, str]]:
+        """
+        从最新消息向前装填，直到用完 token 预算
+
+        messages 按时间升序排列，可以是 ORM 对象、pydantic 模型、具名元组或字典。
+        返回的历史不含系统提示词（由智能体自行添加），但预算已为其预留。
+        最新的一条消息总会被保留。
+        """
+        model = model or _get_field(llm_config, "model_name") or settings.DEFAULT_LLM_MODEL
+        if max_tokens is None:
+            max_tokens = _get_field(llm_config, "max_tokens")
+        budget = self.get_budget(model, max_tokens, system_message)
+
+        selected: List[Dict[str, str]] = []
+        used = 0
+        for message in reversed(messages):
+            tokens = self.count_message(message, model)
+            if selected and used + tokens > budget:
+                break
+            used += tokens
+            selected.append({
+                "role": _get_field(message, "role"),
+                "content": _get_field(message, "content"),
+            })
+        selected.reverse()
+
+        if used > budget:
+            logger.warning(f"[ContextBuilder] 最新消息超出预算: model={model}, used={used}, budget={budget}")
+        logger.info(f"[ContextBuilder] 组装上下文: model={model}, 消息 {len(selected)}/{len(messages)}, tokens={used}/{budget}")
+        return selected
+
+
+def _get_field(obj: Any, name: str) -> Any:
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+# 创建全局上下文组装器实例
+context_builder = ContextWindowBuilder(cache_size=settings.CONTEXT_TOKEN_CACHE_SIZE)
@@ -0,0 +1,198 @@
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator, AsyncGenerator, Awaitable, Callable
+from collections import deque
+import asyncio
+import time
+
+from app.core.logging import logger
+from app.services.context_builder import context_builder
+
+
+# 生成结束时的回调，参数为（已生成的内容，结束状态）
+FinishCallback = Callable[[str, str], Awaitable[None]]
+
+_END = object()
+
+
+class Generation:
+    """一次进行中的回复生成，在独立任务中消费上游流"""
+
+    def __init__(self, user_id: Any, session_id: str, model: str, max_tokens: int):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.model = model
+        self.max_tokens = max_tokens
+        self.parts: List[str] = []
+        self.status = "running"  # running / completed / cancelled / failed
+        self.cancel_reason: Optional[str] = None
+        self.cancel_requested_at: Optional[float] = None
+        self.error: Optional[BaseException] = None
+        self.started = time.monotonic()
+        self.queue: "asyncio.Queue[Any]" = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def content(self) -> str:
+        return "".join(self.parts)
+
+    @property
+    def done(self) -> bool:
+        return self.status != "running"
+
+    async def stream(self) -> AsyncGenerator[str, None]:
+        """逐块读取生成内容；取消后正常结束，上游出错时抛出异常"""
+        while True:
+            item = await self.queue.get()
+            if item is _END:
+                break
+            yield item
+        if self.error is not None:
+            raise self.error
+
+    async def result(self) -> str:
+        """等待生成结束（包括结束回调）并返回内容，取消时返回已生成的部分"""
+        await asyncio.shield(self.task)
+        if self.error is not None:
+            raise self.error
+        return self.content
+
+
+class GenerationRegistry:
+    """
+    按 (用户, 会话) 登记进行中的回复生成
+
+    生成在独立任务中运行，不受请求处理协程生命周期影响：/chat/stop、SSE 客户端断开、
+    WebSocket 关闭都通过取消该任务立即中断上游请求，已生成的部分回复由结束回调持久化。
+    """
+
+    def __init__(self):
+        self._generations: Dict[Tuple[str, str], List[Generation]] = {}
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled: Dict[str, int] = {}
+        self.tokens_generated_before_cancel = 0
+        self.tokens_saved = 0
+        self.cancel_latencies: "deque[float]" = deque(maxlen=1000)
+
+    @staticmethod
+    def _key(user_id: Any, session_id: str) -> Tuple[str, str]:
+        return str(user_id), str(session_id)
+
+    def start(
+        self,
+        user_id: Any,
+        session_id: str,
+        source: AsyncIterator[str],
+        on_finish: Optional[FinishCallback] = None,
+        llm_config: Any = None
+    ) -> Generation:
+        """登记并启动一次生成，llm_config 用于估算取消时节省的 token"""
+        generation = Generation(
+            user_id,
+            session_id,
+            model=getattr(llm_config, "model_name", ""),
+            max_tokens=getattr(llm_config, "max_tokens", 2000)
+        )
+        self._generations.setdefault(self._key(user_id, session_id), []).append(generation)
+        generation.task = asyncio.create_task(self._run(generation, source, on_finish))
+        self.started += 1
+        return generation
+
+    def get(self, user_id: Any, session_id: str) -> List[Generation]:
+        return list(self._generations.get(self._key(user_id, session_id), []))
+
+    def cancel(self, user_id: Any, session_id: str, reason: str = "stop") -> int:
+        """取消该用户在该会话中所有进行中的生成，返回取消的数量"""
+        count = 0
+        for generation in self.get(user_id, session_id):
+            if self.cancel_generation(generation, reason):
+                count += 1
+        return count
+
+    def cancel_generation(self, generation: Generation, reason: str) -> bool:
+        if generation.done or generation.cancel_requested_at is not None:
+            return False
+        generation.cancel_reason = reason
+        generation.cancel_requested_at = time.monotonic()
+        generation.task.cancel()
+        logger.info(f"[GenerationRegistry] 取消生成: session={generation.session_id}, 原因={reason}")
+        return True
+
+    async def _run(self, generation: Generation, source: AsyncIterator[str], on_finish: Optional[FinishCallback]) -> None:
+        try:
+            async for chunk in source:
+                generation.parts.append(chunk)
+                generation.queue.put_nowait(chunk)
+            generation.status = "completed"
+            self.completed += 1
+        except asyncio.CancelledError:
+            if generation.cancel_requested_at is None:
+                # 非本注册表发起的取消（如进程关闭），按断开处理
+                generation.cancel_reason = "shutdown"
+                generation.cancel_requested_at = time.monotonic()
+            generation.status = "cancelled"
+            self._record_cancel(generation)
+        except Exception as e:
+            generation.status = "failed"
+            generation.error = e
+            self.failed += 1
+        finally:
+            self._discard(generation)
+
+        try:
+            if on_finish is not None:
+                await on_finish(generation.content, generation.status)
+        except Exception as e:
+            logger.error(f"[GenerationRegistry] 保存生成结果失败: session={generation.session_id}, 错误={str(e)}")
+        finally:
+            generation.queue.put_nowait(_END)
+
+    def _record_cancel(self, generation: Generation) -> None:
+        reason = generation.cancel_reason or "stop"
+        self.cancelled[reason] = self.cancelled.get(reason, 0) + 1
+        self.cancel_latencies.append(time.monotonic() - generation.cancel_requested_at)
+        produced = context_builder.count_tokens(generation.content, generation.model) if generation.parts else 0
+        self.tokens_generated_before_cancel += produced
+        # 以最大回复长度为上限估算节省的 token
+        self.tokens_saved += max(0, generation.max_tokens - produced)
+
+    def _discard(self, generation: Generation) -> None:
+        key = self._key(generation.user_id, generation.session_id)
+        generations = self._generations.get(key)
+        if generations and generation in generations:
+            generations.remove(generation)
+            if not generations:
+                del self._generations[key]
+
+    async def aclose(self) -> None:
+        """进程关闭时取消所有进行中的生成，并等待部分回复保存完成"""
+        generations = [g for items in self._generations.values() for g in items]
+        for generation in generations:
+            self.cancel_generation(generation, "shutdown")
+        if generations:
+            await asyncio.gather(*(g.task for g in generations), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self.cancel_latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+        return {
+            "in_flight": sum(len(items) for items in self._generations.values()),
+            "started": self.started,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": dict(self.cancelled),
+            "cancel_latency_ms_p50": percentile(0.5),
+            "cancel_latency_ms_p95": percentile(0.95),
+            "cancel_latency_ms_max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            "tokens_generated_before_cancel": self.tokens_generated_before_cancel,
+            "tokens_saved_estimate": self.tokens_saved,
+        }
+
+
+# 创建全局生成登记实例
+generation_registry = GenerationRegistry()
@@ -0,0 +1,193 @@
+from typing import Dict, Any, Optional, Sequence
+from collections import deque, OrderedDict
+import time
+
+from app.core.config import settings
+from app.core.logging import logger
+
+
+# 每条缓存消息除内容外的估算开销（对象、字段、时间戳等）
+MESSAGE_OVERHEAD_BYTES = 200
+
+
+class SessionHistory:
+    """单个会话最近消息的环形缓冲区"""
+
+    def __init__(self, max_messages: int):
+        self.messages: "deque[Any]" = deque(maxlen=max_messages)
+        # 缓冲区之前是否还有更早的消息（只能从数据库读取）
+        self.truncated = False
+        self.bytes = 0
+        self.last_access = time.monotonic()
+
+    def append(self, message: Any) -> int:
+        """追加一条消息，返回占用字节的变化"""
+        delta = _message_bytes(message)
+        if len(self.messages) == self.messages.maxlen:
+            delta -= _message_bytes(self.messages[0])
+            self.truncated = True
+        self.messages.append(message)
+        self.bytes += delta
+        return delta
+
+
+class HistoryCache:
+    """
+    会话历史缓存
+
+    为活跃会话在内存中保留最近 max_messages 条消息，保存消息时同步写入（write-through），
+    组装上下文时命中即可不读数据库。按最近访问做 LRU 淘汰，空闲超过 idle_ttl 的会话过期，
+    全部会话的估算内存不超过 max_bytes。会话删除或更新时失效。
+    max_bytes 为 0 时禁用缓存。
+    """
+
+    def __init__(self, max_messages: int, max_bytes: int, idle_ttl: float):
+        self.max_messages = max(1, max_messages)
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._sessions: "OrderedDict[str, SessionHistory]" = OrderedDict()
+        self._bytes = 0
+        # 正在从数据库加载的会话（计数）及加载期间发生过写入的会话
+        self._loading: Dict[str, int] = {}
+        self._dirty: set = set()
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: str) -> Optional[SessionHistory]:
+        """返回会话的缓冲区并刷新访问时间，未缓存或已过期时返回 None"""
+        self._expire()
+        history = self._sessions.get(session_id)
+        if history is not None:
+            history.last_access = time.monotonic()
+            self._sessions.move_to_end(session_id)
+        return history
+
+    def record(self, hit: bool, partial: bool = False) -> None:
+        if not hit:
+            self.misses += 1
+        elif partial:
+            self.partial_hits += 1
+        else:
+            self.hits += 1
+
+    def create(self, session_id: str) -> None:
+        """新建会话时登记空缓冲区（没有更早的历史）"""
+        if self.enabled:
+            self._store(session_id, SessionHistory(self.max_messages))
+
+    def begin_load(self, session_id: str) -> None:
+        """开始从数据库加载会话历史，期间的写入会使本次加载结果作废"""
+        self._loading[session_id] = self._loading.get(session_id, 0) + 1
+
+    def finish_load(self, session_id: str, messages: Sequence[Any], truncated: bool) -> None:
+        """
+        结束加载并缓存结果
+
+        messages 按时间升序，truncated 表示数据库中还有更早的消息。
+        加载期间会话有写入或失效时不缓存，避免缺少这些消息。
+        """
+        count = self._loading.get(session_id, 0) - 1
+        if count > 0:
+            self._loading[session_id] = count
+            dirty = session_id in self._dirty
+        else:
+            self._loading.pop(session_id, None)
+            dirty = session_id in self._dirty
+            self._dirty.discard(session_id)
+        if dirty or not self.enabled or session_id in self._sessions:
+            return
+
+        history = SessionHistory(self.max_messages)
+        for message in messages:
+            history.append(message)
+        history.truncated = history.truncated or truncated
+        self._store(session_id, history)
+
+    def append(self, session_id: str, message: Any) -> None:
+        """保存消息时写入已缓存的会话"""
+        if session_id in self._loading:
+            self._dirty.add(session_id)
+        history = self._sessions.get(session_id)
+        if history is None:
+            return
+        self._bytes += history.append(message)
+        self._evict()
+
+    def invalidate(self, session_id: str) -> None:
+        """会话删除或更新时丢弃缓存"""
+        if session_id in self._loading:
+            self._dirty.add(session_id)
+        history = self._sessions.pop(session_id, None)
+        if history is not None:
+            self._bytes -= history.bytes
+            self.invalidations += 1
+
+    def _store(self, session_id: str, history: SessionHistory) -> None:
+        previous = self._sessions.pop(session_id, None)
+        if previous is not None:
+            self._bytes -= previous.bytes
+        self._sessions[session_id] = history
+        self._bytes += history.bytes
+        self._expire()
+        self._evict()
+
+    def _expire(self) -> None:
+        # 按访问时间排序，过期的会话都在队首
+        deadline = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            session_id, history = next(iter(self._sessions.items()))
+            if history.last_access >= deadline:
+                break
+            self._sessions.popitem(last=False)
+            self._bytes -= history.bytes
+            self.expirations += 1
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._sessions:
+            session_id, history = self._sessions.popitem(last=False)
+            self._bytes -= history.bytes
+            self.evictions += 1
+            logger.debug(f"[HistoryCache] 淘汰会话缓存: session={session_id}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.partial_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "sessions": len(self._sessions),
+            "messages": sum(len(history.messages) for history in self._sessions.values()),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "max_messages_per_session": self.max_messages,
+            "idle_ttl_seconds": self.idle_ttl,
+            "hits": self.hits,
+            "partial_hits": self.partial_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.partial_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+def _message_bytes(message: Any) -> int:
+    content = getattr(message, "content", "") or ""
+    return len(content.encode("utf-8")) + MESSAGE_OVERHEAD_BYTES
+
+
+# 创建全局会话历史缓存实例
+history_cache = HistoryCache(
+    max_messages=settings.HISTORY_CACHE_MAX_MESSAGES,
+    max_bytes=settings.HISTORY_CACHE_MAX_BYTES,
+    idle_ttl=settings.HISTORY_CACHE_IDLE_TTL
+)
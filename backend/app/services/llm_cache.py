@@ -0,0 +1,217 @@
+from typing import List, Dict, Any, Optional, AsyncGenerator
+from collections import OrderedDict
+from abc import ABC, abstractmethod
+import asyncio
+import hashlib
+import json
+import re
+import time
+
+from app.core.config import settings
+from app.core.logging import logger
+
+
+class CacheBackend(ABC):
+    """响应缓存存储后端接口，可替换为 Redis 等共享存储"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[List[str]]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, chunks: List[str], ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def clear(self) -> None:
+        ...
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoryCacheBackend(CacheBackend):
+    """进程内缓存：LRU + TTL 淘汰，并限制总字节数"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (过期时间, 字节数, 分片列表)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, key: str) -> Optional[List[str]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, _, chunks = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return chunks
+
+    async def set(self, key: str, chunks: List[str], ttl: float) -> None:
+        size = sum(len(chunk.encode("utf-8")) for chunk in chunks)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, size, list(chunks))
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    async def delete(self, key: str) -> None:
+        if key in self._entries:
+            self._remove(key)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _normalize(text: Optional[str]) -> str:
+    return _WHITESPACE_RE.sub(" ", text or "").strip()
+
+
+def request_fingerprint(
+    provider: str,
+    model: str,
+    temperature: float,
+    messages: List[Any],
+    history_window: Optional[int] = None,
+    endpoint: Optional[str] = None,
+    max_tokens: Optional[int] = None
+) -> str:
+    """
+    计算规范化的请求指纹
+
+    系统提示词总是参与计算；history_window 为 None 时使用完整历史，
+    否则只取末尾若干条非系统消息。endpoint 标识上游端点（地址、密钥哈希等），
+    使不同用户的端点和密钥不会共享回复；max_tokens 不同时回复可能被截断在不同位置，也参与计算。
+    """
+    system = [m for m in messages if m.role == "system"]
+    history = [m for m in messages if m.role != "system"]
+    if history_window is not None:
+        history = history[-history_window:]
+    payload = {
+        "provider": getattr(provider, "value", provider),
+        "model": model,
+        "temperature": round(float(temperature), 2),
+        "system": [_normalize(m.content) for m in system],
+        "history": [[m.role, _normalize(m.content)] for m in history],
+    }
+    if endpoint is not None:
+        payload["endpoint"] = endpoint
+    if max_tokens is not None:
+        payload["max_tokens"] = int(max_tokens)
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    LLM 流式响应缓存
+
+    以 (提供商, 模型, 上游端点, 系统提示词, 末尾若干条历史, 温度, 最大回复长度) 的规范化指纹为键，
+    缓存完整回复的分片序列，命中时按分片重新流式输出，调用方无感知。
+    """
+
+    def __init__(self, backend: CacheBackend, enabled: bool, ttl: float, history_window: int):
+        self.backend = backend
+        self.enabled = enabled
+        self.ttl = ttl
+        self.history_window = history_window
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def make_key(
+        self,
+        provider: str,
+        model: str,
+        temperature: float,
+        messages: List[Any],
+        endpoint: Optional[str] = None,
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """计算请求指纹；系统提示词总是参与计算，历史只取末尾窗口"""
+        return request_fingerprint(provider, model, temperature, messages, self.history_window, endpoint, max_tokens)
+
+    async def get(self, key: str) -> Optional[List[str]]:
+        try:
+            chunks = await self.backend.get(key)
+        except Exception as e:
+            logger.error(f"[LLMResponseCache] 读取缓存失败: {str(e)}")
+            chunks = None
+        if chunks is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return chunks
+
+    async def set(self, key: str, chunks: List[str]) -> None:
+        if not chunks:
+            return
+        try:
+            await self.backend.set(key, chunks, self.ttl)
+            self.stores += 1
+        except Exception as e:
+            logger.error(f"[LLMResponseCache] 写入缓存失败: {str(e)}")
+
+    async def replay(self, chunks: List[str]) -> AsyncGenerator[str, None]:
+        """按原始分片重放缓存的回复"""
+        for chunk in chunks:
+            yield chunk
+            await asyncio.sleep(0)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            **self.backend.stats(),
+        }
+
+
+# 创建全局响应缓存实例
+llm_response_cache = LLMResponseCache(
+    backend=MemoryCacheBackend(
+        max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+        max_bytes=settings.LLM_CACHE_MAX_BYTES
+    ),
+    enabled=settings.LLM_CACHE_ENABLED,
+    ttl=settings.LLM_CACHE_TTL,
+    history_window=settings.LLM_CACHE_HISTORY_WINDOW
+)
@@ -0,0 +1,145 @@
+from typing import Dict, Any, Optional, Tuple
+import asyncio
+import hashlib
+import time
+from urllib.parse import urlparse
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.core.config import settings
+from app.core.logging import logger
+
+try:  # HTTP/2 依赖 h2 包，未安装时自动回退到 HTTP/1.1
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+ClientKey = Tuple[str, str, str]
+
+
+class _PooledClient:
+    """单个上游对应的共享客户端及其统计信息"""
+
+    def __init__(self, provider: str, base_url: str, http_client: httpx.AsyncClient, client: AsyncOpenAI, http2: bool):
+        self.provider = provider
+        self.base_url = base_url
+        self.http_client = http_client
+        self.client = client
+        self.http2 = http2
+        self.created_at = time.time()
+        self.requests = 0
+        self.responses = 0
+
+    def pool_connections(self) -> Dict[str, int]:
+        """读取底层 httpcore 连接池中的连接状态"""
+        pool = getattr(getattr(self.http_client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None) or []
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {"total": len(connections), "idle": idle, "active": len(connections) - idle}
+
+
+class LLMClientRegistry:
+    """
+    进程级的 LLM 客户端注册表
+
+    按 (provider, base_url, api_key) 复用 AsyncOpenAI 客户端，同一上游共享一个
+    经过调优的 httpx 连接池，避免每轮对话都重新建立 TLS 连接。
+    """
+
+    def __init__(self):
+        self._clients: Dict[ClientKey, _PooledClient] = {}
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _make_key(provider: str, base_url: Optional[str], api_key: Optional[str]) -> ClientKey:
+        # 不在内存键中保存明文密钥
+        key_hash = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+        return (provider, base_url or "", key_hash)
+
+    @staticmethod
+    def _use_http2(base_url: Optional[str]) -> bool:
+        """仅对 https 上游启用 HTTP/2（本地 Ollama 等明文上游不支持 h2c）"""
+        if not settings.LLM_HTTP2_ENABLED or not HTTP2_AVAILABLE:
+            return False
+        scheme = urlparse(base_url).scheme if base_url else "https"
+        return scheme == "https"
+
+    def _build(self, provider: str, base_url: Optional[str], api_key: Optional[str]) -> _PooledClient:
+        http2 = self._use_http2(base_url)
+        pooled: Optional[_PooledClient] = None
+
+        async def on_request(request: httpx.Request) -> None:
+            pooled.requests += 1
+
+        async def on_response(response: httpx.Response) -> None:
+            pooled.responses += 1
+
+        http_client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                settings.LLM_HTTP_READ_TIMEOUT,
+                connect=settings.LLM_HTTP_CONNECT_TIMEOUT,
+            ),
+            event_hooks={"request": [on_request], "response": [on_response]},
+        )
+        client = AsyncOpenAI(
+            # Ollama 不校验密钥，但 SDK 要求非空
+            api_key=api_key or "EMPTY",
+            base_url=base_url or None,
+            http_client=http_client,
+        )
+        pooled = _PooledClient(provider, base_url or "", http_client, client, http2)
+        logger.info(f"[LLMClientRegistry] 创建共享客户端: provider={provider}, base_url={base_url}, http2={http2}")
+        return pooled
+
+    def get_client(self, provider: str, base_url: Optional[str] = None, api_key: Optional[str] = None) -> AsyncOpenAI:
+        """获取（必要时创建）指定上游的共享客户端"""
+        key = self._make_key(provider, base_url, api_key)
+        pooled = self._clients.get(key)
+        if pooled is None or pooled.http_client.is_closed:
+            pooled = self._build(provider, base_url, api_key)
+            self._clients[key] = pooled
+        return pooled.client
+
+    def stats(self) -> Dict[str, Any]:
+        """返回各上游连接池的统计信息"""
+        return {
+            "clients": len(self._clients),
+            "http2_available": HTTP2_AVAILABLE,
+            "upstreams": [
+                {
+                    "provider": pooled.provider,
+                    "base_url": pooled.base_url,
+                    "http2": pooled.http2,
+                    "age_seconds": round(time.time() - pooled.created_at, 1),
+                    "requests": pooled.requests,
+                    "responses": pooled.responses,
+                    "connections": pooled.pool_connections(),
+                }
+                for pooled in self._clients.values()
+            ],
+        }
+
+    async def aclose(self) -> None:
+        """关闭所有共享连接池（应用关闭时调用）"""
+        async with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for pooled in clients:
+            try:
+                await pooled.http_client.aclose()
+            except Exception as e:
+                logger.error(f"[LLMClientRegistry] 关闭客户端失败: {str(e)}")
+        logger.info(f"[LLMClientRegistry] 已关闭 {len(clients)} 个共享客户端")
+
+
+# 创建全局客户端注册表实例
+llm_client_registry = LLMClientRegistry()
@@ -1,9 +1,25 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
+from collections import OrderedDict
+import time
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from app.core.config import settings
 from app.models.llm_config import LLMConfig
-from app.schemas.llm_config import LLMConfigCreate, LLMConfigUpdate
+from app.schemas.llm_config import LLMConfigCreate, LLMConfigUpdate, ResolvedLLMConfig
 
 class LLMConfigService:
+    def __init__(self, cache_ttl: float = 0.0, cache_max_users: int = 0):
+        # 按用户缓存解析后的默认配置，配置增删改时失效；TTL 兜底其他进程的修改
+        self.cache_ttl = cache_ttl
+        self.cache_max_users = cache_max_users
+        self._default_cache: "OrderedDict[int, Tuple[ResolvedLLMConfig, float]]" = OrderedDict()
+        # 每次失效递增，查询期间发生失效时不写入缓存
+        self._generation = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_invalidations = 0
+
     def get_config_by_id(self, db: Session, config_id: int) -> Optional[LLMConfig]:
         """
         通过ID获取LLM配置
@@ -35,14 +51,6 @@ class LLMConfigService:
             ).first()
             
             if config:
-                print(f"找到用户的默认配置: {config.__dict__}")
-                # 确保所有必要的字段都被正确设置
-                config.model = config.model_name
-                config.api_base = config.api_base_url
-                config.api_key = config.api_key
-                config.provider = config.provider
-                config.temperature = 0.7  # 默认温度
-                config.max_tokens = 2000  # 默认最大token数
                 return config
             
             # 如果没有默认配置，获取第一个配置
@@ -51,19 +59,12 @@ class LLMConfigService:
             ).first()
             
             if config:
-                print(f"找到用户的第一个配置: {config.__dict__}")
                 # 设置为默认配置
                 config.is_default = True
                 db.commit()
                 db.refresh(config)
+                self.invalidate_default_config(user_id)
                 
-                # 确保所有必要的字段都被正确设置
-                config.model = config.model_name
-                config.api_base = config.api_base_url
-                config.api_key = config.api_key
-                config.provider = config.provider
-                config.temperature = 0.7  # 默认温度
-                config.max_tokens = 2000  # 默认最大token数
                 return config
             
             print(f"用户 {user_id} 没有任何LLM配置")
@@ -73,6 +74,65 @@ class LLMConfigService:
             print(f"获取默认配置失败: {str(e)}")
             return None
 
+    async def get_default_config_async(self, db: AsyncSession, user_id: int) -> Optional[ResolvedLLMConfig]:
+        """
+        获取用户解析后的默认LLM配置（异步会话版本），优先读取缓存
+        """
+        cached = self._default_cache.get(user_id)
+        if cached is not None and cached[1] > time.monotonic():
+            self.cache_hits += 1
+            self._default_cache.move_to_end(user_id)
+            return cached[0]
+        self.cache_misses += 1
+
+        generation = self._generation
+        try:
+            result = await db.execute(
+                select(LLMConfig).where(LLMConfig.user_id == user_id, LLMConfig.is_default == True).limit(1)
+            )
+            config = result.scalars().first()
+            if not config:
+                # 如果没有默认配置，将第一个配置设为默认
+                result = await db.execute(select(LLMConfig).where(LLMConfig.user_id == user_id).limit(1))
+                config = result.scalars().first()
+                if config:
+                    config.is_default = True
+                    await db.commit()
+
+            if not config:
+                print(f"用户 {user_id} 没有任何LLM配置")
+                return None
+
+            resolved = ResolvedLLMConfig.model_validate(config)
+            if generation == self._generation and self.cache_ttl > 0:
+                self._default_cache[user_id] = (resolved, time.monotonic() + self.cache_ttl)
+                self._default_cache.move_to_end(user_id)
+                while len(self._default_cache) > self.cache_max_users:
+                    self._default_cache.popitem(last=False)
+            return resolved
+
+        except Exception as e:
+            print(f"获取默认配置失败: {str(e)}")
+            return None
+
+    def invalidate_default_config(self, user_id: int) -> None:
+        """用户的配置发生变化时丢弃缓存的默认配置"""
+        self._generation += 1
+        self.cache_invalidations += 1
+        self._default_cache.pop(user_id, None)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "users": len(self._default_cache),
+            "max_users": self.cache_max_users,
+            "ttl_seconds": self.cache_ttl,
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hit_rate": round(self.cache_hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.cache_invalidations,
+        }
+
     def create_config(self, db: Session, config_in: LLMConfigCreate, user_id: int) -> LLMConfig:
         """
         创建新的LLM配置
@@ -104,6 +164,7 @@ class LLMConfigService:
         db.add(db_config)
         db.commit()
         db.refresh(db_config)
+        self.invalidate_default_config(user_id)
         return db_config
 
     def update_config(self, db: Session, db_config: LLMConfig, config_in: LLMConfigUpdate) -> LLMConfig:
@@ -125,6 +186,7 @@ class LLMConfigService:
         
         db.commit()
         db.refresh(db_config)
+        self.invalidate_default_config(db_config.user_id)
         return db_config
 
     def delete_config(self, db: Session, db_config: LLMConfig) -> None:
@@ -142,8 +204,10 @@ class LLMConfigService:
                 other_config.is_default = True
                 db.add(other_config)
         
+        user_id = db_config.user_id
         db.delete(db_config)
         db.commit()
+        self.invalidate_default_config(user_id)
 
     def get_available_providers(self) -> Dict[str, Any]:
         """
@@ -177,7 +241,10 @@ class LLMConfigService:
         }
 
 # 创建LLMConfigService的实例
-llm_config_service = LLMConfigService()
+llm_config_service = LLMConfigService(
+    cache_ttl=settings.LLM_CONFIG_CACHE_TTL,
+    cache_max_users=settings.LLM_CONFIG_CACHE_MAX_USERS
+)
 
 # 导出服务实例和系统提示
 __all__ = ["llm_config_service", "CUSTOMER_SERVICE_SYSTEM_PROMPT"]
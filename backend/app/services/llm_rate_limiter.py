@@ -0,0 +1,189 @@
+from typing import Dict, Any, Tuple
+from collections import deque
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import time
+
+from app.core.config import settings
+from app.core.logging import logger
+
+
+class LLMCapacityError(Exception):
+    """上游容量不足：排队已满或等待超时"""
+    pass
+
+
+class TokenBucket:
+    """按分钟配额匀速补充的令牌桶"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float, deadline: float) -> None:
+        # 单次请求超过桶容量时按满桶扣除，避免永远无法满足
+        amount = min(float(amount), self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            wait = (amount - self.tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                raise LLMCapacityError("上游请求配额不足，等待超时")
+            await asyncio.sleep(wait)
+
+
+class _ProviderLimiter:
+    """单个 (provider, model) 的并发槽位 + 配额桶，等待者按 FIFO 公平排队"""
+
+    def __init__(self, key: str, concurrency: int, rpm: int, tpm: int, max_queue: int, timeout: float):
+        self.key = key
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self.active = 0
+        self.waiters: "deque[asyncio.Future]" = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.wait_times: "deque[float]" = deque(maxlen=1000)
+
+    async def acquire(self, tokens: int) -> None:
+        start = time.monotonic()
+        deadline = start + self.timeout
+
+        if self.active < self.concurrency and not self.waiters:
+            self.active += 1
+        else:
+            if len(self.waiters) >= self.max_queue:
+                self.rejected += 1
+                raise LLMCapacityError(f"上游 {self.key} 排队已满，请稍后重试")
+            future = asyncio.get_running_loop().create_future()
+            self.waiters.append(future)
+            try:
+                await asyncio.wait_for(future, self.timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if future.done() and not future.cancelled():
+                    # 超时/取消的同时已被分配槽位，归还它
+                    self.release()
+                else:
+                    try:
+                        self.waiters.remove(future)
+                    except ValueError:
+                        pass
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timeouts += 1
+                    raise LLMCapacityError(f"上游 {self.key} 排队等待超时")
+                raise
+
+        try:
+            if self.request_bucket:
+                await self.request_bucket.acquire(1, deadline)
+            if self.token_bucket and tokens:
+                await self.token_bucket.acquire(tokens, deadline)
+        except BaseException as e:
+            self.release()
+            if isinstance(e, LLMCapacityError):
+                self.timeouts += 1
+            raise
+
+        self.admitted += 1
+        self.wait_times.append(time.monotonic() - start)
+
+    def release(self) -> None:
+        # 直接把槽位交给队首等待者，保证先来先服务
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self.wait_times)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(len(waits) * p))] * 1000, 1)
+
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "queue_depth": len(self.waiters),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "wait_ms_p50": percentile(0.5),
+            "wait_ms_p95": percentile(0.95),
+            "wait_ms_max": round(waits[-1] * 1000, 1) if waits else 0.0,
+            "request_tokens_available": round(self.request_bucket.tokens, 1) if self.request_bucket else None,
+            "token_tokens_available": round(self.token_bucket.tokens, 1) if self.token_bucket else None,
+        }
+
+
+class LLMRateLimiter:
+    """
+    按 (provider, model) 限制上游并发和每分钟请求数/token 数
+
+    LLM_RATE_LIMITS 为 JSON，键可以是 "provider" 或 "provider:model"，
+    值可包含 concurrency、rpm、tpm、max_queue、timeout，未配置的项使用全局默认值。
+    """
+
+    def __init__(self, limits: Dict[str, Dict[str, Any]]):
+        self.limits = limits
+        self._limiters: Dict[Tuple[str, str], _ProviderLimiter] = {}
+
+    def _get(self, provider: str, model: str) -> _ProviderLimiter:
+        key = (provider, model)
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            options = {
+                "concurrency": settings.LLM_DEFAULT_CONCURRENCY,
+                "rpm": settings.LLM_DEFAULT_RPM,
+                "tpm": settings.LLM_DEFAULT_TPM,
+                "max_queue": settings.LLM_QUEUE_MAX_DEPTH,
+                "timeout": settings.LLM_QUEUE_TIMEOUT,
+            }
+            options.update(self.limits.get(provider, {}))
+            options.update(self.limits.get(f"{provider}:{model}", {}))
+            limiter = _ProviderLimiter(f"{provider}:{model}", **options)
+            self._limiters[key] = limiter
+        return limiter
+
+    @asynccontextmanager
+    async def limit(self, provider: str, model: str, tokens: int = 0):
+        """占用一个上游并发槽位（必要时排队），退出时归还"""
+        limiter = self._get(getattr(provider, "value", provider), model)
+        await limiter.acquire(tokens)
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {limiter.key: limiter.stats() for limiter in self._limiters.values()}
+
+
+def _load_limits(raw: str) -> Dict[str, Dict[str, Any]]:
+    try:
+        return json.loads(raw) if raw else {}
+    except json.JSONDecodeError as e:
+        logger.error(f"[LLMRateLimiter] LLM_RATE_LIMITS 配置无效，使用默认限制: {str(e)}")
+        return {}
+
+
+# 创建全局限流器实例
+llm_rate_limiter = LLMRateLimiter(_load_limits(settings.LLM_RATE_LIMITS))
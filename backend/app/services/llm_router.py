@@ -0,0 +1,229 @@
+from typing import List, Dict, Any, Optional, Tuple, Callable, AsyncIterator, AsyncGenerator
+from collections import deque
+import asyncio
+import json
+import time
+
+from app.core.config import settings
+from app.core.logging import logger
+
+
+StreamFactory = Callable[[], AsyncIterator[str]]
+
+
+class BackendHealth:
+    """单个后端的滚动 TTFT 与错误率统计"""
+
+    def __init__(self, key: str, window: int):
+        self.key = key
+        self.ttfts: "deque[float]" = deque(maxlen=window)
+        self.outcomes: "deque[bool]" = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.ttfts:
+            return None
+        values = sorted(self.ttfts)
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def is_open(self) -> bool:
+        """熔断中：连续失败过多，冷却期内不参与路由"""
+        return self.open_until > time.monotonic()
+
+    def score(self) -> float:
+        """越小越健康；尚无样本的后端得分为 0，以便获得探测流量"""
+        p50 = self.percentile(0.5) or 0.0
+        return p50 * (1 + 4 * self.error_rate())
+
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate(), 4),
+            "ttft_ms_p50": round(p50 * 1000, 1) if p50 is not None else None,
+            "ttft_ms_p95": round(p95 * 1000, 1) if p95 is not None else None,
+            "circuit_open": self.is_open(),
+            "hedges": self.hedges,
+            "wins": self.wins,
+        }
+
+
+class _Attempt:
+    """对单个后端发起的一次流式请求，先等待首个分片"""
+
+    def __init__(self, key: str, factory: StreamFactory):
+        self.key = key
+        self.started = time.monotonic()
+        self.stream = factory()
+        self.first = asyncio.ensure_future(self.stream.__anext__())
+
+    async def aclose(self) -> None:
+        if not self.first.done():
+            self.first.cancel()
+        try:
+            await self.first
+        except BaseException:
+            pass
+        try:
+            await self.stream.aclose()
+        except BaseException:
+            pass
+
+
+class LLMRouter:
+    """
+    基于延迟的后端路由
+
+    LLM_ROUTER_GROUPS 定义可互相替代的后端组，如
+    {"chat": ["openai:default", "deepseek:default"]}。请求会优先发往 TTFT 最低、
+    错误率最低的后端；首个分片前失败会回退到下一个后端。开启对冲后，若首个后端
+    在基于 p95 TTFT 的期限内没有产出分片，则并行向下一个后端发起请求，
+    先产出分片的一方胜出，另一方被取消。
+    """
+
+    def __init__(self, groups: Dict[str, List[str]], hedge_enabled: bool):
+        self.groups = groups
+        self.hedge_enabled = hedge_enabled
+        self._health: Dict[str, BackendHealth] = {}
+
+    def health(self, key: str) -> BackendHealth:
+        if key not in self._health:
+            self._health[key] = BackendHealth(key, settings.LLM_ROUTER_WINDOW)
+        return self._health[key]
+
+    def group_for(self, provider: str, model_key: str) -> Optional[List[Tuple[str, str]]]:
+        """返回包含该后端的等价后端组，未配置时返回 None"""
+        key = f"{getattr(provider, 'value', provider)}:{model_key}"
+        for members in self.groups.values():
+            if key in members:
+                return [tuple(member.split(":", 1)) for member in members]
+        return None
+
+    def rank(self, keys: List[str]) -> List[str]:
+        """按健康度排序，熔断中的后端排在最后"""
+        return sorted(keys, key=lambda key: (self.health(key).is_open(), self.health(key).score()))
+
+    def hedge_delay(self, key: str) -> float:
+        p95 = self.health(key).percentile(0.95)
+        if p95 is None:
+            return settings.LLM_HEDGE_DEFAULT_DELAY
+        return min(max(p95 * settings.LLM_HEDGE_P95_FACTOR, settings.LLM_HEDGE_MIN_DELAY), settings.LLM_HEDGE_MAX_DELAY)
+
+    def record_success(self, key: str, ttft: Optional[float]) -> None:
+        health = self.health(key)
+        health.outcomes.append(True)
+        health.consecutive_failures = 0
+        if ttft is not None:
+            health.ttfts.append(ttft)
+
+    def record_error(self, key: str, error: BaseException) -> None:
+        health = self.health(key)
+        health.errors += 1
+        health.outcomes.append(False)
+        health.consecutive_failures += 1
+        if health.consecutive_failures >= settings.LLM_ROUTER_FAILURE_THRESHOLD:
+            health.open_until = time.monotonic() + settings.LLM_ROUTER_COOLDOWN
+            logger.warning(f"[LLMRouter] 后端 {key} 连续失败 {health.consecutive_failures} 次，暂停路由")
+        logger.warning(f"[LLMRouter] 后端 {key} 请求失败: {str(error)}")
+
+    async def stream(self, backends: List[Tuple[str, StreamFactory]]) -> AsyncGenerator[str, None]:
+        """在多个等价后端之间路由（及对冲）一次流式请求"""
+        factories = dict(backends)
+        pending = self.rank(list(factories.keys()))
+        attempts: List[_Attempt] = []
+        winner: Optional[_Attempt] = None
+        first_chunk: Optional[str] = None
+        last_error: Optional[BaseException] = None
+
+        def start_next() -> None:
+            key = pending.pop(0)
+            self.health(key).requests += 1
+            attempts.append(_Attempt(key, factories[key]))
+
+        start_next()
+        hedge_delay = self.hedge_delay(attempts[0].key) if self.hedge_enabled and pending else None
+        try:
+            while attempts and winner is None:
+                done, _ = await asyncio.wait(
+                    [attempt.first for attempt in attempts],
+                    timeout=hedge_delay,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # 首个分片超时未到达，向下一个后端发起对冲请求
+                    self.health(pending[0]).hedges += 1
+                    logger.info(f"[LLMRouter] {attempts[0].key} 超过 {hedge_delay:.2f}s 未产出分片，对冲到 {pending[0]}")
+                    start_next()
+                    hedge_delay = None
+                    continue
+
+                for attempt in [a for a in attempts if a.first in done]:
+                    error = attempt.first.exception()
+                    if error is None or isinstance(error, StopAsyncIteration):
+                        winner = attempt
+                        first_chunk = None if error else attempt.first.result()
+                        break
+                    attempts.remove(attempt)
+                    last_error = error
+                    self.record_error(attempt.key, error)
+                    await attempt.aclose()
+
+                if winner is None and not attempts and pending:
+                    # 所有进行中的请求都失败了，回退到下一个后端
+                    start_next()
+                    hedge_delay = None
+
+            if winner is None:
+                raise last_error or RuntimeError("没有可用的LLM后端")
+
+            # 取消输掉竞争的请求
+            for attempt in attempts:
+                if attempt is not winner:
+                    await attempt.aclose()
+            attempts = [winner]
+            ttft = time.monotonic() - winner.started
+            self.health(winner.key).wins += 1
+
+            if first_chunk is not None:
+                yield first_chunk
+                try:
+                    async for chunk in winner.stream:
+                        yield chunk
+                except Exception as e:
+                    self.record_error(winner.key, e)
+                    raise
+            self.record_success(winner.key, ttft if first_chunk is not None else None)
+        finally:
+            for attempt in attempts:
+                await attempt.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "groups": self.groups,
+            "hedge_enabled": self.hedge_enabled,
+            "backends": {key: health.stats() for key, health in self._health.items()},
+        }
+
+
+def _load_groups(raw: str) -> Dict[str, List[str]]:
+    try:
+        return json.loads(raw) if raw else {}
+    except json.JSONDecodeError as e:
+        logger.error(f"[LLMRouter] LLM_ROUTER_GROUPS 配置无效，禁用路由: {str(e)}")
+        return {}
+
+
+# 创建全局路由器实例
+llm_router = LLMRouter(_load_groups(settings.LLM_ROUTER_GROUPS), settings.LLM_HEDGE_ENABLED)
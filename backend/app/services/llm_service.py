@@ -1,16 +1,23 @@
 from typing import List, Dict, Any, AsyncGenerator, Union, Optional
 import json
-import asyncio
+import hashlib
+import time
 import os
 from enum import Enum
 from pydantic import BaseModel
-from openai import AsyncOpenAI
 import uuid
 import logging
 from datetime import datetime
 
 from app.core.config import settings
 from app.core.logging import logger
+from app.services.llm_client_pool import llm_client_registry
+from app.services.llm_cache import llm_response_cache, request_fingerprint
+from app.services.llm_singleflight import llm_singleflight
+from app.services.llm_rate_limiter import llm_rate_limiter
+from app.services.context_builder import context_builder
+from app.services.llm_router import llm_router
+from app.services.mock_llm import MockProfile, mock_llm_backend
 
 class LLMProvider(str, Enum):
     OPENAI = "openai"
@@ -31,6 +38,7 @@ class LLMConfig(BaseModel):
     api_base: Optional[str] = None
     temperature: float = 0.7
     max_tokens: int = 2000
+    mock: Optional[MockProfile] = None  # 模拟提供商的行为参数
 
 
 DEFAULT_SYSTEM_MESSAGE = "你是一个智能客服助手，提供专业、准确、友好的回答。"
@@ -39,76 +47,151 @@ DEFAULT_SYSTEM_MESSAGE = "你是一个智能客服助手，提供专业、准确
 class LLMService:
     """大模型服务抽象层，统一不同LLM的API接口"""
     
-    def __init__(self, provider: LLMProvider = LLMProvider.OPENAI, model_key: str = "gpt-3.5-turbo"):
+    def __init__(
+        self,
+        provider: LLMProvider = LLMProvider.OPENAI,
+        model_key: str = "gpt-3.5-turbo",
+        config: Optional[LLMConfig] = None
+    ):
         self.provider = provider
         self.model_key = model_key
         self.client = None
-        self.config = DEFAULT_MODEL_CONFIGS[provider][model_key]
+        self.config = config or DEFAULT_MODEL_CONFIGS[provider][model_key]
         self.setup_client()
         logger.info(f"[LLMService] 初始化LLM服务: 提供商={provider}, 模型={model_key}")
     
-    def setup_client(self):
-        """根据提供商设置客户端"""
-        if self.provider == LLMProvider.OPENAI:
-            self.client = AsyncOpenAI(
-                api_key=self.config.api_key,
-                base_url=self.config.api_base
+    @classmethod
+    def from_config(cls, config: Any) -> "LLMService":
+        """根据用户的LLM配置（数据库模型或LLMConfig）创建服务"""
+        if not isinstance(config, LLMConfig):
+            config = LLMConfig(
+                provider=LLMProvider(config.provider),
+                model_name=config.model_name,
+                api_key=config.api_key,
+                api_base=getattr(config, "api_base", None) or config.api_base_url,
+                temperature=getattr(config, "temperature", 0.7),
+                max_tokens=getattr(config, "max_tokens", 2000)
             )
-        elif self.provider == LLMProvider.DEEPSEEK:
-            self.client = AsyncOpenAI(
-                api_key=self.config.api_key,
-                base_url=self.config.api_base
-            )
-        elif self.provider == LLMProvider.OLLAMA:
-            self.client = AsyncOpenAI(
-                base_url=self.config.api_base
-            )
-        else:  # MOCK
+            if config.provider == LLMProvider.MOCK:
+                # 模拟提供商的参数写在 api_base_url 中，如 mock://?ttft_mean=0.4&tokens_per_second=40
+                config.mock = MockProfile.from_url(config.api_base)
+        return cls(provider=config.provider, model_key=config.model_name, config=config)
+    
+    def setup_client(self):
+        """根据提供商从共享注册表获取客户端，复用已有连接池"""
+        if self.provider == LLMProvider.MOCK:
             self.client = None
+            return
+        self.client = llm_client_registry.get_client(
+            LLMProvider(self.provider).value,
+            base_url=self.config.api_base,
+            api_key=None if self.provider == LLMProvider.OLLAMA else self.config.api_key
+        )
     
     async def generate_stream(
         self,
         messages: List[LLMMessage],
-        config: Optional[LLMConfig] = None
+        config: Optional[LLMConfig] = None,
+        system_message: Optional[str] = None,
+        user_id: Optional[Any] = None,
+        use_cache: bool = False
     ) -> AsyncGenerator[str, None]:
-        """生成流式响应"""
-        if config:
+        """生成流式响应，use_cache 为 True 时优先重放缓存的相同请求回复"""
+        if config and config != self.config:
             self.config = config
             self.setup_client()
 
-        if self.provider == LLMProvider.MOCK:
-            async for chunk in self._mock_response():
+        if system_message:
+            messages = [LLMMessage(role="system", content=system_message), *messages]
+
+        cache_key = None
+        if use_cache and llm_response_cache.enabled:
+            cache_key = llm_response_cache.make_key(
+                self.provider, self.config.model_name, self.config.temperature, messages, self.endpoint_key(),
+                self.config.max_tokens
+            )
+            cached = await llm_response_cache.get(cache_key)
+            if cached is not None:
+                async for chunk in llm_response_cache.replay(cached):
+                    yield chunk
+                return
+
+        if llm_singleflight.enabled:
+            # 指纹相同的并发请求共享同一个上游流
+            flight_key = request_fingerprint(
+                self.provider, self.config.model_name, self.config.temperature, messages,
+                endpoint=self.endpoint_key(), max_tokens=self.config.max_tokens
+            )
+            stream = llm_singleflight.stream(flight_key, lambda: self._stream_completion(messages))
+        else:
+            stream = self._stream_completion(messages)
+
+        chunks: List[str] = []
+        try:
+            async for chunk in stream:
+                chunks.append(chunk)
                 yield chunk
+        except Exception as e:
+            logger.error(f"生成响应时出错: {str(e)}")
+            yield f"生成响应时出错: {str(e)}"
             return
 
-        try:
+        # 只缓存完整成功的回复
+        if cache_key is not None:
+            await llm_response_cache.set(cache_key, chunks)
+    
+    def endpoint_key(self) -> str:
+        """上游端点标识：地址、密钥哈希和模拟参数，用于隔离缓存与合并请求"""
+        # 不在键中保存明文密钥
+        key_hash = hashlib.sha256((self.config.api_key or "").encode("utf-8")).hexdigest()
+        mock = self.config.mock.model_dump_json() if self.config.mock else ""
+        return f"{self.config.api_base or ''}|{key_hash}|{mock}"
+
+    async def _stream_completion(self, messages: List[LLMMessage]) -> AsyncGenerator[str, None]:
+        """调用上游（或模拟）接口并逐块产出内容，出错时抛出异常"""
+        # 按提示词加最大回复长度预估本次请求消耗的 token，用于 TPM 限流
+        estimated_tokens = self.config.max_tokens + sum(
+            context_builder.count_tokens(msg.content, self.config.model_name) for msg in messages
+        )
+        async with llm_rate_limiter.limit(self.provider, self.config.model_name, estimated_tokens):
+            if self.provider == LLMProvider.MOCK:
+                async for chunk in self._mock_response(messages):
+                    yield chunk
+                return
+
+            # 录制时从发起请求开始计时，重放才能还原首 token 延迟
+            started = time.monotonic()
             response = await self.client.chat.completions.create(
-                model=self.model_key,
+                model=self.config.model_name,
                 messages=[{"role": msg.role, "content": msg.content} for msg in messages],
                 stream=True,
                 temperature=self.config.temperature,
                 max_tokens=self.config.max_tokens
             )
             
+            stream = self._iter_content(response)
+            if settings.LLM_RECORD_ENABLED and settings.LLM_RECORD_FILE:
+                # 录制真实上游流，供模拟提供商的 replay 模式重放
+                stream = mock_llm_backend.record(
+                    stream, messages, self.config.model_name, settings.LLM_RECORD_FILE, started
+                )
+            async for chunk in stream:
+                yield chunk
+    
+    @staticmethod
+    async def _iter_content(response: Any) -> AsyncGenerator[str, None]:
+        try:
             async for chunk in response:
-                if chunk.choices[0].delta.content:
+                if chunk.choices and chunk.choices[0].delta.content:
                     yield chunk.choices[0].delta.content
-                    
-        except Exception as e:
-            logger.error(f"生成响应时出错: {str(e)}")
-            yield f"生成响应时出错: {str(e)}"
+        finally:
+            # 提前结束（如被取消）时立即关闭上游响应，让提供商停止生成
+            await response.response.aclose()
     
-    async def _mock_response(self) -> AsyncGenerator[str, None]:
-        """模拟响应"""
-        mock_responses = [
-            "你好！",
-            "我是一个AI助手。",
-            "很高兴为你服务。",
-            "有什么我可以帮助你的吗？"
-        ]
-        for response in mock_responses:
-            yield response
-            await asyncio.sleep(0.5)
+    async def _mock_response(self, messages: List[LLMMessage]) -> AsyncGenerator[str, None]:
+        """模拟响应，行为由 config.mock 配置"""
+        async for chunk in mock_llm_backend.stream(self.config.mock or MockProfile(), messages):
+            yield chunk
 
     async def generate_response(
         self,
@@ -124,6 +207,29 @@ class LLMService:
         return response
 
 
+class RoutedLLMService(LLMService):
+    """在一组等价后端之间按延迟路由（可对冲）的LLM服务"""
+    
+    def __init__(self, backends: List[LLMService]):
+        self.backends = backends
+        primary = backends[0]
+        super().__init__(provider=primary.provider, model_key=primary.model_key, config=primary.config)
+    
+    def endpoint_key(self) -> str:
+        return "\n".join(service.endpoint_key() for service in self.backends)
+
+    @staticmethod
+    def backend_key(service: LLMService) -> str:
+        return f"{LLMProvider(service.provider).value}:{service.model_key}"
+    
+    async def _stream_completion(self, messages: List[LLMMessage]) -> AsyncGenerator[str, None]:
+        async for chunk in llm_router.stream([
+            (self.backend_key(service), lambda service=service: service._stream_completion(messages))
+            for service in self.backends
+        ]):
+            yield chunk
+
+
 # 模型配置
 DEFAULT_MODEL_CONFIGS = {
     LLMProvider.OPENAI: {
@@ -162,6 +268,7 @@ DEFAULT_MODEL_CONFIGS = {
         "default": LLMConfig(
             provider=LLMProvider.MOCK,
             model_name="mock",
+            mock=MockProfile.from_url(settings.LLM_MOCK_PROFILE)
         )
     }
 }
@@ -174,7 +281,7 @@ def get_llm_service(provider: LLMProvider = LLMProvider.OPENAI, model_key: str =
     # 如果提供商不支持，回退到模拟模式
     if provider not in DEFAULT_MODEL_CONFIGS:
         logger.warning(f"[LLMService] 不支持的LLM提供商: {provider}，将使用模拟模式")
-        return LLMService(provider=LLMProvider.MOCK, model_key="mock")
+        return LLMService(provider=LLMProvider.MOCK, model_key="default")
         
     # 如果模型不支持，使用默认模型
     if model_key not in DEFAULT_MODEL_CONFIGS[provider]:
@@ -182,8 +289,29 @@ def get_llm_service(provider: LLMProvider = LLMProvider.OPENAI, model_key: str =
         logger.warning(f"[LLMService] 提供商 {provider} 不支持模型 {model_key}，可用模型: {available_models}。将使用默认模型。")
         model_key = "default"
     
-    config = DEFAULT_MODEL_CONFIGS[provider][model_key]
-    return LLMService(provider=provider, model_key=model_key)
+    return route_llm_service(LLMService(provider=provider, model_key=model_key))
+
+
+def route_llm_service(service: LLMService) -> LLMService:
+    """
+    服务所在的后端配置了等价后端组时，返回按延迟在组内路由的服务
+
+    组成员 "提供商:模型" 与 service 相同时使用 service 本身（如用户自己的配置和密钥），
+    其余成员使用服务端默认模型配置，找不到配置的成员被忽略。
+    """
+    group = llm_router.group_for(service.provider, service.model_key)
+    if not group:
+        return service
+    own_key = (LLMProvider(service.provider), service.model_key)
+    backends = []
+    for member_provider, member_key in group:
+        if (LLMProvider(member_provider), member_key) == own_key:
+            backends.append(service)
+        elif member_key in DEFAULT_MODEL_CONFIGS.get(LLMProvider(member_provider), {}):
+            backends.append(LLMService(provider=LLMProvider(member_provider), model_key=member_key))
+    if len(backends) > 1:
+        return RoutedLLMService(backends)
+    return service
 
 # 创建默认的 llm_service 实例
 llm_service = get_llm_service(provider=LLMProvider.OPENAI, model_key="gpt-3.5-turbo") 
\ No newline at end of file
@@ -0,0 +1,106 @@
+from typing import List, Dict, Any, Optional, AsyncGenerator, AsyncIterator, Callable
+import asyncio
+
+from app.core.config import settings
+from app.core.logging import logger
+
+
+class _Flight:
+    """一次进行中的上游流式请求及其订阅者"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.condition = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+class LLMSingleFlight:
+    """
+    相同请求的并发合并（single-flight）
+
+    指纹相同的并发请求共享同一个上游流：每个订阅者都会收到完整的分片序列，
+    中途加入的订阅者先重放已产生的分片。只有最后一个订阅者离开时才取消上游。
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._flights: Dict[str, _Flight] = {}
+        self.flights_started = 0
+        self.joins = 0
+        self.cancelled = 0
+
+    async def stream(self, key: str, source: Callable[[], AsyncIterator[str]]) -> AsyncGenerator[str, None]:
+        """订阅指纹为 key 的上游流，不存在时调用 source() 发起新的上游请求"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(key)
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(flight, source))
+            self.flights_started += 1
+        else:
+            self.joins += 1
+            logger.info(f"[SingleFlight] 合并相同请求: key={key[:12]}, 已产生 {len(flight.chunks)} 个分片")
+
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                async with flight.condition:
+                    while index >= len(flight.chunks) and not flight.done:
+                        await flight.condition.wait()
+                    pending = flight.chunks[index:]
+                    done = flight.done
+                for chunk in pending:
+                    index += 1
+                    yield chunk
+                if done and index >= len(flight.chunks):
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # 最后一个订阅者离开，取消上游请求
+                self._discard(flight)
+                flight.task.cancel()
+                self.cancelled += 1
+
+    async def _run(self, flight: _Flight, source: Callable[[], AsyncIterator[str]]) -> None:
+        try:
+            async for chunk in source():
+                async with flight.condition:
+                    flight.chunks.append(chunk)
+                    flight.condition.notify_all()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            self._discard(flight)
+            flight.done = True
+            async with flight.condition:
+                flight.condition.notify_all()
+
+    def _discard(self, flight: _Flight) -> None:
+        # 结束后不再接受新的订阅者，后续相同请求会发起新的上游流（或命中缓存）
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._flights),
+            "subscribers": sum(flight.subscribers for flight in self._flights.values()),
+            "flights_started": self.flights_started,
+            "joins": self.joins,
+            "cancelled": self.cancelled,
+        }
+
+
+# 创建全局 single-flight 实例
+llm_singleflight = LLMSingleFlight(enabled=settings.LLM_SINGLEFLIGHT_ENABLED)
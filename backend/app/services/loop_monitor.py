@@ -0,0 +1,74 @@
+from typing import Dict, Any, Optional, Tuple
+from collections import deque
+import asyncio
+import time
+
+from app.core.config import settings
+from app.core.logging import logger
+
+
+class EventLoopMonitor:
+    """
+    事件循环延迟监控
+
+    后台任务按固定间隔休眠，实际唤醒时间与预期的差值即为事件循环被阻塞的时长。
+    同步数据库查询等阻塞调用会直接体现为延迟升高。
+    """
+
+    def __init__(self, interval: float, history: int):
+        self.interval = interval
+        self.samples: "deque[Tuple[float, float]]" = deque(maxlen=history)
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self.samples.append((now, lag))
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if lag > settings.LOOP_LAG_WARN_SECONDS:
+                logger.warning(f"[EventLoopMonitor] 事件循环阻塞 {lag * 1000:.1f}ms")
+
+    def stats(self, seconds: Optional[float] = None) -> Dict[str, Any]:
+        """统计最近 seconds 秒（默认全部历史样本）的延迟分布"""
+        since = time.monotonic() - seconds if seconds else 0.0
+        lags = sorted(lag for at, lag in self.samples if at >= since)
+
+        def percentile(p: float) -> float:
+            if not lags:
+                return 0.0
+            return round(lags[min(len(lags) - 1, int(len(lags) * p))] * 1000, 2)
+
+        return {
+            "interval_ms": round(self.interval * 1000, 1),
+            "samples": len(lags),
+            "lag_ms_p50": percentile(0.5),
+            "lag_ms_p95": percentile(0.95),
+            "lag_ms_p99": percentile(0.99),
+            "lag_ms_max": round(lags[-1] * 1000, 2) if lags else 0.0,
+            "lag_ms_max_since_start": round(self.max_lag * 1000, 2),
+        }
+
+
+# 创建全局事件循环监控实例
+loop_monitor = EventLoopMonitor(
+    interval=settings.LOOP_MONITOR_INTERVAL,
+    history=settings.LOOP_MONITOR_HISTORY
+)
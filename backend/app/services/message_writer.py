@@ -0,0 +1,192 @@
+from typing import List, Dict, Any, Optional
+from collections import deque, OrderedDict
+import asyncio
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.db.session import AsyncSessionLocal
+from app.models.message import ChatMessage as MessageModel
+
+
+class MessageWriter:
+    """
+    消息写入队列（write-behind）
+
+    sync 模式下每条消息立即插入并提交；batched 模式下消息先进入内存队列，
+    按刷新间隔或批大小合并为一条多行 INSERT 提交，显著减少往返和提交次数。
+    尚未落库的消息行可通过 pending_rows 读取，保证写入方能读到自己刚写的消息；
+    进程关闭时 aclose 会把队列全部写完。
+    """
+
+    def __init__(self, mode: str, batch_size: int, flush_interval: float, max_pending: int):
+        if mode not in ("sync", "batched"):
+            logger.error(f"[MessageWriter] 未知的写入模式 {mode}，使用 sync")
+            mode = "sync"
+        self.mode = mode
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._queue: "deque[Dict[str, Any]]" = deque()
+        # 已写入队列但尚未提交的消息（含正在刷新的批次），按会话索引
+        self._unflushed: Dict[str, "OrderedDict[str, Dict[str, Any]]"] = {}
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.flush_times: "deque[float]" = deque(maxlen=1000)
+
+    @staticmethod
+    def _to_row(message: Any) -> Dict[str, Any]:
+        return {
+            "id": message.id,
+            "session_id": message.session_id,
+            "content": message.content,
+            "role": message.role,
+            "created_at": message.created_at,
+        }
+
+    async def write(self, message: Any) -> None:
+        """写入一条消息（ChatMessage 模型或同名字段的对象）"""
+        row = self._to_row(message)
+        if self.mode == "sync":
+            await self._insert([row])
+            return
+
+        if self._task is None:
+            self.start()
+        if len(self._queue) >= self.max_pending:
+            # 积压过多时由写入方同步刷新，形成背压；数据库不可用导致刷新后仍然积压时拒绝写入
+            await self.flush()
+            if len(self._queue) >= self.max_pending:
+                raise RuntimeError(f"消息写入队列已满（{len(self._queue)} 条未落库），数据库暂不可用")
+        self._queue.append(row)
+        self._unflushed.setdefault(row["session_id"], OrderedDict())[row["id"]] = row
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def has_pending(self, session_id: str) -> bool:
+        return bool(self._unflushed.get(session_id))
+
+    def pending_rows(self, session_id: str) -> List[Dict[str, Any]]:
+        """返回该会话尚未落库的消息行（按写入顺序）"""
+        return list(self._unflushed.get(session_id, {}).values())
+
+    async def flush_session(self, session_id: str) -> None:
+        """该会话有未落库的消息时立即刷新，用于分页等无法合并内存消息的读取"""
+        if self.has_pending(session_id):
+            await self.flush()
+
+    async def flush(self) -> None:
+        """把队列中的消息全部写入数据库"""
+        async with self._lock:
+            while self._queue:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                if not await self._insert(batch):
+                    # 数据库暂不可用，放回队首等待下次刷新
+                    self._queue.extendleft(reversed(batch))
+                    break
+
+    async def _insert(self, rows: List[Dict[str, Any]]) -> bool:
+        """多行 INSERT 提交一批消息；整批失败时逐条重试以隔离坏数据"""
+        started = time.monotonic()
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(MessageModel).values(rows))
+                await db.commit()
+        except IntegrityError:
+            if self.mode == "sync":
+                raise
+            if len(rows) == 1:
+                self.rows_dropped += 1
+                logger.error(f"[MessageWriter] 消息写入失败，已丢弃: id={rows[0]['id']}, session={rows[0]['session_id']}")
+                self._forget(rows)
+                return True
+            for row in rows:
+                if not await self._insert([row]):
+                    return False
+            return True
+        except Exception as e:
+            logger.error(f"[MessageWriter] 写入 {len(rows)} 条消息失败: {str(e)}")
+            if self.mode == "sync":
+                raise
+            return False
+
+        self.flushes += 1
+        self.rows_written += len(rows)
+        self.flush_times.append(time.monotonic() - started)
+        self._forget(rows)
+        return True
+
+    def _forget(self, rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            pending = self._unflushed.get(row["session_id"])
+            if pending is not None:
+                pending.pop(row["id"], None)
+                if not pending:
+                    del self._unflushed[row["session_id"]]
+
+    def start(self) -> None:
+        if self.mode == "batched" and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"[MessageWriter] 刷新失败: {str(e)}")
+
+    async def aclose(self) -> None:
+        """停止后台刷新并写完队列中的全部消息"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._queue:
+            logger.error(f"[MessageWriter] 关闭时仍有 {len(self._queue)} 条消息未能写入")
+
+    def stats(self) -> Dict[str, Any]:
+        times = sorted(self.flush_times)
+
+        def percentile(p: float) -> float:
+            if not times:
+                return 0.0
+            return round(times[min(len(times) - 1, int(len(times) * p))] * 1000, 2)
+
+        return {
+            "mode": self.mode,
+            "batch_size": self.batch_size,
+            "flush_interval_ms": round(self.flush_interval * 1000, 1),
+            "pending": len(self._queue),
+            "unflushed_sessions": len(self._unflushed),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped,
+            "rows_per_flush": round(self.rows_written / self.flushes, 2) if self.flushes else 0.0,
+            "flush_ms_p50": percentile(0.5),
+            "flush_ms_p95": percentile(0.95),
+        }
+
+
+# 创建全局消息写入实例
+message_writer = MessageWriter(
+    mode=settings.MESSAGE_WRITE_MODE,
+    batch_size=settings.MESSAGE_WRITE_BATCH_SIZE,
+    flush_interval=settings.MESSAGE_WRITE_FLUSH_INTERVAL,
+    max_pending=settings.MESSAGE_WRITE_MAX_PENDING
+)
@@ -0,0 +1,185 @@
+from typing import List, Dict, Any, Optional, AsyncGenerator, AsyncIterator, Literal
+from urllib.parse import urlparse, parse_qsl
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import time
+
+from pydantic import BaseModel, Field
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.services.llm_cache import request_fingerprint
+
+
+class MockUpstreamError(Exception):
+    """模拟的上游错误"""
+    pass
+
+
+class MockProfile(BaseModel):
+    """
+    模拟提供商的行为参数
+
+    可通过 LLMConfig.mock 直接设置，也可写在 api_base_url 中，如
+    mock://?ttft_mean=0.4&tokens_per_second=40&error_rate=0.01
+    """
+    mode: Literal["synthetic", "replay"] = Field("synthetic", description="synthetic 合成输出；replay 重放录制的真实流")
+    ttft_mean: float = Field(0.3, description="首个分片延迟均值（秒），服从对数正态分布")
+    ttft_stddev: float = Field(0.1, description="首个分片延迟标准差（秒）")
+    tokens_per_second: float = Field(30.0, description="输出速度，0 表示不限速")
+    chunk_tokens: int = Field(1, description="每个分片包含的 token 数")
+    length_mean: int = Field(120, description="回复长度均值（token）")
+    length_stddev: int = Field(40, description="回复长度标准差（token）")
+    error_rate: float = Field(0.0, description="首个分片前返回错误的概率")
+    timeout_rate: float = Field(0.0, description="首个分片前挂起直至超时的概率")
+    timeout_seconds: float = Field(30.0, description="超时注入的挂起时长（秒）")
+    stall_rate: float = Field(0.0, description="流中途停顿的概率")
+    stall_seconds: float = Field(10.0, description="中途停顿时长（秒）")
+    seed: Optional[int] = Field(None, description="随机种子，设置后输出可复现")
+    replay_file: Optional[str] = Field(None, description="replay 模式使用的录制文件（JSONL）")
+    replay_speed: float = Field(1.0, description="重放速度倍数")
+
+    @classmethod
+    def from_url(cls, url: Optional[str]) -> "MockProfile":
+        """从 mock://?key=value 形式的地址解析参数"""
+        if not url:
+            return cls()
+        query = urlparse(url).query if "://" in url else url
+        return cls(**dict(parse_qsl(query)))
+
+
+# 合成回复使用的词表
+_VOCABULARY = [
+    "您好", "，", "感谢", "您的", "咨询", "。", "关于", "这个", "问题", "我们", "建议", "您",
+    "先", "检查", "一下", "相关", "设置", "如果", "仍然", "无法", "解决", "可以", "联系",
+    "客服", "人员", "获取", "进一步", "帮助", "系统", "会", "自动", "处理", "订单", "账户",
+    "请", "稍后", "再试", "具体", "步骤", "如下", "：", "首先", "然后", "最后", "确认",
+]
+
+
+def _lognormal(rng: random.Random, mean: float, stddev: float) -> float:
+    if mean <= 0:
+        return 0.0
+    if stddev <= 0:
+        return mean
+    sigma2 = math.log(1 + (stddev / mean) ** 2)
+    return rng.lognormvariate(math.log(mean) - sigma2 / 2, math.sqrt(sigma2))
+
+
+def _replay_key(messages: List[Any]) -> str:
+    # 录制和重放只按消息内容匹配，与提供商和模型无关
+    return request_fingerprint("recorded", "", 0.0, messages)
+
+
+class MockLLMBackend:
+    """可配置的模拟上游，支持延迟/速度/长度分布、故障注入和录制重放"""
+
+    def __init__(self):
+        self._recordings: Dict[str, Dict[str, Any]] = {}
+        self._counter = itertools.count()
+
+    async def stream(self, profile: MockProfile, messages: List[Any]) -> AsyncGenerator[str, None]:
+        if profile.mode == "replay":
+            async for chunk in self._replay(profile, messages):
+                yield chunk
+            return
+
+        seed = profile.seed + next(self._counter) if profile.seed is not None else None
+        rng = random.Random(seed)
+
+        roll = rng.random()
+        if roll < profile.error_rate:
+            await asyncio.sleep(_lognormal(rng, profile.ttft_mean, profile.ttft_stddev))
+            raise MockUpstreamError("模拟上游错误: 503 Service Unavailable")
+        if roll < profile.error_rate + profile.timeout_rate:
+            await asyncio.sleep(profile.timeout_seconds)
+            raise TimeoutError("模拟上游超时")
+
+        await asyncio.sleep(_lognormal(rng, profile.ttft_mean, profile.ttft_stddev))
+
+        length = max(1, int(rng.gauss(profile.length_mean, profile.length_stddev)))
+        chunk_tokens = max(1, profile.chunk_tokens)
+        interval = chunk_tokens / profile.tokens_per_second if profile.tokens_per_second > 0 else 0.0
+        stall_at = rng.randrange(length) if rng.random() < profile.stall_rate else None
+
+        produced = 0
+        while produced < length:
+            count = min(chunk_tokens, length - produced)
+            yield "".join(rng.choice(_VOCABULARY) for _ in range(count))
+            produced += count
+            if stall_at is not None and produced > stall_at:
+                stall_at = None
+                await asyncio.sleep(profile.stall_seconds)
+            if produced < length:
+                await asyncio.sleep(interval)
+
+    def _load_recordings(self, path: str) -> Dict[str, Any]:
+        if path not in self._recordings:
+            records: List[Dict[str, Any]] = []
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        records.append(json.loads(line))
+            if not records:
+                raise MockUpstreamError(f"录制文件为空: {path}")
+            self._recordings[path] = {
+                "records": records,
+                "by_key": {record["key"]: record for record in records},
+            }
+            logger.info(f"[MockLLM] 已加载 {len(records)} 条录制流: {path}")
+        return self._recordings[path]
+
+    async def _replay(self, profile: MockProfile, messages: List[Any]) -> AsyncGenerator[str, None]:
+        path = profile.replay_file or settings.LLM_RECORD_FILE
+        if not path:
+            raise MockUpstreamError("replay 模式需要设置 replay_file 或 LLM_RECORD_FILE")
+        recordings = await asyncio.to_thread(self._load_recordings, path)
+        # 优先按请求内容匹配，否则轮流重放
+        record = recordings["by_key"].get(_replay_key(messages))
+        if record is None:
+            records = recordings["records"]
+            record = records[next(self._counter) % len(records)]
+
+        speed = profile.replay_speed if profile.replay_speed > 0 else 1.0
+        started = time.monotonic()
+        for offset, text in record["chunks"]:
+            delay = offset / speed - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield text
+
+    async def record(
+        self, stream: AsyncIterator[str], messages: List[Any], model: str, path: str, started: float
+    ) -> AsyncGenerator[str, None]:
+        """
+        透传真实上游流并记录每个分片的相对时间，完整结束后追加到录制文件
+
+        started 为发起上游请求前的 time.monotonic()，使首个分片的时间包含首 token 延迟
+        """
+        chunks: List[List[Any]] = []
+        async for chunk in stream:
+            chunks.append([round(time.monotonic() - started, 4), chunk])
+            yield chunk
+        line = json.dumps({
+            "key": _replay_key(messages),
+            "model": model,
+            "recorded_at": time.time(),
+            "chunks": chunks,
+        }, ensure_ascii=False)
+        await asyncio.to_thread(_append_line, path, line)
+
+
+def _append_line(path: str, line: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+# 创建全局模拟后端实例
+mock_llm_backend = MockLLMBackend()
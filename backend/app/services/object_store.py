@@ -0,0 +1,120 @@
+from typing import Optional
+from pathlib import Path
+import asyncio
+import io
+import os
+
+from app.core.config import settings
+from app.core.logging import logger
+
+
+class ObjectStoreError(Exception):
+    """对象存储读写失败"""
+    pass
+
+
+class MinioObjectStore:
+    """MinIO 对象存储，同步客户端的调用放到线程中执行"""
+
+    def __init__(self, endpoint: str, access_key: str, secret_key: str, bucket: str, secure: bool = False):
+        from minio import Minio
+
+        self.bucket = bucket
+        self.client = Minio(endpoint, access_key=access_key, secret_key=secret_key, secure=secure)
+        self._bucket_checked = False
+
+    def _ensure_bucket(self) -> None:
+        if not self._bucket_checked:
+            if not self.client.bucket_exists(self.bucket):
+                self.client.make_bucket(self.bucket)
+            self._bucket_checked = True
+
+    def _put(self, key: str, data: bytes, content_type: str) -> None:
+        self._ensure_bucket()
+        self.client.put_object(self.bucket, key, io.BytesIO(data), length=len(data), content_type=content_type)
+
+    def _get(self, key: str) -> bytes:
+        response = self.client.get_object(self.bucket, key)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+    async def put(self, key: str, data: bytes, content_type: str = "application/octet-stream") -> None:
+        try:
+            await asyncio.to_thread(self._put, key, data, content_type)
+        except Exception as e:
+            raise ObjectStoreError(f"写入对象 {key} 失败: {str(e)}") from e
+
+    async def get(self, key: str) -> bytes:
+        try:
+            return await asyncio.to_thread(self._get, key)
+        except Exception as e:
+            raise ObjectStoreError(f"读取对象 {key} 失败: {str(e)}") from e
+
+    async def delete(self, key: str) -> None:
+        try:
+            await asyncio.to_thread(self.client.remove_object, self.bucket, key)
+        except Exception as e:
+            raise ObjectStoreError(f"删除对象 {key} 失败: {str(e)}") from e
+
+
+class FilesystemObjectStore:
+    """
+    本地文件系统对象存储
+
+    与 MinioObjectStore 接口相同，用于开发和测试环境替代 MinIO，对象键映射为 root 下的相对路径。
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root).resolve()
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root not in path.parents:
+            raise ObjectStoreError(f"非法的对象键: {key}")
+        return path
+
+    def _put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再改名，避免读到写了一半的对象
+        temp = path.with_name(path.name + ".tmp")
+        temp.write_bytes(data)
+        os.replace(temp, path)
+
+    async def put(self, key: str, data: bytes, content_type: str = "application/octet-stream") -> None:
+        try:
+            await asyncio.to_thread(self._put, key, data)
+        except OSError as e:
+            raise ObjectStoreError(f"写入对象 {key} 失败: {str(e)}") from e
+
+    async def get(self, key: str) -> bytes:
+        try:
+            return await asyncio.to_thread(self._path(key).read_bytes)
+        except OSError as e:
+            raise ObjectStoreError(f"读取对象 {key} 失败: {str(e)}") from e
+
+    async def delete(self, key: str) -> None:
+        try:
+            await asyncio.to_thread(self._path(key).unlink, True)
+        except OSError as e:
+            raise ObjectStoreError(f"删除对象 {key} 失败: {str(e)}") from e
+
+
+def create_object_store() -> Optional[object]:
+    """按配置创建归档使用的对象存储"""
+    try:
+        if settings.ARCHIVE_STORE == "filesystem":
+            return FilesystemObjectStore(settings.ARCHIVE_FS_ROOT)
+        return MinioObjectStore(
+            settings.MINIO_ENDPOINT,
+            settings.MINIO_ACCESS_KEY,
+            settings.MINIO_SECRET_KEY,
+            settings.MINIO_BUCKET_NAME,
+            secure=settings.MINIO_SECURE
+        )
+    except Exception as e:
+        logger.error(f"[ObjectStore] 创建对象存储失败: {str(e)}")
+        return None
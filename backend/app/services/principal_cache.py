@@ -0,0 +1,130 @@
+from typing import Dict, Any, Optional, Set, Tuple
+from collections import OrderedDict
+import hashlib
+import time
+
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.models.user import User
+from app.schemas.user import Principal
+
+
+class PrincipalCache:
+    """
+    已认证用户缓存
+
+    以令牌的 SHA-256 为键缓存已验证的用户快照，命中时既不解码 JWT 也不查询数据库。
+    条目在 ttl 秒后或令牌 exp 到期时失效（取较早者），超过 max_entries 时按 LRU 淘汰。
+    用户被禁用或权限变化时通过 invalidate_user 立即失效；ttl 兜底其他进程中的修改。
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # 令牌哈希 -> (用户快照, 单调时钟过期时间, 令牌 exp 时间戳)
+        self._entries: "OrderedDict[str, Tuple[Principal, float, Optional[float]]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional[Principal]:
+        """返回令牌对应的用户快照，未缓存或已过期时返回 None"""
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        principal, expires_at, exp = entry
+        if expires_at <= time.monotonic() or (exp is not None and exp <= time.time()):
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return principal
+
+    def set(self, token: str, principal: Principal, exp: Optional[float]) -> None:
+        """缓存令牌验证结果，exp 为令牌的过期时间戳"""
+        if not self.enabled:
+            return
+        key = self._key(token)
+        self._remove(key)
+        self._entries[key] = (principal, time.monotonic() + self.ttl, exp)
+        self._tokens_by_user.setdefault(principal.id, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_token(self, token: str) -> None:
+        """令牌注销时移除缓存"""
+        if self._remove(self._key(token)):
+            self.invalidations += 1
+
+    def invalidate_user(self, user_id: int) -> None:
+        """用户被禁用或权限变化时移除其所有令牌的缓存"""
+        keys = self._tokens_by_user.pop(user_id, set())
+        for key in keys:
+            self._entries.pop(key, None)
+        if keys:
+            self.invalidations += 1
+            logger.info(f"[PrincipalCache] 用户 {user_id} 的认证缓存已失效")
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+    def _remove(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        keys = self._tokens_by_user.get(entry[0].id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tokens_by_user[entry[0].id]
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "users": len(self._tokens_by_user),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+# 创建全局认证缓存实例
+principal_cache = PrincipalCache(
+    ttl=settings.AUTH_CACHE_TTL,
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES
+)
+
+
+@event.listens_for(User, "after_update")
+def _invalidate_updated_user(mapper, connection, target: User) -> None:
+    # 本进程内任何途径修改用户（禁用、权限变更等）后立即失效其认证缓存
+    principal_cache.invalidate_user(target.id)
+
+
+@event.listens_for(User, "after_delete")
+def _invalidate_deleted_user(mapper, connection, target: User) -> None:
+    principal_cache.invalidate_user(target.id)
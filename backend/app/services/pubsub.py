@@ -0,0 +1,173 @@
+from typing import Dict, Any, Optional, Set, Callable, Awaitable
+from abc import ABC, abstractmethod
+import asyncio
+
+from app.core.config import settings
+from app.core.logging import logger
+
+
+# 收到消息时的回调，参数为（主题，消息体）
+MessageHandler = Callable[[str, bytes], Awaitable[None]]
+
+
+class PubSubBackend(ABC):
+    """发布/订阅后端接口，WebSocket 广播经此在多个进程之间转发"""
+
+    @abstractmethod
+    async def start(self, handler: MessageHandler) -> None:
+        ...
+
+    @abstractmethod
+    async def publish(self, topic: str, payload: bytes) -> None:
+        ...
+
+    @abstractmethod
+    async def subscribe(self, topic: str) -> None:
+        ...
+
+    @abstractmethod
+    async def unsubscribe(self, topic: str) -> None:
+        ...
+
+    async def aclose(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class InProcessBroker:
+    """进程内消息代理，同一代理下的多个后端互相可见，可在测试中模拟多个进程"""
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set["InProcessBackend"]] = {}
+
+    async def publish(self, topic: str, payload: bytes) -> int:
+        receivers = list(self.subscribers.get(topic, ()))
+        for backend in receivers:
+            await backend.deliver(topic, payload)
+        return len(receivers)
+
+
+class InProcessBackend(PubSubBackend):
+    """进程内后端，单进程部署的默认选项"""
+
+    def __init__(self, broker: InProcessBroker):
+        self.broker = broker
+        self._handler: Optional[MessageHandler] = None
+        self._topics: Set[str] = set()
+
+    async def start(self, handler: MessageHandler) -> None:
+        self._handler = handler
+
+    async def publish(self, topic: str, payload: bytes) -> None:
+        await self.broker.publish(topic, payload)
+
+    async def subscribe(self, topic: str) -> None:
+        self._topics.add(topic)
+        self.broker.subscribers.setdefault(topic, set()).add(self)
+
+    async def unsubscribe(self, topic: str) -> None:
+        self._topics.discard(topic)
+        subscribers = self.broker.subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(self)
+            if not subscribers:
+                del self.broker.subscribers[topic]
+
+    async def deliver(self, topic: str, payload: bytes) -> None:
+        if self._handler is not None:
+            await self._handler(topic, payload)
+
+    async def aclose(self) -> None:
+        for topic in list(self._topics):
+            await self.unsubscribe(topic)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "subscriptions": len(self._topics)}
+
+
+class RedisBackend(PubSubBackend):
+    """
+    Redis 发布/订阅后端，用于多进程、多节点部署
+
+    每个进程只订阅本地有连接的会话主题，由 Redis 按频道过滤；连接断开后 redis-py 会自动重连并恢复订阅。
+    """
+
+    def __init__(self, url: str, poll_timeout: float = 1.0):
+        self.url = url
+        self.poll_timeout = poll_timeout
+        self._client: Any = None
+        self._pubsub: Any = None
+        self._handler: Optional[MessageHandler] = None
+        self._task: Optional[asyncio.Task] = None
+        self._topics: Set[str] = set()
+        self.errors = 0
+
+    async def start(self, handler: MessageHandler) -> None:
+        import redis.asyncio as redis
+
+        self._handler = handler
+        self._client = redis.from_url(self.url)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._task = asyncio.create_task(self._listen())
+        logger.info(f"[RedisBackend] 已连接发布/订阅服务: {self.url}")
+
+    async def publish(self, topic: str, payload: bytes) -> None:
+        await self._client.publish(topic, payload)
+
+    async def subscribe(self, topic: str) -> None:
+        self._topics.add(topic)
+        await self._pubsub.subscribe(topic)
+
+    async def unsubscribe(self, topic: str) -> None:
+        self._topics.discard(topic)
+        await self._pubsub.unsubscribe(topic)
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                if not self._pubsub.subscribed:
+                    # 尚未订阅任何主题时连接还未建立
+                    await asyncio.sleep(self.poll_timeout / 10)
+                    continue
+                message = await self._pubsub.get_message(timeout=self.poll_timeout)
+                if message is None or message.get("type") != "message":
+                    continue
+                channel = message["channel"]
+                await self._handler(channel.decode() if isinstance(channel, bytes) else channel, message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"[RedisBackend] 接收消息失败: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        if self._client is not None:
+            await self._client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis", "subscriptions": len(self._topics), "errors": self.errors}
+
+
+# 进程内后端共享的消息代理
+local_broker = InProcessBroker()
+
+
+def create_pubsub_backend() -> PubSubBackend:
+    """按配置创建发布/订阅后端"""
+    if settings.PUBSUB_BACKEND == "redis":
+        return RedisBackend(settings.PUBSUB_REDIS_URL)
+    if settings.PUBSUB_BACKEND != "memory":
+        logger.error(f"[PubSub] 未知的发布/订阅后端 {settings.PUBSUB_BACKEND}，使用 memory")
+    return InProcessBackend(local_broker)
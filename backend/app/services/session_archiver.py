@@ -0,0 +1,314 @@
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import gzip
+import json
+import time
+
+from sqlalchemy import select, insert, update, delete, exists, and_, or_
+from sqlalchemy.orm import noload
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.db.session import AsyncSessionLocal
+from app.models.session import ChatSession as SessionModel
+from app.models.message import ChatMessage as MessageModel
+from app.services.history_cache import history_cache
+from app.services.message_writer import message_writer
+from app.services.object_store import create_object_store
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class SessionArchiver:
+    """
+    会话冷存储归档
+
+    后台任务定期把最后一条消息早于 idle_days 的会话按 segment_messages 条一段写成
+    压缩（zstd，未安装时 gzip）的 JSONL 对象存入对象存储，会话行保留为存根（archived_at 和
+    archive_manifest），消息从热表中删除。再次打开会话时 rehydrate 逐段读回并写回热表。
+    写回按消息 ID 去重，归档或写回中途失败可以安全重试。
+    """
+
+    def __init__(
+        self,
+        store: Any,
+        enabled: bool,
+        idle_days: float,
+        interval: float,
+        batch_sessions: int,
+        segment_messages: int,
+        zstd_level: int
+    ):
+        self.store = store
+        self.enabled = enabled and store is not None
+        self.idle_days = idle_days
+        self.interval = interval
+        self.batch_sessions = batch_sessions
+        self.segment_messages = max(1, segment_messages)
+        self.codec = "zstd" if zstandard is not None else "gzip"
+        self.zstd_level = zstd_level
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.sessions_archived = 0
+        self.messages_archived = 0
+        self.bytes_raw = 0
+        self.bytes_stored = 0
+        self.rehydrations = 0
+        self.messages_rehydrated = 0
+        self.failures = 0
+        self.last_run_seconds = 0.0
+
+    def _encode(self, rows: List[Any]) -> Tuple[bytes, int]:
+        lines = [
+            json.dumps({
+                "id": row.id,
+                "role": row.role,
+                "content": row.content,
+                "created_at": row.created_at.isoformat(),
+            }, ensure_ascii=False)
+            for row in rows
+        ]
+        raw = ("\n".join(lines) + "\n").encode("utf-8")
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=self.zstd_level).compress(raw), len(raw)
+        return gzip.compress(raw), len(raw)
+
+    @staticmethod
+    def _decode(data: bytes, codec: str) -> List[Dict[str, Any]]:
+        if codec == "zstd":
+            if zstandard is None:
+                raise RuntimeError("读取 zstd 归档需要安装 zstandard")
+            raw = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        else:
+            raw = gzip.decompress(data)
+        rows = []
+        for line in raw.decode("utf-8").splitlines():
+            if line:
+                row = json.loads(line)
+                row["created_at"] = datetime.fromisoformat(row["created_at"])
+                rows.append(row)
+        return rows
+
+    async def archive_idle(self) -> int:
+        """归档一批空闲会话，返回归档的会话数"""
+        cutoff = datetime.utcnow() - timedelta(days=self.idle_days)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(SessionModel.id).where(
+                    SessionModel.archived_at.is_(None),
+                    SessionModel.deleted_at.is_(None),
+                    SessionModel.updated_at < cutoff,
+                    exists().where(MessageModel.session_id == SessionModel.id),
+                    ~exists().where(MessageModel.session_id == SessionModel.id, MessageModel.created_at >= cutoff)
+                ).order_by(SessionModel.updated_at).limit(self.batch_sessions)
+            )
+            session_ids = list(result.scalars().all())
+
+        archived = 0
+        for session_id in session_ids:
+            try:
+                if await self.archive_session(session_id, cutoff):
+                    archived += 1
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"[SessionArchiver] 归档会话失败: session={session_id}, 错误={str(e)}")
+        return archived
+
+    async def archive_session(self, session_id: str, cutoff: Optional[datetime] = None) -> bool:
+        """把会话的消息写入对象存储并留下存根，会话在 cutoff 之后有新消息时跳过"""
+        await message_writer.flush_session(session_id)
+        async with self._lock(session_id):
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(SessionModel).options(noload(SessionModel.messages)).where(
+                        SessionModel.id == session_id,
+                        SessionModel.archived_at.is_(None),
+                        SessionModel.deleted_at.is_(None)
+                    )
+                )
+                session = result.scalars().first()
+                if session is None:
+                    return False
+
+                prefix = f"sessions/{session.user_id}/{session_id}/{int(time.time())}"
+                segments: List[str] = []
+                ids: List[str] = []
+                cursor = None
+                raw_bytes = stored_bytes = 0
+                while True:
+                    query = select(
+                        MessageModel.id, MessageModel.role, MessageModel.content, MessageModel.created_at
+                    ).where(
+                        MessageModel.session_id == session_id
+                    ).order_by(
+                        MessageModel.created_at.asc(), MessageModel.id.asc()
+                    ).limit(self.segment_messages)
+                    if cursor is not None:
+                        query = query.where(or_(
+                            MessageModel.created_at > cursor[0],
+                            and_(MessageModel.created_at == cursor[0], MessageModel.id > cursor[1])
+                        ))
+                    rows = (await db.execute(query)).all()
+                    if not rows:
+                        break
+                    if cutoff is not None and rows[-1].created_at >= cutoff:
+                        # 归档期间会话又有了新消息
+                        await self._delete_objects(segments)
+                        return False
+                    data, raw = self._encode(rows)
+                    key = f"{prefix}/{len(segments):05d}.jsonl.{'zst' if self.codec == 'zstd' else 'gz'}"
+                    await self.store.put(key, data)
+                    segments.append(key)
+                    ids.extend(row.id for row in rows)
+                    raw_bytes += raw
+                    stored_bytes += len(data)
+                    if len(rows) < self.segment_messages:
+                        break
+                    cursor = (rows[-1].created_at, rows[-1].id)
+
+                if not segments:
+                    return False
+
+                # 先写存根再分块删除热表中的消息；中途失败时残留的消息在写回时按 ID 去重
+                manifest = json.dumps({"codec": self.codec, "segments": segments, "messages": len(ids)})
+                await db.execute(
+                    update(SessionModel).where(SessionModel.id == session_id).values(
+                        archived_at=datetime.utcnow(), archive_manifest=manifest,
+                        # 归档和恢复不改变会话在列表中的顺序
+                        updated_at=SessionModel.updated_at
+                    )
+                )
+                await db.commit()
+                for start in range(0, len(ids), self.segment_messages):
+                    await db.execute(delete(MessageModel).where(MessageModel.id.in_(ids[start:start + self.segment_messages])))
+                    await db.commit()
+
+        history_cache.invalidate(session_id)
+        self.sessions_archived += 1
+        self.messages_archived += len(ids)
+        self.bytes_raw += raw_bytes
+        self.bytes_stored += stored_bytes
+        logger.info(f"[SessionArchiver] 会话已归档: session={session_id}, 消息 {len(ids)} 条, {len(segments)} 段, {stored_bytes} 字节")
+        return True
+
+    async def rehydrate(self, session_id: str) -> bool:
+        """把已归档会话的消息逐段写回热表并清除存根，未归档时返回 False"""
+        async with self._lock(session_id):
+            async with AsyncSessionLocal() as db:
+                manifest_text = await db.scalar(
+                    select(SessionModel.archive_manifest).where(
+                        SessionModel.id == session_id,
+                        SessionModel.archived_at.is_not(None)
+                    )
+                )
+                if not manifest_text:
+                    return False
+                manifest = json.loads(manifest_text)
+
+                restored = 0
+                for key in manifest["segments"]:
+                    rows = self._decode(await self.store.get(key), manifest["codec"])
+                    result = await db.execute(
+                        select(MessageModel.id).where(MessageModel.id.in_([row["id"] for row in rows]))
+                    )
+                    existing = set(result.scalars().all())
+                    rows = [dict(row, session_id=session_id) for row in rows if row["id"] not in existing]
+                    if rows:
+                        await db.execute(insert(MessageModel).values(rows))
+                        await db.commit()
+                    restored += len(rows)
+
+                await db.execute(
+                    update(SessionModel).where(SessionModel.id == session_id).values(
+                        archived_at=None, archive_manifest=None, updated_at=SessionModel.updated_at
+                    )
+                )
+                await db.commit()
+
+        await self._delete_objects(manifest["segments"])
+        history_cache.invalidate(session_id)
+        self.rehydrations += 1
+        self.messages_rehydrated += restored
+        logger.info(f"[SessionArchiver] 会话已从归档恢复: session={session_id}, 消息 {restored} 条")
+        return True
+
+    async def delete_archive(self, manifest_text: Optional[str]) -> None:
+        """删除会话时清理其归档对象"""
+        if manifest_text:
+            await self._delete_objects(json.loads(manifest_text)["segments"])
+
+    async def _delete_objects(self, keys: List[str]) -> None:
+        for key in keys:
+            try:
+                await self.store.delete(key)
+            except Exception as e:
+                logger.error(f"[SessionArchiver] 删除归档对象失败: {str(e)}")
+
+    def _lock(self, session_id: str) -> asyncio.Lock:
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        return lock
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                while await self.archive_idle() >= self.batch_sessions:
+                    await asyncio.sleep(0)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"[SessionArchiver] 归档失败: {str(e)}")
+            self.runs += 1
+            self.last_run_seconds = time.monotonic() - started
+            # 清理空闲的会话锁
+            self._locks = {key: lock for key, lock in self._locks.items() if lock.locked()}
+            await asyncio.sleep(self.interval)
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "store": type(self.store).__name__ if self.store is not None else None,
+            "codec": self.codec,
+            "idle_days": self.idle_days,
+            "runs": self.runs,
+            "last_run_seconds": round(self.last_run_seconds, 3),
+            "sessions_archived": self.sessions_archived,
+            "messages_archived": self.messages_archived,
+            "bytes_raw": self.bytes_raw,
+            "bytes_stored": self.bytes_stored,
+            "compression_ratio": round(self.bytes_raw / self.bytes_stored, 2) if self.bytes_stored else 0.0,
+            "rehydrations": self.rehydrations,
+            "messages_rehydrated": self.messages_rehydrated,
+            "failures": self.failures,
+        }
+
+
+# 创建全局会话归档实例
+session_archiver = SessionArchiver(
+    store=create_object_store(),
+    enabled=settings.ARCHIVE_ENABLED,
+    idle_days=settings.ARCHIVE_IDLE_DAYS,
+    interval=settings.ARCHIVE_INTERVAL,
+    batch_sessions=settings.ARCHIVE_BATCH_SESSIONS,
+    segment_messages=settings.ARCHIVE_SEGMENT_MESSAGES,
+    zstd_level=settings.ARCHIVE_ZSTD_LEVEL
+)
@@ -0,0 +1,151 @@
+from typing import Dict, Any, Optional, Iterable
+from collections import deque
+import asyncio
+import time
+
+from sqlalchemy import select, delete
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.db.session import AsyncSessionLocal
+from app.models.session import ChatSession as SessionModel
+from app.models.message import ChatMessage as MessageModel
+
+
+class SessionPurger:
+    """
+    大会话的后台分块清理
+
+    删除请求只把会话标记为已删除（deleted_at），立即返回；后台任务每次删除 chunk_size 条消息并提交，
+    块之间让出事件循环，避免一次删除数万行造成长事务、锁等待和内存占用。消息删完后删除会话本身。
+    清理失败（如数据库暂不可用）的会话在 retry_delay 秒后重新入队；
+    进程重启后 start 会继续清理所有已标记但未删除的会话。
+    """
+
+    def __init__(self, chunk_size: int, pause: float, retry_delay: float):
+        self.chunk_size = max(1, chunk_size)
+        self.pause = pause
+        self.retry_delay = retry_delay
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._scheduled: set = set()
+        self._retries: Dict[str, asyncio.TimerHandle] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.current: Optional[str] = None
+        self.sessions_purged = 0
+        self.messages_purged = 0
+        self.failures = 0
+        self.chunk_times: "deque[float]" = deque(maxlen=1000)
+
+    def schedule(self, session_ids: Iterable[str]) -> None:
+        """加入清理队列（会话应已标记为已删除）"""
+        for session_id in session_ids:
+            if session_id not in self._scheduled:
+                self._scheduled.add(session_id)
+                self._queue.put_nowait(session_id)
+        if self._task is None:
+            self.start()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        # 继续清理上次进程退出时尚未完成的会话
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(select(SessionModel.id).where(SessionModel.deleted_at.is_not(None)))
+                self.schedule(result.scalars().all())
+        except Exception as e:
+            logger.error(f"[SessionPurger] 读取待清理会话失败: {str(e)}")
+
+        while True:
+            session_id = await self._queue.get()
+            self.current = session_id
+            try:
+                await self.purge(session_id)
+                self._scheduled.discard(session_id)
+            except Exception as e:
+                self.failures += 1
+                logger.error(
+                    f"[SessionPurger] 清理会话失败，{self.retry_delay} 秒后重试: session={session_id}, 错误={str(e)}"
+                )
+                # 保留在 _scheduled 中，避免重试前被重复入队
+                self._retries[session_id] = asyncio.get_running_loop().call_later(
+                    self.retry_delay, self._retry, session_id
+                )
+            finally:
+                self.current = None
+
+    def _retry(self, session_id: str) -> None:
+        self._retries.pop(session_id, None)
+        self._queue.put_nowait(session_id)
+
+    async def purge(self, session_id: str) -> None:
+        """分块删除会话的消息，最后删除会话"""
+        purged = 0
+        while True:
+            started = time.monotonic()
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(MessageModel.id).where(MessageModel.session_id == session_id).limit(self.chunk_size)
+                )
+                ids = list(result.scalars().all())
+                if len(ids) < self.chunk_size:
+                    # 最后一块与会话在同一事务中删除
+                    if ids:
+                        await db.execute(delete(MessageModel).where(MessageModel.id.in_(ids)))
+                    await db.execute(delete(SessionModel).where(SessionModel.id == session_id))
+                    await db.commit()
+                    purged += len(ids)
+                    self.messages_purged += len(ids)
+                    break
+                await db.execute(delete(MessageModel).where(MessageModel.id.in_(ids)))
+                await db.commit()
+            purged += len(ids)
+            self.messages_purged += len(ids)
+            self.chunk_times.append(time.monotonic() - started)
+            await asyncio.sleep(self.pause)
+
+        self.sessions_purged += 1
+        logger.info(f"[SessionPurger] 会话已清理: session={session_id}, 消息 {purged} 条")
+
+    async def aclose(self) -> None:
+        """停止后台清理，未完成的会话在下次启动时继续"""
+        for handle in self._retries.values():
+            handle.cancel()
+        self._retries.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        times = sorted(self.chunk_times)
+
+        def percentile(p: float) -> float:
+            if not times:
+                return 0.0
+            return round(times[min(len(times) - 1, int(len(times) * p))] * 1000, 2)
+
+        return {
+            "chunk_size": self.chunk_size,
+            "queued": self._queue.qsize(),
+            "retrying": len(self._retries),
+            "current": self.current,
+            "sessions_purged": self.sessions_purged,
+            "messages_purged": self.messages_purged,
+            "failures": self.failures,
+            "chunk_ms_p50": percentile(0.5),
+            "chunk_ms_p95": percentile(0.95),
+        }
+
+
+# 创建全局会话清理实例
+session_purger = SessionPurger(
+    chunk_size=settings.SESSION_PURGE_CHUNK_SIZE,
+    pause=settings.SESSION_PURGE_PAUSE,
+    retry_delay=settings.SESSION_PURGE_RETRY_DELAY
+)
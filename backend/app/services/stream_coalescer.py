@@ -0,0 +1,116 @@
+from typing import List, Dict, Any, Optional, AsyncIterator, AsyncGenerator
+import asyncio
+import time
+
+from app.core.config import settings
+
+
+class StreamCoalescer:
+    """
+    流式分片合并
+
+    按时间窗口或字节阈值把上游的小分片合并成较大的帧再写出，减少帧数和写入次数。
+    不会引入人为延迟：距上次写出已超过时间窗口的分片立即写出（首个分片总是立即写出），
+    窗口内到达的分片先缓冲，在窗口结束或缓冲超过字节阈值时写出。
+    """
+
+    def __init__(self, window_ms: int, max_window_ms: int, max_bytes: int):
+        self.window_ms = window_ms
+        self.max_window_ms = max_window_ms
+        self.max_bytes = max_bytes
+        self.streams = 0
+        self.chunks_in = 0
+        self.frames_out = 0
+        self.bytes_out = 0
+
+    def resolve(self, window_ms: Optional[int] = None, max_bytes: Optional[int] = None) -> Dict[str, Any]:
+        """合并客户端参数与默认值，时间窗口不超过 max_window_ms"""
+        window = self.window_ms if window_ms is None else window_ms
+        size = self.max_bytes if max_bytes is None else max_bytes
+        return {
+            "window": min(max(window, 0), self.max_window_ms) / 1000,
+            "max_bytes": max(size, 1),
+        }
+
+    async def coalesce(
+        self,
+        source: AsyncIterator[str],
+        window_ms: Optional[int] = None,
+        max_bytes: Optional[int] = None
+    ) -> AsyncGenerator[str, None]:
+        """读取 source 的分片，产出合并后的文本帧"""
+        options = self.resolve(window_ms, max_bytes)
+        window, limit = options["window"], options["max_bytes"]
+        self.streams += 1
+
+        iterator = source.__aiter__()
+        buffer: List[str] = []
+        size = 0
+        last_flush = 0.0
+        pending: Optional[asyncio.Future] = None
+
+        def flush() -> str:
+            nonlocal buffer, size, last_flush
+            frame = "".join(buffer)
+            buffer, size = [], 0
+            last_flush = time.monotonic()
+            self.frames_out += 1
+            self.bytes_out += len(frame.encode("utf-8"))
+            return frame
+
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+                # 有缓冲时最多等到窗口结束，到期即写出
+                timeout = max(0.0, last_flush + window - time.monotonic()) if buffer else None
+                done, _ = await asyncio.wait([pending], timeout=timeout)
+                if not done:
+                    yield flush()
+                    continue
+
+                future, pending = pending, None
+                try:
+                    chunk = future.result()
+                except StopAsyncIteration:
+                    break
+                if not chunk:
+                    continue
+                self.chunks_in += 1
+                buffer.append(chunk)
+                size += len(chunk.encode("utf-8"))
+                if size >= limit or time.monotonic() - last_flush >= window:
+                    yield flush()
+
+            if buffer:
+                yield flush()
+        finally:
+            if pending is not None and not pending.done():
+                pending.cancel()
+                try:
+                    await pending
+                except BaseException:
+                    pass
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window_ms,
+            "max_window_ms": self.max_window_ms,
+            "max_bytes": self.max_bytes,
+            "streams": self.streams,
+            "chunks_in": self.chunks_in,
+            "frames_out": self.frames_out,
+            "bytes_out": self.bytes_out,
+            "chunks_per_frame": round(self.chunks_in / self.frames_out, 2) if self.frames_out else 0.0,
+        }
+
+
+# 创建全局 SSE 分片合并实例
+sse_coalescer = StreamCoalescer(
+    window_ms=settings.SSE_COALESCE_WINDOW_MS,
+    max_window_ms=settings.SSE_COALESCE_MAX_WINDOW_MS,
+    max_bytes=settings.SSE_COALESCE_MAX_BYTES
+)
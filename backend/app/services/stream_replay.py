@@ -0,0 +1,219 @@
+from typing import Dict, Any, Optional, Tuple, Callable, AsyncGenerator
+from collections import deque, OrderedDict
+import asyncio
+import time
+import uuid
+
+from app.core.config import settings
+from app.core.logging import logger
+
+
+class ReplayGone(Exception):
+    """要续传的流不存在、已过期或所需事件已被淘汰"""
+    pass
+
+
+class ReplayLog:
+    """单个 SSE 流已发出事件的日志，事件 ID 为 "{流 ID}:{序号}" """
+
+    def __init__(self, user_id: Any, session_id: str):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.session_id = session_id
+        # (序号, 帧数据)
+        self.events: "deque[Tuple[int, str]]" = deque()
+        self.first_seq = 0
+        self.next_seq = 0
+        self.bytes = 0
+        self.finished = False
+        self.finished_at: Optional[float] = None
+        self.followers = 0
+        # 写入日志的生成任务
+        self.producer: Optional[asyncio.Task] = None
+        # 没有客户端连接且仍在生成时的处理（取消生成）
+        self.on_abandon: Optional[Callable[[], None]] = None
+        self._abandon_timer: Optional[asyncio.TimerHandle] = None
+        self._changed = asyncio.Event()
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.id}:{seq}"
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+
+class StreamReplayBuffer:
+    """
+    SSE 流的续传缓冲
+
+    每个流的帧先写入 ReplayLog，再由响应逐帧读出；客户端断线后带 Last-Event-ID 重连即可从断点继续读取，
+    不会重新请求 LLM。流在没有客户端连接时继续生成，超过 abandon_after 秒仍无人重连才取消生成。
+    单个流最多保留 max_stream_bytes 字节（超出时淘汰最早的事件），全部流合计不超过 max_bytes
+    （超出时淘汰最早结束的流），结束后的流保留 ttl 秒。
+    """
+
+    def __init__(self, max_bytes: int, max_stream_bytes: int, ttl: float, abandon_after: float):
+        self.max_bytes = max_bytes
+        self.max_stream_bytes = max_stream_bytes
+        self.ttl = ttl
+        self.abandon_after = abandon_after
+        self._logs: "OrderedDict[str, ReplayLog]" = OrderedDict()
+        self._bytes = 0
+        self.streams = 0
+        self.resumes = 0
+        self.resume_misses = 0
+        self.events_replayed = 0
+        self.events_trimmed = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.abandoned = 0
+
+    def create(self, user_id: Any, session_id: str) -> ReplayLog:
+        self._expire()
+        log = ReplayLog(user_id, session_id)
+        self._logs[log.id] = log
+        self.streams += 1
+        return log
+
+    def append(self, log: ReplayLog, data: str) -> str:
+        """追加一帧并唤醒读取方，返回事件 ID"""
+        seq = log.next_seq
+        log.next_seq += 1
+        if log.id in self._logs:
+            size = len(data.encode("utf-8"))
+            log.events.append((seq, data))
+            log.bytes += size
+            self._bytes += size
+            while log.bytes > self.max_stream_bytes and len(log.events) > 1:
+                self._trim(log)
+            self._evict()
+        log._notify()
+        return log.event_id(seq)
+
+    def finish(self, log: ReplayLog) -> None:
+        log.finished = True
+        log.finished_at = time.monotonic()
+        self._cancel_abandon(log)
+        # 结束的流按结束时间排序，便于过期和淘汰
+        if log.id in self._logs:
+            self._logs.move_to_end(log.id)
+        log._notify()
+
+    def resume(self, last_event_id: str, user_id: Any) -> Tuple[ReplayLog, int]:
+        """解析 Last-Event-ID，返回流日志和客户端已收到的最后序号"""
+        self._expire()
+        stream_id, _, seq = last_event_id.rpartition(":")
+        log = self._logs.get(stream_id)
+        try:
+            after = int(seq)
+        except ValueError:
+            log = None
+        if log is None or str(log.user_id) != str(user_id) or after + 1 < log.first_seq or after >= log.next_seq:
+            self.resume_misses += 1
+            raise ReplayGone(f"无法续传的事件: {last_event_id}")
+        self.resumes += 1
+        return log, after
+
+    async def follow(self, log: ReplayLog, after: int = -1) -> AsyncGenerator[Tuple[str, str], None]:
+        """从 after 之后逐帧读取（事件 ID, 帧数据），直到流结束；读取落后于淘汰进度时提前结束"""
+        log.followers += 1
+        self._cancel_abandon(log)
+        replaying = after >= 0
+        seq = after + 1
+        try:
+            while True:
+                if seq < log.first_seq:
+                    logger.warning(f"[StreamReplay] 读取落后于缓冲，结束输出: stream={log.id}")
+                    return
+                index = seq - log.first_seq
+                if index < len(log.events):
+                    if replaying:
+                        self.events_replayed += 1
+                    event_seq, data = log.events[index]
+                    seq += 1
+                    yield log.event_id(event_seq), data
+                    continue
+                replaying = False
+                if log.finished:
+                    return
+                changed = log._changed
+                await changed.wait()
+        finally:
+            log.followers -= 1
+            if log.followers == 0 and not log.finished:
+                self._schedule_abandon(log)
+
+    def _schedule_abandon(self, log: ReplayLog) -> None:
+        self._cancel_abandon(log)
+        log._abandon_timer = asyncio.get_running_loop().call_later(self.abandon_after, self._abandon, log)
+
+    def _cancel_abandon(self, log: ReplayLog) -> None:
+        if log._abandon_timer is not None:
+            log._abandon_timer.cancel()
+            log._abandon_timer = None
+
+    def _abandon(self, log: ReplayLog) -> None:
+        log._abandon_timer = None
+        if log.followers == 0 and not log.finished and log.on_abandon is not None:
+            self.abandoned += 1
+            log.on_abandon()
+
+    def _trim(self, log: ReplayLog) -> None:
+        _, data = log.events.popleft()
+        size = len(data.encode("utf-8"))
+        log.bytes -= size
+        self._bytes -= size
+        log.first_seq += 1
+        self.events_trimmed += 1
+
+    def _remove(self, log: ReplayLog) -> None:
+        self._logs.pop(log.id, None)
+        self._bytes -= log.bytes
+        log.events.clear()
+        log.bytes = 0
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - self.ttl
+        for log in [log for log in self._logs.values() if log.finished and log.followers == 0 and log.finished_at < deadline]:
+            self._remove(log)
+            self.expirations += 1
+
+    def _evict(self) -> None:
+        # 只淘汰已结束且没有读取方的流，进行中的流由单流上限约束
+        while self._bytes > self.max_bytes:
+            victim = next((log for log in self._logs.values() if log.finished and log.followers == 0), None)
+            if victim is None:
+                break
+            self._remove(victim)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        self._expire()
+        return {
+            "streams_buffered": len(self._logs),
+            "in_flight": sum(1 for log in self._logs.values() if not log.finished),
+            "detached": sum(1 for log in self._logs.values() if not log.finished and log.followers == 0),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "max_stream_bytes": self.max_stream_bytes,
+            "ttl_seconds": self.ttl,
+            "abandon_after_seconds": self.abandon_after,
+            "streams": self.streams,
+            "resumes": self.resumes,
+            "resume_misses": self.resume_misses,
+            "events_replayed": self.events_replayed,
+            "events_trimmed": self.events_trimmed,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "abandoned": self.abandoned,
+        }
+
+
+# 创建全局 SSE 续传缓冲实例
+stream_replay = StreamReplayBuffer(
+    max_bytes=settings.SSE_REPLAY_MAX_BYTES,
+    max_stream_bytes=settings.SSE_REPLAY_STREAM_MAX_BYTES,
+    ttl=settings.SSE_REPLAY_TTL,
+    abandon_after=settings.SSE_RESUME_GRACE
+)
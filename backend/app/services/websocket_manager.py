@@ -0,0 +1,515 @@
+from typing import List, Dict, Any, Optional, Tuple, Callable
+from collections import deque
+import asyncio
+import json
+import sys
+import time
+import uuid
+
+from fastapi import WebSocket, status
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.services.pubsub import PubSubBackend, create_pubsub_backend
+
+
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+
+class ConnectionWriter:
+    """
+    单个 WebSocket 连接的发送队列
+
+    广播只把消息放入有界队列，由该连接独立的写任务按顺序发送，慢连接不会阻塞其他连接。
+    队列满时按溢出策略处理：drop_oldest 丢弃最早的消息；coalesce 把同一回复相邻的 delta 帧
+    合并为一帧（内容拼接，seq 取合并的最后一帧，没有可合并的帧时丢弃最早的消息）；disconnect 断开连接。
+    发送失败或超过 send_timeout 时连接视为失效，由 on_dead 回调清理。
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        session_id: str,
+        user_id: Any,
+        max_queue: int,
+        policy: str,
+        send_timeout: float,
+        on_dead: Callable[["ConnectionWriter", int, str], None]
+    ):
+        self.id = uuid.uuid4().hex[:12]
+        self.websocket = websocket
+        self.session_id = session_id
+        self.user_id = user_id
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.on_dead = on_dead
+        # (消息, 入队时间)
+        self.queue: "deque[Tuple[str, float]]" = deque()
+        # 排队消息占用的内存
+        self.queued_bytes = 0
+        self.closed = False
+        # 关闭后唤醒等待接收的连接处理协程
+        self.closed_event = asyncio.Event()
+        self.connected_at = time.monotonic()
+        # 最近一次收到客户端消息（含 pong）的时间
+        self.last_seen = self.connected_at
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.max_depth = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.latencies: "deque[float]" = deque(maxlen=200)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, message: str) -> None:
+        if self.closed:
+            return
+        if len(self.queue) >= self.max_queue and not self._make_room():
+            return
+        self.queue.append((message, time.monotonic()))
+        self.queued_bytes += sys.getsizeof(message)
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self._wakeup.set()
+
+    def _make_room(self) -> bool:
+        if self.policy == "disconnect":
+            self.fail(status.WS_1013_TRY_AGAIN_LATER, "overflow")
+            return False
+        if self.policy == "coalesce" and self._coalesce():
+            return True
+        message, _ = self.queue.popleft()
+        self.queued_bytes -= sys.getsizeof(message)
+        self.dropped += 1
+        return True
+
+    def _coalesce(self) -> bool:
+        """合并队列中同一回复相邻的 delta 帧，返回是否腾出了空间"""
+        # [消息（合并后置为 None，需重新序列化）, 入队时间, 解析后的 delta 帧]
+        merged: List[List[Any]] = []
+        count = 0
+        for message, enqueued in self.queue:
+            frame = _parse_delta(message)
+            last = merged[-1] if merged else None
+            if frame is not None and last is not None and last[2] is not None \
+                    and last[2]["message_id"] == frame["message_id"]:
+                last[2]["data"]["content"] += frame["data"]["content"]
+                last[2]["seq"] = frame["seq"]
+                last[0] = None
+                count += 1
+                continue
+            merged.append([message, enqueued, frame])
+        if not count:
+            return False
+        self.queue = deque(
+            (message if message is not None else json.dumps(frame, ensure_ascii=False), enqueued)
+            for message, enqueued, frame in merged
+        )
+        self.queued_bytes = sum(sys.getsizeof(message) for message, _ in self.queue)
+        self.coalesced += count
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            while not self.queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            message, enqueued = self.queue.popleft()
+            self.queued_bytes -= sys.getsizeof(message)
+            try:
+                await asyncio.wait_for(self.websocket.send_text(message), self.send_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[ConnectionWriter] 发送失败: session={self.session_id}, 错误={type(e).__name__} {str(e)}")
+                self.fail(status.WS_1011_INTERNAL_ERROR, "send_failed")
+                return
+            self.sent += 1
+            self.bytes_out += len(message.encode("utf-8"))
+            self.latencies.append(time.monotonic() - enqueued)
+
+    def fail(self, code: int, reason: str) -> None:
+        """关闭连接并交由 on_dead 清理，reason 为简短的原因标识"""
+        if not self.closed:
+            self.close()
+            self.on_dead(self, code, reason)
+
+    def close(self) -> None:
+        """停止写任务，丢弃未发送的消息"""
+        self.closed = True
+        self.closed_event.set()
+        self.queue.clear()
+        self.queued_bytes = 0
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+        now = time.monotonic()
+        return {
+            "id": self.id,
+            "session_id": self.session_id,
+            "user_id": self.user_id,
+            "age_seconds": round(now - self.connected_at, 1),
+            "idle_seconds": round(now - self.last_seen, 1),
+            "queue_depth": len(self.queue),
+            "queued_bytes": self.queued_bytes,
+            "max_queue_depth": self.max_depth,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "send_latency_ms_p50": percentile(0.5),
+            "send_latency_ms_p95": percentile(0.95),
+        }
+
+
+def _parse_delta(message: str) -> Optional[Dict[str, Any]]:
+    try:
+        frame = json.loads(message)
+    except ValueError:
+        return None
+    if isinstance(frame, dict) and frame.get("type") == "delta" and isinstance(frame.get("data"), dict):
+        return frame
+    return None
+
+
+class WebSocketManager:
+    """
+    WebSocket 连接管理与跨进程广播
+
+    broadcast 先直接发送给本进程的连接，再把消息按会话主题合并成批（batch_window_ms 内或满
+    batch_max_messages 条）发布到发布/订阅后端，由其他进程转发给各自的连接。每个进程只订阅本地
+    有连接的会话；消息体前缀为发布方的节点 ID，收到自己发布的批次或本地已无连接的会话时不解析消息体直接丢弃。
+    本地发送经每个连接的 ConnectionWriter 队列异步完成，失效的连接自动清理。
+
+    心跳任务每 heartbeat_interval 秒向所有连接发送 ping 帧，并关闭超过 idle_timeout 秒没有收到
+    任何客户端消息（客户端应回复 pong）或存活超过 max_lifetime 秒的连接，清理半开的 TCP 连接。
+    本进程的连接总数和每个用户的连接数分别不超过 max_connections 和 max_connections_per_user，
+    超出时握手后立即以 1013 关闭。内存按每连接固定开销 connection_overhead_bytes 加排队消息估算。
+    """
+
+    def __init__(
+        self,
+        bus: PubSubBackend,
+        channel_prefix: str,
+        batch_window_ms: int,
+        batch_max_messages: int,
+        send_queue_max: int,
+        overflow_policy: str,
+        send_timeout: float,
+        heartbeat_interval: float,
+        idle_timeout: float,
+        max_lifetime: float,
+        max_connections: int,
+        max_connections_per_user: int,
+        connection_overhead_bytes: int
+    ):
+        self.active_connections: Dict[str, Dict[WebSocket, ConnectionWriter]] = {}
+        self.bus = bus
+        self.channel_prefix = channel_prefix
+        self.batch_window = batch_window_ms / 1000
+        self.batch_max_messages = max(1, batch_max_messages)
+        if overflow_policy not in OVERFLOW_POLICIES:
+            logger.error(f"[WebSocketManager] 未知的溢出策略 {overflow_policy}，使用 drop_oldest")
+            overflow_policy = "drop_oldest"
+        self.send_queue_max = send_queue_max
+        self.overflow_policy = overflow_policy
+        self.send_timeout = send_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.max_connections = max_connections
+        self.max_connections_per_user = max_connections_per_user
+        self.connection_overhead_bytes = connection_overhead_bytes
+        self._connection_count = 0
+        self._user_connections: Dict[str, int] = {}
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.node_id = uuid.uuid4().hex.encode()
+        self._pending: Dict[str, List[str]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._started = False
+        self.batches_published = 0
+        self.messages_published = 0
+        self.publish_errors = 0
+        self.batches_received = 0
+        self.messages_enqueued = 0
+        self.skipped_own = 0
+        self.skipped_no_listener = 0
+        self.peak_connections = 0
+        self.heartbeats_sent = 0
+        self.rejected: Dict[str, int] = {}
+        self.closed_by_server: Dict[str, int] = {}
+        # 已关闭连接的收发字节数
+        self.retired_bytes_in = 0
+        self.retired_bytes_out = 0
+
+    def _topic(self, session_id: str) -> str:
+        return f"{self.channel_prefix}{session_id}"
+
+    async def start(self) -> None:
+        if not self._started:
+            self._started = True
+            await self.bus.start(self._on_bus_message)
+            self._task = asyncio.create_task(self._run())
+            if self.heartbeat_interval > 0:
+                self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def connect(self, websocket: WebSocket, session_id: str, user_id: Any) -> bool:
+        """接受连接并登记；超过连接数上限时以 1013 关闭并返回 False"""
+        # 先完成握手再关闭，客户端才能收到关闭码和原因（握手前拒绝只会得到 HTTP 403）
+        await websocket.accept()
+        await self.start()
+        user_key = str(user_id)
+        reason = None
+        if self.max_connections > 0 and self._connection_count >= self.max_connections:
+            reason = "server_full"
+        elif self.max_connections_per_user > 0 and self._user_connections.get(user_key, 0) >= self.max_connections_per_user:
+            reason = "user_limit"
+        if reason is not None:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+            logger.warning(f"[WebSocketManager] 拒绝连接: user={user_id}, session={session_id}, 原因={reason}")
+            try:
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason=reason)
+            except Exception:
+                # 连接已断开
+                pass
+            return False
+        self._connection_count += 1
+        self.peak_connections = max(self.peak_connections, self._connection_count)
+        self._user_connections[user_key] = self._user_connections.get(user_key, 0) + 1
+        if session_id not in self.active_connections:
+            self.active_connections[session_id] = {}
+            # 本进程第一个连接时订阅会话主题
+            await self.bus.subscribe(self._topic(session_id))
+        self.active_connections[session_id][websocket] = ConnectionWriter(
+            websocket,
+            session_id,
+            user_id,
+            max_queue=self.send_queue_max,
+            policy=self.overflow_policy,
+            send_timeout=self.send_timeout,
+            on_dead=self._on_dead
+        )
+        return True
+
+    async def receive(self, websocket: WebSocket, session_id: str) -> Optional[str]:
+        """接收客户端的下一条消息并刷新连接的活跃时间；连接已被服务端关闭（空闲、超时、溢出等）时返回 None"""
+        writer = self.active_connections.get(session_id, {}).get(websocket)
+        if writer is None:
+            return None
+        receiving = asyncio.ensure_future(websocket.receive_text())
+        closed = asyncio.ensure_future(writer.closed_event.wait())
+        try:
+            await asyncio.wait({receiving, closed}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closed.cancel()
+            if not receiving.done():
+                receiving.cancel()
+        if not receiving.done():
+            return None
+        # 客户端断开时抛出 WebSocketDisconnect
+        data = receiving.result()
+        writer.last_seen = time.monotonic()
+        writer.bytes_in += len(data.encode("utf-8"))
+        return data
+
+    async def disconnect(self, websocket: WebSocket, session_id: str):
+        connections = self.active_connections.get(session_id)
+        writer = connections.pop(websocket, None) if connections is not None else None
+        if writer is None:
+            return
+        writer.close()
+        self._connection_count -= 1
+        user_key = str(writer.user_id)
+        self._user_connections[user_key] -= 1
+        if not self._user_connections[user_key]:
+            del self._user_connections[user_key]
+        self.retired_bytes_in += writer.bytes_in
+        self.retired_bytes_out += writer.bytes_out
+        if not connections:
+            del self.active_connections[session_id]
+            try:
+                await self.bus.unsubscribe(self._topic(session_id))
+            except Exception as e:
+                logger.error(f"[WebSocketManager] 取消订阅失败: session={session_id}, 错误={str(e)}")
+
+    def _on_dead(self, writer: ConnectionWriter, code: int, reason: str) -> None:
+        self.closed_by_server[reason] = self.closed_by_server.get(reason, 0) + 1
+        logger.warning(f"[WebSocketManager] 关闭连接: session={writer.session_id}, 原因={reason}")
+        asyncio.create_task(self._prune(writer, code, reason))
+
+    async def _prune(self, writer: ConnectionWriter, code: int, reason: str) -> None:
+        await self.disconnect(writer.websocket, writer.session_id)
+        try:
+            await writer.websocket.close(code=code, reason=reason)
+        except Exception:
+            # 连接已断开
+            pass
+
+    async def _heartbeat(self) -> None:
+        """定时发送 ping 帧，关闭空闲或存活过久的连接"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = time.monotonic()
+            ping = json.dumps({"type": "ping", "ts": int(time.time() * 1000)})
+            for connections in list(self.active_connections.values()):
+                for writer in list(connections.values()):
+                    if self.idle_timeout > 0 and now - writer.last_seen > self.idle_timeout:
+                        writer.fail(status.WS_1001_GOING_AWAY, "idle")
+                    elif self.max_lifetime > 0 and now - writer.connected_at > self.max_lifetime:
+                        writer.fail(status.WS_1001_GOING_AWAY, "lifetime")
+                    else:
+                        writer.enqueue(ping)
+                        self.heartbeats_sent += 1
+
+    async def send(self, websocket: WebSocket, session_id: str, message: str) -> None:
+        """只发送给指定连接，经其发送队列以保证与广播消息的顺序"""
+        writer = self.active_connections.get(session_id, {}).get(websocket)
+        if writer is None:
+            await websocket.send_text(message)
+            return
+        writer.enqueue(message)
+        self.messages_enqueued += 1
+
+    async def broadcast(self, session_id: str, message: str):
+        self._send_local(session_id, [message])
+        await self.start()
+        batch = self._pending.setdefault(session_id, [])
+        batch.append(message)
+        if len(batch) == 1 or len(batch) >= self.batch_max_messages:
+            self._wakeup.set()
+
+    def _send_local(self, session_id: str, messages: List[str]) -> None:
+        for writer in list(self.active_connections.get(session_id, {}).values()):
+            for message in messages:
+                writer.enqueue(message)
+            self.messages_enqueued += len(messages)
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            # 等待批次窗口内的后续消息，某个会话攒满一批时提前发布
+            if all(len(batch) < self.batch_max_messages for batch in self._pending.values()):
+                await asyncio.sleep(self.batch_window)
+            self._wakeup.clear()
+            pending, self._pending = self._pending, {}
+            await asyncio.gather(*(self._publish(sid, batch) for sid, batch in pending.items()))
+
+    async def _publish(self, session_id: str, messages: List[str]) -> None:
+        for start in range(0, len(messages), self.batch_max_messages):
+            chunk = messages[start:start + self.batch_max_messages]
+            payload = self.node_id + b"\n" + json.dumps(chunk, ensure_ascii=False).encode("utf-8")
+            try:
+                await self.bus.publish(self._topic(session_id), payload)
+                self.batches_published += 1
+                self.messages_published += len(chunk)
+            except Exception as e:
+                self.publish_errors += 1
+                logger.error(f"[WebSocketManager] 发布消息失败: session={session_id}, 错误={str(e)}")
+
+    async def _on_bus_message(self, topic: str, payload: bytes) -> None:
+        # 先检查来源和本地连接，只有需要转发时才解析消息体
+        origin, _, body = payload.partition(b"\n")
+        if origin == self.node_id:
+            self.skipped_own += 1
+            return
+        session_id = topic[len(self.channel_prefix):]
+        if session_id not in self.active_connections:
+            self.skipped_no_listener += 1
+            return
+        self.batches_received += 1
+        try:
+            self._send_local(session_id, json.loads(body))
+        except Exception as e:
+            logger.error(f"[WebSocketManager] 转发消息失败: session={session_id}, 错误={str(e)}")
+
+    async def aclose(self) -> None:
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        if self._task is not None:
+            # 发布尚未发出的批次
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            pending, self._pending = self._pending, {}
+            await asyncio.gather(*(self._publish(sid, batch) for sid, batch in pending.items()))
+        for connections in self.active_connections.values():
+            for writer in connections.values():
+                writer.close()
+        if self._started:
+            await self.bus.aclose()
+            self._started = False
+
+    def stats(self, limit: int = 100) -> Dict[str, Any]:
+        """连接数、内存估算和广播统计，另按队列深度从高到低列出最多 limit 个连接的详情"""
+        writers = [writer for connections in self.active_connections.values() for writer in connections.values()]
+        writers.sort(key=lambda writer: len(writer.queue), reverse=True)
+        estimated = sum(self.connection_overhead_bytes + writer.queued_bytes for writer in writers)
+        return {
+            "node_id": self.node_id.decode(),
+            "sessions": len(self.active_connections),
+            "connections": len(writers),
+            "peak_connections": self.peak_connections,
+            "max_connections": self.max_connections,
+            "users": len(self._user_connections),
+            "max_user_connections": max(self._user_connections.values(), default=0),
+            "max_connections_per_user": self.max_connections_per_user,
+            "estimated_bytes": estimated,
+            "estimated_bytes_per_connection": round(estimated / len(writers)) if writers else self.connection_overhead_bytes,
+            "bytes_in": self.retired_bytes_in + sum(writer.bytes_in for writer in writers),
+            "bytes_out": self.retired_bytes_out + sum(writer.bytes_out for writer in writers),
+            "heartbeat_interval_seconds": self.heartbeat_interval,
+            "idle_timeout_seconds": self.idle_timeout,
+            "max_lifetime_seconds": self.max_lifetime,
+            "heartbeats_sent": self.heartbeats_sent,
+            "rejected": dict(self.rejected),
+            "closed_by_server": dict(self.closed_by_server),
+            "overflow_policy": self.overflow_policy,
+            "send_queue_max": self.send_queue_max,
+            "queued": sum(len(writer.queue) for writer in writers),
+            "dropped": sum(writer.dropped for writer in writers),
+            "coalesced": sum(writer.coalesced for writer in writers),
+            "bus": self.bus.stats(),
+            "batches_published": self.batches_published,
+            "messages_published": self.messages_published,
+            "messages_per_batch": round(self.messages_published / self.batches_published, 2) if self.batches_published else 0.0,
+            "publish_errors": self.publish_errors,
+            "batches_received": self.batches_received,
+            "messages_enqueued": self.messages_enqueued,
+            "skipped_own": self.skipped_own,
+            "skipped_no_listener": self.skipped_no_listener,
+            "connection_details": [writer.stats() for writer in writers[:limit]],
+        }
+
+
+# 创建全局 WebSocket 管理实例
+websocket_manager = WebSocketManager(
+    bus=create_pubsub_backend(),
+    channel_prefix=settings.PUBSUB_CHANNEL_PREFIX,
+    batch_window_ms=settings.PUBSUB_BATCH_WINDOW_MS,
+    batch_max_messages=settings.PUBSUB_BATCH_MAX_MESSAGES,
+    send_queue_max=settings.WS_SEND_QUEUE_MAX,
+    overflow_policy=settings.WS_OVERFLOW_POLICY,
+    send_timeout=settings.WS_SEND_TIMEOUT,
+    heartbeat_interval=settings.WS_HEARTBEAT_INTERVAL,
+    idle_timeout=settings.WS_IDLE_TIMEOUT,
+    max_lifetime=settings.WS_MAX_LIFETIME,
+    max_connections=settings.WS_MAX_CONNECTIONS,
+    max_connections_per_user=settings.WS_MAX_CONNECTIONS_PER_USER,
+    connection_overhead_bytes=settings.WS_CONNECTION_OVERHEAD_BYTES
+)
@@ -0,0 +1,487 @@
+"""
+聊天接口端到端基准测试
+
+在本地启动一个使用模拟 LLM 提供商和 SQLite 嵌入式数据库的后端进程，按指定并发
+压测以下接口，统计 TTFT、分片间隔、总延迟分位数、吞吐量、服务进程 RSS 和事件循环延迟：
+
+    POST /chat/chat
+    POST /chat/stream
+    POST /chat/sessions/{id}/messages
+    WS   /chat/ws/{session_id}
+
+用法（在 backend 目录下）：
+
+    python -m benchmarks.chat_bench --concurrency 20 --requests 200 --output bench.json
+    python -m benchmarks.chat_bench --output new.json --compare bench.json --threshold 0.1
+
+--compare 会把本次结果与基线比较，任一指标劣化超过阈值时以非零状态码退出。
+"""
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+import websockets
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_PREFIX = "/api/v1"
+SCENARIOS = ["chat", "stream", "messages", "ws"]
+DEFAULT_MOCK_PROFILE = "ttft_mean=0.2&ttft_stddev=0.05&tokens_per_second=60&length_mean=80&length_stddev=20"
+
+# 比较时参与回归判断的指标：(路径, 越大越差)
+COMPARE_METRICS = [
+    ("ttft_ms.p50", True),
+    ("ttft_ms.p95", True),
+    ("inter_chunk_ms.p95", True),
+    ("total_ms.p50", True),
+    ("total_ms.p95", True),
+    ("requests_per_second", False),
+    ("error_rate", True),
+    ("server_rss_mb.peak", True),
+    ("event_loop_lag_ms.lag_ms_p99", True),
+]
+
+
+class RequestResult:
+    """单次请求的计时结果"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_chunk: Optional[float] = None
+        self.chunk_times: List[float] = []
+        self.finished: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def chunk(self) -> None:
+        now = time.perf_counter()
+        if self.first_chunk is None:
+            self.first_chunk = now
+        self.chunk_times.append(now)
+
+    def finish(self) -> None:
+        self.finished = time.perf_counter()
+        if self.first_chunk is None:
+            # 非流式接口：首字节即完整响应
+            self.first_chunk = self.finished
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p90": None, "p95": None, "p99": None, "max": None}
+    values = sorted(values)
+
+    def pick(p: float) -> float:
+        return round(values[min(len(values) - 1, int(len(values) * p))], 2)
+
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 2),
+        "p50": pick(0.5),
+        "p90": pick(0.9),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(values[-1], 2),
+    }
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    """读取进程常驻内存（仅 Linux /proc）"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class BenchmarkServer:
+    """以子进程方式启动使用 SQLite 和模拟提供商的后端"""
+
+    def __init__(self, port: int, mock_profile: str, extra_env: Dict[str, str]):
+        self.port = port
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.mock_profile = mock_profile
+        self.extra_env = extra_env
+        self.workdir = tempfile.mkdtemp(prefix="chat-bench-")
+        self.db_path = os.path.join(self.workdir, "bench.db")
+        self.process: Optional[subprocess.Popen] = None
+
+    async def start(self) -> None:
+        env = {
+            **os.environ,
+            "ENVIRONMENT": "benchmark",
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{self.db_path}",
+            "MYSQL_USER": os.environ.get("MYSQL_USER", "bench"),
+            "MYSQL_PASSWORD": os.environ.get("MYSQL_PASSWORD", "bench"),
+            "MYSQL_HOST": os.environ.get("MYSQL_HOST", "localhost"),
+            "MYSQL_PORT": os.environ.get("MYSQL_PORT", "3306"),
+            "MYSQL_DB": os.environ.get("MYSQL_DB", "bench"),
+            "LLM_MOCK_PROFILE": self.mock_profile,
+            **self.extra_env,
+        }
+        self.log = open(os.path.join(self.workdir, "server.log"), "w")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env, stdout=self.log, stderr=subprocess.STDOUT
+        )
+        async with httpx.AsyncClient() as client:
+            for _ in range(150):
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"后端启动失败，日志: {self.log.name}")
+                try:
+                    response = await client.get(f"{self.base_url}{API_PREFIX}/chat/health")
+                    if response.status_code == 200:
+                        return
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError(f"后端启动超时，日志: {self.log.name}")
+
+    def rss_mb(self) -> Optional[float]:
+        return read_rss_mb(self.process.pid) if self.process else None
+
+    def promote(self, email: str) -> None:
+        """把测试用户设为管理员，以便读取 /metrics 下的服务端指标"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE users SET is_superuser = 1 WHERE email = ?", (email,))
+
+    def stop(self) -> None:
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.log.close()
+        # 删除临时数据库和服务日志；启动失败时不会走到这里，日志保留以便排查
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class ChatBenchmark:
+    """准备测试用户并按场景驱动压测"""
+
+    def __init__(
+        self,
+        base_url: str,
+        concurrency: int,
+        requests: int,
+        mock_profile: str,
+        rss_reader: Callable[[], Optional[float]],
+        promote: Optional[Callable[[str], None]] = None
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api = f"{self.base_url}{API_PREFIX}"
+        self.concurrency = concurrency
+        self.requests = requests
+        self.mock_profile = mock_profile
+        self.rss_reader = rss_reader
+        self.promote = promote
+        self.token: Optional[str] = None
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    async def setup(self, client: httpx.AsyncClient) -> None:
+        """注册测试用户并创建默认的模拟 LLM 配置"""
+        email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+        password = "bench-password"
+        response = await client.post(f"{self.api}/auth/register", json={"email": email, "password": password})
+        response.raise_for_status()
+        if self.promote:
+            self.promote(email)
+        response = await client.post(f"{self.api}/auth/login", data={"username": email, "password": password})
+        response.raise_for_status()
+        self.token = response.json()["access_token"]
+        response = await client.post(f"{self.api}/llm-config/", headers=self.headers, json={
+            "name": f"bench-mock-{uuid.uuid4().hex[:6]}",
+            "provider": "mock",
+            "model_name": "mock",
+            "api_base_url": f"mock://?{self.mock_profile}",
+            "is_default": True,
+        })
+        response.raise_for_status()
+
+    async def create_session(self, client: httpx.AsyncClient) -> str:
+        response = await client.post(f"{self.api}/chat/sessions", headers=self.headers, json={"title": "benchmark"})
+        response.raise_for_status()
+        return response.json()["id"]
+
+    async def run_chat(self, client: httpx.AsyncClient, session_id: str, index: int) -> RequestResult:
+        result = RequestResult()
+        response = await client.post(f"{self.api}/chat/chat", headers=self.headers, json={
+            "message": f"基准测试问题 {index}",
+            "session_id": session_id,
+        })
+        response.raise_for_status()
+        result.finish()
+        return result
+
+    async def run_messages(self, client: httpx.AsyncClient, session_id: str, index: int) -> RequestResult:
+        result = RequestResult()
+        response = await client.post(f"{self.api}/chat/sessions/{session_id}/messages", headers=self.headers, json={
+            "content": f"基准测试问题 {index}",
+            "role": "user",
+            "session_id": session_id,
+        })
+        response.raise_for_status()
+        result.finish()
+        return result
+
+    async def run_stream(self, client: httpx.AsyncClient, session_id: str, index: int) -> RequestResult:
+        result = RequestResult()
+        async with client.stream("POST", f"{self.api}/chat/stream", headers=self.headers, json={
+            "message": f"基准测试问题 {index}",
+            "session_id": session_id,
+        }) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:].strip())
+                if "chunk" in event:
+                    result.chunk()
+                elif "error" in event:
+                    result.error = str(event["error"])
+                elif event.get("done"):
+                    break
+        result.finish()
+        return result
+
+    async def run_ws(self, client: httpx.AsyncClient, session_id: str, index: int) -> RequestResult:
+        ws_url = self.api.replace("http", "ws", 1) + f"/chat/ws/{session_id}?token={self.token}"
+        async with websockets.connect(ws_url, max_size=None) as ws:
+            result = RequestResult()
+            await ws.send(json.dumps({"content": f"基准测试问题 {index}"}))
+            while True:
+                frame = json.loads(await ws.recv())
+                frame_type = frame.get("type")
+                if frame_type == "delta":
+                    result.chunk()
+                elif frame_type in ("message", "end"):
+                    break
+                elif frame_type == "error":
+                    result.error = str(frame.get("data"))
+                    break
+        result.finish()
+        return result
+
+    async def event_loop_lag(self, client: httpx.AsyncClient, seconds: float) -> Optional[Dict[str, Any]]:
+        """读取服务端最近 seconds 秒的事件循环延迟，无管理员权限时返回 None"""
+        response = await client.get(
+            f"{self.api}/metrics/event-loop", headers=self.headers, params={"seconds": max(seconds, 0.1)}
+        )
+        return response.json() if response.status_code == 200 else None
+
+    async def run_scenario(self, name: str) -> Dict[str, Any]:
+        runner: Callable[[httpx.AsyncClient, str, int], Awaitable[RequestResult]] = getattr(self, f"run_{name}")
+        limits = httpx.Limits(max_connections=self.concurrency * 2, max_keepalive_connections=self.concurrency * 2)
+        results: List[RequestResult] = []
+        rss_samples: List[float] = []
+        counter = iter(range(self.requests))
+
+        async with httpx.AsyncClient(timeout=httpx.Timeout(300.0), limits=limits) as client:
+            # 每个并发worker使用独立会话，避免历史相互干扰
+            sessions = [await self.create_session(client) for _ in range(self.concurrency)]
+
+            async def worker(session_id: str) -> None:
+                for index in counter:
+                    try:
+                        results.append(await runner(client, session_id, index))
+                    except Exception as e:
+                        failed = RequestResult()
+                        failed.error = f"{type(e).__name__}: {str(e)}"
+                        failed.finish()
+                        results.append(failed)
+
+            async def sample_rss() -> None:
+                while True:
+                    rss = self.rss_reader()
+                    if rss is not None:
+                        rss_samples.append(rss)
+                    await asyncio.sleep(0.25)
+
+            sampler = asyncio.create_task(sample_rss())
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(session_id) for session_id in sessions))
+            elapsed = time.perf_counter() - started
+            sampler.cancel()
+            loop_lag = await self.event_loop_lag(client, elapsed)
+
+        ok = [r for r in results if r.error is None]
+        errors = [r.error for r in results if r.error is not None]
+        inter_chunk = [
+            (later - earlier) * 1000
+            for r in ok for earlier, later in zip(r.chunk_times, r.chunk_times[1:])
+        ]
+        final_rss = self.rss_reader()
+        return {
+            "requests": len(results),
+            "errors": len(errors),
+            "error_rate": round(len(errors) / len(results), 4) if results else 0.0,
+            "error_samples": sorted(set(errors))[:5],
+            "elapsed_s": round(elapsed, 3),
+            "requests_per_second": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+            "ttft_ms": percentiles([(r.first_chunk - r.started) * 1000 for r in ok]),
+            "inter_chunk_ms": percentiles(inter_chunk),
+            "total_ms": percentiles([(r.finished - r.started) * 1000 for r in ok]),
+            "chunks_per_response": round(sum(len(r.chunk_times) for r in ok) / len(ok), 1) if ok else 0.0,
+            "server_rss_mb": {
+                "peak": max(rss_samples) if rss_samples else None,
+                "final": final_rss,
+            },
+            "event_loop_lag_ms": loop_lag,
+        }
+
+
+def _lookup(data: Dict[str, Any], path: str) -> Optional[float]:
+    for part in path.split("."):
+        if not isinstance(data, dict) or part not in data:
+            return None
+        data = data[part]
+    return data if isinstance(data, (int, float)) else None
+
+
+def compare_results(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """逐场景比较指标，返回劣化超过阈值的项"""
+    regressions = []
+    for scenario, metrics in current.get("scenarios", {}).items():
+        base_metrics = baseline.get("scenarios", {}).get(scenario)
+        if not base_metrics:
+            continue
+        for path, higher_is_worse in COMPARE_METRICS:
+            new, old = _lookup(metrics, path), _lookup(base_metrics, path)
+            if new is None or old is None:
+                continue
+            if old == 0:
+                worse = new > 0 if higher_is_worse else False
+                change = float("inf") if worse else 0.0
+            else:
+                change = (new - old) / abs(old)
+                worse = change > threshold if higher_is_worse else change < -threshold
+            if worse:
+                regressions.append({
+                    "scenario": scenario,
+                    "metric": path,
+                    "baseline": old,
+                    "current": new,
+                    "change": round(change, 4) if change != float("inf") else None,
+                })
+    return regressions
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    server: Optional[BenchmarkServer] = None
+    if args.base_url:
+        base_url = args.base_url
+        rss_reader = (lambda: read_rss_mb(args.server_pid)) if args.server_pid else (lambda: None)
+    else:
+        extra_env = dict(item.split("=", 1) for item in args.env)
+        server = BenchmarkServer(args.port or free_port(), args.mock_profile, extra_env)
+        await server.start()
+        base_url = server.base_url
+        rss_reader = server.rss_mb
+
+    try:
+        benchmark = ChatBenchmark(
+            base_url, args.concurrency, args.requests, args.mock_profile, rss_reader,
+            promote=server.promote if server else None
+        )
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            await benchmark.setup(client)
+
+        results: Dict[str, Any] = {}
+        for scenario in args.scenarios:
+            print(f"[bench] 运行场景 {scenario}: 并发={args.concurrency}, 请求数={args.requests}")
+            results[scenario] = await benchmark.run_scenario(scenario)
+            summary = results[scenario]
+            print(
+                f"[bench]   rps={summary['requests_per_second']} errors={summary['errors']} "
+                f"ttft_p50={summary['ttft_ms']['p50']}ms total_p95={summary['total_ms']['p95']}ms "
+                f"rss_peak={summary['server_rss_mb']['peak']}MB "
+                f"loop_lag_p99={(summary['event_loop_lag_ms'] or {}).get('lag_ms_p99')}ms"
+            )
+    finally:
+        if server:
+            server.stop()
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "mock_profile": args.mock_profile,
+            "base_url": base_url,
+        },
+        "scenarios": results,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="聊天接口端到端基准测试")
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), default=SCENARIOS,
+                        help=f"逗号分隔的场景列表，可选 {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=10, help="并发数")
+    parser.add_argument("--requests", type=int, default=100, help="每个场景的请求总数")
+    parser.add_argument("--mock-profile", default=DEFAULT_MOCK_PROFILE, help="模拟提供商参数（query 形式）")
+    parser.add_argument("--env", action="append", default=[], help="传给后端进程的额外环境变量 KEY=VALUE，可重复")
+    parser.add_argument("--port", type=int, default=None, help="后端监听端口，默认随机")
+    parser.add_argument("--base-url", default=None, help="压测已运行的后端而不是自行启动")
+    parser.add_argument("--server-pid", type=int, default=None, help="配合 --base-url 采样该进程的 RSS")
+    parser.add_argument("--output", default=None, help="结果 JSON 输出路径")
+    parser.add_argument("--compare", default=None, help="用于比较的基线结果 JSON")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定为回归的相对劣化阈值")
+    args = parser.parse_args(argv)
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {unknown}")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(report, baseline, args.threshold)
+        report["comparison"] = {"baseline": args.compare, "threshold": args.threshold, "regressions": regressions}
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"[bench] 结果已写入 {args.output}")
+    else:
+        print(output)
+
+    regressions = report.get("comparison", {}).get("regressions", [])
+    for item in regressions:
+        print(f"[bench] 回归: {item['scenario']}.{item['metric']} {item['baseline']} -> {item['current']}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
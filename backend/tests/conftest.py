@@ -0,0 +1,49 @@
+"""
+测试公共夹具
+
+导入应用前设置环境变量：数据库使用临时目录下的 SQLite 文件（异步引擎自动使用 aiosqlite），
+不需要 MySQL、MinIO、Redis 等外部服务。异步测试通过 anyio 的 pytest 插件运行在 asyncio 上。
+"""
+import os
+import shutil
+import tempfile
+
+import pytest
+
+_TEST_DIR = tempfile.mkdtemp(prefix="agent-platform-tests-")
+
+for _name, _value in {
+    "MYSQL_USER": "test",
+    "MYSQL_PASSWORD": "test",
+    "MYSQL_HOST": "localhost",
+    "MYSQL_PORT": "3306",
+    "MYSQL_DB": "test",
+}.items():
+    os.environ.setdefault(_name, _value)
+os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{_TEST_DIR}/test.db"
+
+from app.db.base import Base  # noqa: E402
+from app.db.session import engine, async_engine  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    Base.metadata.create_all(bind=engine)
+    yield
+    engine.dispose()
+    shutil.rmtree(_TEST_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+async def db_tables(anyio_backend):
+    """每个用例结束后清空表，并释放绑定到本用例事件循环的异步连接"""
+    yield
+    await async_engine.dispose()
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
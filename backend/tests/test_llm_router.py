@@ -0,0 +1,144 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services.llm_router import LLMRouter
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeUpstream:
+    """可配置首分片延迟和首分片前错误的上游替身，记录调用、开始时间和是否被取消"""
+
+    def __init__(self, chunks, ttft=0.0, error=None):
+        self.chunks = chunks
+        self.ttft = ttft
+        self.error = error
+        self.calls = 0
+        self.started_at = None
+        self.cancelled = False
+
+    def __call__(self):
+        return self._stream()
+
+    async def _stream(self):
+        self.calls += 1
+        self.started_at = time.monotonic()
+        try:
+            await asyncio.sleep(self.ttft)
+            if self.error is not None:
+                raise self.error
+            for chunk in self.chunks:
+                yield chunk
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+@pytest.fixture
+def router_settings(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_P95_FACTOR", 1.0)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_DELAY", 0.01)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MAX_DELAY", 5.0)
+    monkeypatch.setattr(settings, "LLM_HEDGE_DEFAULT_DELAY", 5.0)
+    monkeypatch.setattr(settings, "LLM_ROUTER_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(settings, "LLM_ROUTER_COOLDOWN", 60.0)
+
+
+def seed_ttft(router, key, ttft, samples=20):
+    for _ in range(samples):
+        router.record_success(key, ttft)
+
+
+async def collect(router, backends):
+    return [chunk async for chunk in router.stream(backends)]
+
+
+async def test_hedge_fires_after_p95_delay_and_first_token_wins(router_settings):
+    router = LLMRouter({}, hedge_enabled=True)
+    # a 的历史更快，排在首位；对冲期限为 a 的 p95 TTFT（0.05s）
+    seed_ttft(router, "a", 0.05)
+    seed_ttft(router, "b", 0.2)
+    assert router.hedge_delay("a") == pytest.approx(0.05)
+    slow = FakeUpstream(["a1", "a2"], ttft=1.0)
+    fast = FakeUpstream(["b1", "b2"], ttft=0.0)
+
+    chunks = await collect(router, [("a", slow), ("b", fast)])
+
+    assert chunks == ["b1", "b2"]
+    hedge_after = fast.started_at - slow.started_at
+    assert 0.04 <= hedge_after < 0.5
+    # 输掉竞争的请求被取消
+    assert slow.cancelled
+    assert router.health("b").hedges == 1
+    assert router.health("b").wins == 1
+    assert router.health("a").wins == 0
+
+
+async def test_primary_winning_after_hedge_cancels_the_hedge(router_settings):
+    router = LLMRouter({}, hedge_enabled=True)
+    seed_ttft(router, "a", 0.05)
+    seed_ttft(router, "b", 0.2)
+    primary = FakeUpstream(["a1"], ttft=0.1)
+    hedge = FakeUpstream(["b1"], ttft=1.0)
+
+    chunks = await collect(router, [("a", primary), ("b", hedge)])
+
+    assert chunks == ["a1"]
+    assert hedge.calls == 1
+    assert hedge.cancelled
+    assert router.health("a").wins == 1
+
+
+async def test_no_hedge_when_first_chunk_arrives_in_time(router_settings):
+    router = LLMRouter({}, hedge_enabled=True)
+    seed_ttft(router, "a", 0.2)
+    seed_ttft(router, "b", 0.3)
+    primary = FakeUpstream(["a1"], ttft=0.0)
+    other = FakeUpstream(["b1"])
+
+    assert await collect(router, [("a", primary), ("b", other)]) == ["a1"]
+    assert other.calls == 0
+
+
+async def test_error_before_first_chunk_falls_back(router_settings):
+    router = LLMRouter({}, hedge_enabled=False)
+    seed_ttft(router, "b", 0.2)
+    broken = FakeUpstream(["a1"], error=RuntimeError("上游 500"))
+    healthy = FakeUpstream(["b1", "b2"])
+
+    chunks = await collect(router, [("a", broken), ("b", healthy)])
+
+    assert chunks == ["b1", "b2"]
+    assert broken.calls == 1
+    assert router.health("a").errors == 1
+    assert router.health("b").wins == 1
+
+
+async def test_all_backends_failing_raises_last_error(router_settings):
+    router = LLMRouter({}, hedge_enabled=False)
+    first = FakeUpstream([], error=RuntimeError("a 失败"))
+    second = FakeUpstream([], error=RuntimeError("b 失败"))
+
+    with pytest.raises(RuntimeError):
+        await collect(router, [("a", first), ("b", second)])
+    assert first.calls == second.calls == 1
+
+
+async def test_circuit_opens_after_consecutive_failures(router_settings):
+    router = LLMRouter({}, hedge_enabled=False)
+    broken = FakeUpstream(["a1"], error=RuntimeError("上游 500"))
+    healthy = FakeUpstream(["b1"])
+    # 没有样本时两者得分相同，a 按传入顺序排在首位
+    for _ in range(settings.LLM_ROUTER_FAILURE_THRESHOLD):
+        assert await collect(router, [("a", broken), ("b", healthy)]) == ["b1"]
+
+    assert router.health("a").is_open()
+    assert router.rank(["a", "b"]) == ["b", "a"]
+    calls = broken.calls
+    assert await collect(router, [("a", broken), ("b", healthy)]) == ["b1"]
+    # 熔断期间不再请求 a
+    assert broken.calls == calls
+    assert router.stats()["backends"]["a"]["circuit_open"] is True
@@ -0,0 +1,44 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app.services.message_writer import MessageWriter
+
+
+class Row:
+    def __init__(self, index: int):
+        self.id = f"m{index}"
+        self.session_id = "s1"
+        self.content = f"message {index}"
+        self.role = "user"
+        self.created_at = None
+
+
+@pytest.mark.anyio
+async def test_batched_write_rejects_when_queue_full_and_flush_fails(monkeypatch):
+    writer = MessageWriter(mode="batched", batch_size=2, flush_interval=60, max_pending=3)
+
+    async def database_down(rows):
+        return False
+
+    monkeypatch.setattr(writer, "_insert", database_down)
+    monkeypatch.setattr(writer, "start", lambda: None)
+
+    for index in range(3):
+        await writer.write(Row(index))
+    with pytest.raises(RuntimeError):
+        await writer.write(Row(3))
+
+    assert len(writer._queue) == 3
+    assert [row["id"] for row in writer.pending_rows("s1")] == ["m0", "m1", "m2"]
+
+
+@pytest.mark.anyio
+async def test_sync_write_raises_integrity_error(db_tables):
+    writer = MessageWriter(mode="sync", batch_size=1, flush_interval=60, max_pending=10)
+
+    await writer.write(Row(0))
+    with pytest.raises(IntegrityError):
+        await writer.write(Row(0))
+
+    assert writer.rows_written == 1
+    assert writer.rows_dropped == 0
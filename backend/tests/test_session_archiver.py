@@ -0,0 +1,185 @@
+from datetime import datetime, timedelta
+import importlib
+import json
+import uuid
+
+import pytest
+from sqlalchemy import func, select
+
+from app.db.session import AsyncSessionLocal
+from app.models.message import ChatMessage as MessageModel
+from app.models.session import ChatSession as SessionModel
+from app.services.object_store import FilesystemObjectStore, ObjectStoreError
+from app.services.session_archiver import SessionArchiver
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FilesystemObjectStore(str(tmp_path / "objects"))
+
+
+@pytest.fixture
+def archiver(store, db_tables):
+    return SessionArchiver(
+        store=store,
+        enabled=False,
+        idle_days=30,
+        interval=3600,
+        batch_sessions=10,
+        segment_messages=2,
+        zstd_level=3
+    )
+
+
+async def create_session(message_ages_days):
+    """创建会话及若干条消息，message_ages_days 为各条消息距今的天数（从旧到新）"""
+    now = datetime.utcnow()
+    session_id = str(uuid.uuid4())
+    async with AsyncSessionLocal() as db:
+        db.add(SessionModel(
+            id=session_id, title="t", user_id=1, llm_config_id=1,
+            created_at=now - timedelta(days=90), updated_at=now - timedelta(days=min(message_ages_days))
+        ))
+        for index, age in enumerate(message_ages_days):
+            db.add(MessageModel(
+                id=f"{session_id[:8]}-{index:04d}",
+                session_id=session_id,
+                role="user" if index % 2 == 0 else "assistant",
+                content=f"消息 {index}",
+                created_at=now - timedelta(days=age)
+            ))
+        await db.commit()
+    return session_id
+
+
+async def load_session(session_id):
+    async with AsyncSessionLocal() as db:
+        session = await db.get(SessionModel, session_id)
+        messages = (await db.execute(
+            select(MessageModel.id, MessageModel.content, MessageModel.created_at)
+            .where(MessageModel.session_id == session_id)
+            .order_by(MessageModel.created_at, MessageModel.id)
+        )).all()
+        return session, messages
+
+
+def stored_objects(store):
+    return sorted(path for path in store.root.rglob("*") if path.is_file())
+
+
+async def test_archive_leaves_stub_and_rehydrate_restores_messages(archiver, store):
+    session_id = await create_session([60, 59, 58, 57, 56])
+    session_before, messages_before = await load_session(session_id)
+
+    assert await archiver.archive_session(session_id, datetime.utcnow() - timedelta(days=30))
+
+    session, messages = await load_session(session_id)
+    assert messages == []
+    assert session.archived_at is not None
+    manifest = json.loads(session.archive_manifest)
+    assert manifest["messages"] == 5
+    # 每段 2 条消息
+    assert len(manifest["segments"]) == 3
+    assert len(stored_objects(store)) == 3
+    # 归档不改变会话在列表中的顺序
+    assert session.updated_at == session_before.updated_at
+
+    assert await archiver.rehydrate(session_id)
+
+    session, messages = await load_session(session_id)
+    assert session.archived_at is None
+    assert session.archive_manifest is None
+    assert session.updated_at == session_before.updated_at
+    assert messages == messages_before
+    assert stored_objects(store) == []
+    assert archiver.stats()["messages_rehydrated"] == 5
+
+
+async def test_rehydrate_retry_does_not_duplicate_messages(archiver, store):
+    session_id = await create_session([60, 59, 58, 57, 56])
+    _, messages_before = await load_session(session_id)
+    assert await archiver.archive_session(session_id)
+    segments = json.loads((await load_session(session_id))[0].archive_manifest)["segments"]
+
+    # 第二段读取失败：第一段已写回热表，存根保留
+    original_get = store.get
+
+    async def failing_get(key):
+        if key == segments[1]:
+            raise ObjectStoreError("模拟读取失败")
+        return await original_get(key)
+
+    store.get = failing_get
+    with pytest.raises(ObjectStoreError):
+        await archiver.rehydrate(session_id)
+    session, messages = await load_session(session_id)
+    assert session.archived_at is not None
+    assert len(messages) == 2
+
+    store.get = original_get
+    assert await archiver.rehydrate(session_id)
+
+    session, messages = await load_session(session_id)
+    assert session.archived_at is None
+    assert messages == messages_before
+    async with AsyncSessionLocal() as db:
+        count = await db.scalar(select(func.count()).select_from(MessageModel))
+    assert count == 5
+
+
+async def test_archive_skips_session_with_message_after_cutoff(archiver, store):
+    # 最后一条消息在截止时间之后（位于第二段），已写入的第一段应被删除
+    session_id = await create_session([60, 59, 58, 1])
+    _, messages_before = await load_session(session_id)
+
+    assert not await archiver.archive_session(session_id, datetime.utcnow() - timedelta(days=30))
+
+    session, messages = await load_session(session_id)
+    assert session.archived_at is None
+    assert messages == messages_before
+    assert stored_objects(store) == []
+
+
+async def test_archive_idle_selects_only_idle_sessions(archiver):
+    idle_id = await create_session([60, 59])
+    active_id = await create_session([60, 1])
+
+    assert await archiver.archive_idle() == 1
+
+    assert (await load_session(idle_id))[0].archived_at is not None
+    assert (await load_session(active_id))[0].archived_at is None
+
+
+async def test_delete_archive_removes_objects(archiver, store):
+    session_id = await create_session([60, 59, 58])
+    assert await archiver.archive_session(session_id)
+    session, _ = await load_session(session_id)
+    assert len(stored_objects(store)) == 2
+
+    await archiver.delete_archive(session.archive_manifest)
+
+    assert stored_objects(store) == []
+    # 未归档的会话没有清单
+    await archiver.delete_archive(None)
+
+
+async def test_get_session_checks_owner_before_rehydrating(archiver, monkeypatch):
+    chat_service_module = importlib.import_module("app.services.chat_service")
+
+    session_id = await create_session([60, 59])
+    assert await archiver.archive_session(session_id)
+    monkeypatch.setattr(chat_service_module, "session_archiver", archiver)
+
+    async with AsyncSessionLocal() as db:
+        # 其他用户拿到会话 ID 也不能恢复归档
+        assert await chat_service_module.chat_service.get_session(db, session_id, user_id=2) is None
+    session, messages = await load_session(session_id)
+    assert session.archived_at is not None
+    assert messages == []
+
+    async with AsyncSessionLocal() as db:
+        session = await chat_service_module.chat_service.get_session(db, session_id, user_id=1)
+        assert session.archived_at is None
+    assert len((await load_session(session_id))[1]) == 2
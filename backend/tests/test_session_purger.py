@@ -0,0 +1,29 @@
+import asyncio
+
+import pytest
+
+from app.services.session_purger import SessionPurger
+
+
+@pytest.mark.anyio
+async def test_failed_purge_is_retried(db_tables, monkeypatch):
+    purger = SessionPurger(chunk_size=10, pause=0, retry_delay=0.05)
+    attempts = []
+    done = asyncio.Event()
+
+    async def purge(session_id):
+        attempts.append(session_id)
+        if len(attempts) == 1:
+            raise RuntimeError("database unavailable")
+        done.set()
+
+    monkeypatch.setattr(purger, "purge", purge)
+    try:
+        purger.schedule(["s1"])
+        await asyncio.wait_for(done.wait(), 2)
+        await asyncio.sleep(0)
+        assert attempts == ["s1", "s1"]
+        assert purger.failures == 1
+        assert "s1" not in purger._scheduled
+    finally:
+        await purger.aclose()
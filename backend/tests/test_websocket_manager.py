@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+import pytest
+
+from app.services.pubsub import InProcessBackend, InProcessBroker
+from app.services.websocket_manager import WebSocketManager
+
+pytestmark = pytest.mark.anyio
+
+PREFIX = "test:ws:"
+
+
+class FakeWebSocket:
+    """记录发出消息的 WebSocket 替身"""
+
+    def __init__(self):
+        self.sent = []
+        self.closed = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        self.sent.append(json.loads(message))
+
+    async def close(self, code=1000, reason=None):
+        self.closed = (code, reason)
+
+
+def make_manager(broker, batch_max_messages=64, batch_window_ms=5):
+    return WebSocketManager(
+        bus=InProcessBackend(broker),
+        channel_prefix=PREFIX,
+        batch_window_ms=batch_window_ms,
+        batch_max_messages=batch_max_messages,
+        send_queue_max=256,
+        overflow_policy="drop_oldest",
+        send_timeout=5,
+        heartbeat_interval=0,
+        idle_timeout=0,
+        max_lifetime=0,
+        max_connections=0,
+        max_connections_per_user=0,
+        connection_overhead_bytes=0
+    )
+
+
+async def wait_for(condition, timeout=1.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("等待超时")
+        await asyncio.sleep(0.005)
+
+
+@pytest.fixture
+async def nodes(anyio_backend):
+    """共享同一个进程内代理的两个节点"""
+    broker = InProcessBroker()
+    managers = []
+
+    def factory(**kwargs):
+        manager = make_manager(broker, **kwargs)
+        managers.append(manager)
+        return manager
+
+    yield factory
+    for manager in managers:
+        await manager.aclose()
+
+
+async def test_broadcast_reaches_connections_on_other_node(nodes):
+    node_a, node_b = nodes(), nodes()
+    local, remote = FakeWebSocket(), FakeWebSocket()
+    assert await node_a.connect(local, "s1", user_id=1)
+    assert await node_b.connect(remote, "s1", user_id=2)
+
+    await node_a.broadcast("s1", json.dumps({"n": 1}))
+    await node_a.broadcast("s1", json.dumps({"n": 2}))
+
+    await wait_for(lambda: len(remote.sent) == 2)
+    assert remote.sent == [{"n": 1}, {"n": 2}]
+    assert node_b.stats()["batches_received"] >= 1
+
+
+async def test_own_batches_are_skipped(nodes):
+    node_a = nodes()
+    local = FakeWebSocket()
+    await node_a.connect(local, "s1", user_id=1)
+
+    await node_a.broadcast("s1", json.dumps({"n": 1}))
+
+    await wait_for(lambda: node_a.stats()["skipped_own"] == 1)
+    # 本地连接只收到直接发送的一份，不会因自己发布的批次重复收到
+    await asyncio.sleep(0.02)
+    assert local.sent == [{"n": 1}]
+    assert node_a.stats()["batches_received"] == 0
+
+
+async def test_batches_for_sessions_without_local_listeners_are_skipped(nodes):
+    node_a, node_b = nodes(), nodes()
+    await node_a.connect(FakeWebSocket(), "s1", user_id=1)
+    # 节点 B 仍持有订阅但本地已无连接（如取消订阅前到达的消息）
+    await node_b.start()
+    await node_b.bus.subscribe(PREFIX + "s1")
+
+    await node_a.broadcast("s1", json.dumps({"n": 1}))
+
+    await wait_for(lambda: node_b.stats()["skipped_no_listener"] == 1)
+    assert node_b.stats()["batches_received"] == 0
+    assert node_b.stats()["messages_enqueued"] == 0
+
+
+async def test_publishes_are_batched_by_max_messages(nodes):
+    # 批次窗口很长，只有攒满 batch_max_messages 条才会立即发布
+    node_a = nodes(batch_max_messages=3, batch_window_ms=10_000)
+    node_b = nodes()
+    remote = FakeWebSocket()
+    await node_a.connect(FakeWebSocket(), "s1", user_id=1)
+    await node_b.connect(remote, "s1", user_id=2)
+
+    for n in range(7):
+        await node_a.broadcast("s1", json.dumps({"n": n}))
+
+    await wait_for(lambda: len(remote.sent) == 7)
+    assert remote.sent == [{"n": n} for n in range(7)]
+    stats = node_a.stats()
+    assert stats["messages_published"] == 7
+    assert stats["batches_published"] == 3
+
+
+async def test_last_disconnect_unsubscribes_session(nodes):
+    node_a, node_b = nodes(), nodes()
+    remote = FakeWebSocket()
+    await node_a.connect(FakeWebSocket(), "s1", user_id=1)
+    await node_b.connect(remote, "s1", user_id=2)
+
+    await node_b.disconnect(remote, "s1")
+    await node_a.broadcast("s1", json.dumps({"n": 1}))
+    await wait_for(lambda: node_a.stats()["skipped_own"] == 1)
+
+    assert remote.sent == []
+    assert node_b.stats()["skipped_no_listener"] == 0
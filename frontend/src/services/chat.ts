@@ -152,10 +152,11 @@ export const sendMessageStream = async (
         // 解码二进制数据
         const decodedChunk = decoder.decode(value, { stream: true });
         
-        // 按SSE格式分割数据
+        // 按SSE格式分割事件，每个事件只取 data 行（忽略 id 等字段）
         const lines = decodedChunk
           .split('\n\n')
-          .filter(line => line.trim().startsWith('data:'));
+          .map(event => event.split('\n').find(field => field.trim().startsWith('data:')))
+          .filter((line): line is string => line !== undefined);
         
         // 处理每一行数据
         for (const line of lines) {